@@ -0,0 +1,3 @@
+# Código compartido por las lambdas de los escenarios, publicado como Lambda Layer
+# (CommonLayer en cada template.yaml, ContentUri: ../../layers/common). En el runtime queda
+# en /opt/python, así que cada function.py lo importa como `lambda_common.<módulo>`.
@@ -0,0 +1,14 @@
+import os
+from botocore.config import Config  # type: ignore
+
+# Config del cliente: pool, keep-alive, timeouts y reintentos adaptativos (override por env)
+BOTO_CONFIG = Config(
+    max_pool_connections=int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "16")),
+    tcp_keepalive=os.environ.get("AWS_TCP_KEEPALIVE", "true").lower() in ("1", "true", "yes"),
+    connect_timeout=float(os.environ.get("AWS_CONNECT_TIMEOUT", "2")),
+    read_timeout=float(os.environ.get("AWS_READ_TIMEOUT", "10")),
+    retries={
+        "mode": os.environ.get("AWS_RETRY_MODE", "adaptive"),
+        "max_attempts": int(os.environ.get("AWS_MAX_ATTEMPTS", "4")),
+    },
+)
@@ -0,0 +1,21 @@
+import os
+import threading
+import time
+
+# IDs ULID (48 bits de ms + 80 aleatorios, base32 de Crockford), monótonos dentro del contenedor:
+# ordenan por tiempo (keys listables por rango) y no chocan entre records del mismo ms
+ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ulid_lock = threading.Lock()
+_ulid_state = [-1, 0]  # [último ms, última parte aleatoria]
+
+
+def new_id():
+    ms = int(time.time() * 1000)
+    with _ulid_lock:
+        if ms > _ulid_state[0]:
+            _ulid_state[:] = [ms, int.from_bytes(os.urandom(10), "big") >> 1]
+        else:
+            _ulid_state[1] += 1
+        ms, rand = _ulid_state
+    n = (ms << 80) | rand
+    return "".join(ULID_ALPHABET[(n >> (5 * i)) & 31] for i in range(25, -1, -1))
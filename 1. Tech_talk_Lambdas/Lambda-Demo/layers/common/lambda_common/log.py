@@ -0,0 +1,72 @@
+import functools
+import logging
+import os
+import random
+import sys
+from logging.handlers import MemoryHandler
+
+# LOG_LEVEL filtra antes de formatear (los args con %s sólo se formatean si la línea sale),
+# los mensajes largos se recortan a LOG_MAX_CHARS, las líneas por record (extra=SAMPLED)
+# salen en proporción LOG_SAMPLE_RATE y todo se escribe junto al final de la invocación.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_MAX_CHARS = int(os.environ.get("LOG_MAX_CHARS", "1024"))
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1"))
+SAMPLED = {"sampled": True}
+
+_loggers = []  # los de get_logger: flush_logs los vacía a todos
+
+
+class TruncatingFormatter(logging.Formatter):
+    def format(self, record):
+        msg = super().format(record)
+        if len(msg) > LOG_MAX_CHARS:
+            msg = f"{msg[:LOG_MAX_CHARS]}…(+{len(msg) - LOG_MAX_CHARS})"
+        return msg
+
+
+class InvocationBuffer(MemoryHandler):
+    """Junta las líneas de la invocación y las escribe con un solo write (o antes si llega un ERROR)."""
+
+    def flush(self):
+        with self.lock:
+            if self.buffer and self.target:
+                stream = self.target.stream
+                stream.write("".join(self.target.format(r) + "\n" for r in self.buffer))
+                stream.flush()
+                self.buffer.clear()
+
+
+def _sample(record):
+    return not getattr(record, "sampled", False) or random.random() < LOG_SAMPLE_RATE
+
+
+def get_logger(name, fmt="[%(levelname)s] %(message)s", truncate=True):
+    """Logger propio (sin propagar al root del runtime) para que el buffer aplique también en Lambda.
+
+    flush_logs vacía los buffers en el orden en que se crearon los loggers.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    if not logger.handlers:
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(TruncatingFormatter(fmt) if truncate else logging.Formatter(fmt))
+        log_buffer = InvocationBuffer(capacity=1000, flushLevel=logging.ERROR, target=stream_handler)
+        log_buffer.addFilter(_sample)
+        logger.addHandler(log_buffer)
+    if logger not in _loggers:
+        _loggers.append(logger)
+    return logger
+
+
+def flush_logs(fn):
+    @functools.wraps(fn)
+    def wrapper(event, context):
+        try:
+            return fn(event, context)
+        finally:
+            for logger in _loggers:
+                for h in logger.handlers:
+                    h.flush()
+
+    return wrapper
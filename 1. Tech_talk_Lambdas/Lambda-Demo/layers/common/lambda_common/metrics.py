@@ -0,0 +1,133 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from lambda_common.log import get_logger
+
+# Métricas EMF (CloudWatch Embedded Metric Format) agregadas por invocación:
+# se acumulan en memoria y salen en un único documento JSON al terminar el handler
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "TechTalks/Demo")
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_MAX_VALUES = 100  # límite de EMF por métrica
+
+_emf = None  # logger del documento EMF (ver _emf_logger)
+
+
+def _emf_logger():
+    """El EMF sale por el mismo buffer que los logs (flush_logs), sin recortar y con cualquier LOG_LEVEL.
+
+    Se crea en la primera invocación, después de los loggers de la función: flush_logs lo vacía último.
+    """
+    global _emf
+    if _emf is None:
+        _emf = get_logger("lambda_common.emf", fmt="%(message)s", truncate=False)
+        _emf.setLevel(logging.INFO)
+    return _emf
+
+
+class InvocationMetrics:
+    def __init__(self, component):
+        self.component = component
+        self.sums, self.values, self.units = {}, {}, {}
+        self.lock = threading.Lock()
+        self.overhead = 0.0
+
+    def add(self, name, n=1, unit="Count"):
+        t0 = time.perf_counter()
+        with self.lock:
+            self.sums[name] = self.sums.get(name, 0) + n
+            self.units[name] = unit
+            self.overhead += time.perf_counter() - t0
+
+    def observe(self, name, value, unit="Milliseconds"):
+        t0 = time.perf_counter()
+        with self.lock:
+            self.values.setdefault(name, []).append(value)
+            self.units[name] = unit
+            self.overhead += time.perf_counter() - t0
+
+    def emf(self):
+        doc = {"component": self.component, **self.sums}
+        for name, vals in self.values.items():
+            if len(vals) > METRICS_MAX_VALUES:
+                # cuantiles equiespaciados: mismos percentiles con un documento acotado
+                s = sorted(vals)
+                vals = [s[int((i + 0.5) * len(s) / METRICS_MAX_VALUES)] for i in range(METRICS_MAX_VALUES)]
+            doc[name] = [round(v, 3) for v in vals]
+        doc["metrics_overhead_ms"] = round(self.overhead * 1000, 3)
+        names = [*self.sums, *self.values]
+        doc["_aws"] = {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["component"]],
+                    "Metrics": [{"Name": n, "Unit": self.units[n]} for n in names]
+                    + [{"Name": "metrics_overhead_ms", "Unit": "Milliseconds"}],
+                }
+            ],
+        }
+        return doc
+
+
+_current = InvocationMetrics("-")  # se reemplaza en cada invocación (@measured)
+
+
+def current():
+    """Métricas de la invocación en curso (las de fuera de un handler van a un acumulador descartable)."""
+    return _current
+
+
+def _aws_before_call(context=None, **kw):
+    if context is not None:
+        context["metrics_t0"] = time.perf_counter()
+
+
+def _aws_after_call(http_response=None, parsed=None, context=None, event_name="", **kw):
+    # latencia, errores y reintentos por servicio ("after-call.s3.PutObject" -> s3_ms, s3_errors...)
+    t0 = (context or {}).get("metrics_t0")
+    svc = event_name.split(".")[1].lower().replace("-", "_")
+    if t0 is not None:
+        _current.observe(f"{svc}_ms", (time.perf_counter() - t0) * 1000)
+    retries = (parsed or {}).get("ResponseMetadata", {}).get("RetryAttempts")
+    if retries:
+        _current.add(f"{svc}_retries", retries)
+    status = getattr(http_response, "status_code", 200)
+    # 404 no cuenta (igual que Dashboard/src/utils/metrics.py): un HEAD/GET sin objeto es un "miss" esperado
+    if status >= 400 and status != 404:
+        _current.add(f"{svc}_errors")
+
+
+def _aws_after_call_error(event_name="", **kw):
+    _current.add(f"{event_name.split('.')[1].lower().replace('-', '_')}_errors")
+
+
+def instrument(client):
+    client.meta.events.register("before-call", _aws_before_call)
+    client.meta.events.register("after-call", _aws_after_call)
+    client.meta.events.register("after-call-error", _aws_after_call_error)
+    return client
+
+
+def measured(component):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(event, context):
+            global _current
+            m = _current = InvocationMetrics(component)
+            t0 = time.perf_counter()
+            try:
+                return fn(event, context)
+            except Exception:
+                m.add("handler_errors")
+                raise
+            finally:
+                m.observe("handler_ms", (time.perf_counter() - t0) * 1000)
+                if METRICS_ENABLED:
+                    _emf_logger().info(json.dumps(m.emf()))
+
+        return wrapper
+
+    return decorator
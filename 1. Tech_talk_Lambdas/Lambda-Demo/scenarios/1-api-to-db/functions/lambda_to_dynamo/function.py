@@ -1,34 +1,155 @@
 import os
 import json
-import uuid
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 import boto3 # type: ignore
-import logging
+import botocore  # type: ignore
+from lambda_common import metrics
+from lambda_common.aws import BOTO_CONFIG
+from lambda_common.ids import new_id
+from lambda_common.log import flush_logs, get_logger
 
-# Logger estandarizado
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter("[%(levelname)s] %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+logger = get_logger("LambdaToDynamo")
 
-dynamodb = boto3.client("dynamodb", endpoint_url=os.environ.get("AWS_ENDPOINT_URL"))
 
+# cliente creado una sola vez por contenedor (fuera del handler)
+dynamodb = metrics.instrument(
+    boto3.client("dynamodb", endpoint_url=os.environ.get("AWS_ENDPOINT_URL"), config=BOTO_CONFIG)
+)
 
+
+# BatchWriteItem acepta hasta 25 ítems por llamada
+BATCH_WRITE_SIZE = 25
+BULK_CONCURRENCY = int(os.environ.get("BULK_CONCURRENCY", "4"))
+BULK_MAX_RETRIES = int(os.environ.get("BULK_MAX_RETRIES", "5"))
+BULK_BACKOFF_BASE_MS = int(os.environ.get("BULK_BACKOFF_BASE_MS", "50"))
+BULK_BACKOFF_MAX_MS = int(os.environ.get("BULK_BACKOFF_MAX_MS", "2000"))
+_pool = None
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=BULK_CONCURRENCY)
+    return _pool
+
+
+def parse_bulk_body(body):
+    """Si el body es un array JSON o NDJSON devuelve la lista de entradas crudas, si no None.
+
+    Las líneas NDJSON se devuelven como texto: cada una se valida por separado.
+    """
+    text = body.strip() if isinstance(body, str) else body
+    if isinstance(text, list):
+        return text
+    if not isinstance(text, str):
+        return None
+    if text.startswith("["):
+        return json.loads(text)
+    # primero el body entero: un objeto JSON con saltos de línea no es NDJSON
+    try:
+        json.loads(text)
+        return None
+    except ValueError:
+        pass
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) > 1:
+        return lines
+    return None
+
+
+def _backoff(attempt):
+    # exponencial con "full jitter"
+    cap = min(BULK_BACKOFF_MAX_MS, BULK_BACKOFF_BASE_MS * (2**attempt))
+    time.sleep(random.uniform(0, cap) / 1000.0)
+
+
+def _write_chunk(table_name, chunk):
+    """chunk: [(record_id, item)] -> (ids escritos, [{id, error}], llamadas)."""
+    pending = {rid: {"PutRequest": {"Item": item}} for rid, item in chunk}
+    calls = 0
+    for attempt in range(BULK_MAX_RETRIES + 1):
+        if attempt:
+            _backoff(attempt)
+        calls += 1
+        try:
+            res = dynamodb.batch_write_item(RequestItems={table_name: list(pending.values())})
+        except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError) as ex:
+            # BotoCoreError (timeout, conexión, ParamValidationError) no trae response: falla sólo este chunk
+            if isinstance(ex, botocore.exceptions.ClientError):
+                error_message = ex.response["Error"]["Message"]
+            else:
+                error_message = str(ex)
+            return [rid for rid, _ in chunk if rid not in pending], [
+                {"id": rid, "error": error_message} for rid in pending
+            ], calls
+        unprocessed = res.get("UnprocessedItems", {}).get(table_name, [])
+        left = {r["PutRequest"]["Item"]["id"]["S"] for r in unprocessed}
+        pending = {rid: req for rid, req in pending.items() if rid in left}
+        if not pending:
+            break
+    written = [rid for rid, _ in chunk if rid not in pending]
+    failed = [{"id": rid, "error": "UnprocessedItems tras reintentos"} for rid in pending]
+    return written, failed, calls
+
+
+def bulk_write(table_name, raw_entries):
+    """Escribe las entradas válidas con BatchWriteItem de a 25 (chunks en paralelo)."""
+    items, written, failed = [], [], []
+    for index, raw in enumerate(raw_entries):
+        try:
+            payload = json.loads(raw) if isinstance(raw, str) else raw
+            record_id = new_id()
+            items.append((record_id, {"id": {"S": record_id}, "data": {"S": json.dumps(payload)}}))
+        except (ValueError, TypeError) as ex:
+            failed.append({"index": index, "error": str(ex)})
+
+    chunks = [items[i : i + BATCH_WRITE_SIZE] for i in range(0, len(items), BATCH_WRITE_SIZE)]
+    calls = 0
+    for ok, ko, n in _executor().map(lambda c: _write_chunk(table_name, c), chunks):
+        written.extend(ok)
+        failed.extend(ko)
+        calls += n
+    return {"written": written, "failed": failed, "dynamoCalls": calls}
+
+
+@flush_logs
+@metrics.measured("LambdaToDynamo")
 def lambda_handler(event, context):
     table_name = os.environ["TABLE_NAME"]
     body = event.get("body", "{}")
-    correlation_id = str(uuid.uuid4())
+    correlation_id = new_id()
+    m = metrics.current()
 
     logger.info(f"[LambdaToDynamo] 🔑 Correlation ID: {correlation_id}")
 
     try:
         logger.info("[LambdaToDynamo] ✅ Lambda invocada vía HTTP URL")
+
+        # modo bulk: array JSON o NDJSON -> BatchWriteItem de a 25
+        raw_entries = parse_bulk_body(body)
+        if raw_entries is not None:
+            summary = bulk_write(table_name, raw_entries)
+            m.add("batch_size", len(raw_entries))
+            m.add("records_ok", len(summary["written"]))
+            m.add("records_failed", len(summary["failed"]))
+            logger.info(
+                f"[LambdaToDynamo] 💾 Bulk: {len(summary['written'])} guardados, "
+                f"{len(summary['failed'])} fallidos, {summary['dynamoCalls']} llamadas a DynamoDB"
+            )
+            return {
+                "statusCode": 200 if not summary["failed"] else 207,
+                "headers": {"Content-Type": "application/json"},
+                "body": json.dumps(
+                    {"message": "Registros guardados en DynamoDB", "correlation_id": correlation_id, **summary}
+                ),
+            }
+
         payload = json.loads(body)
 
-        record_id = str(uuid.uuid4())
-        logger.info(f"[LambdaToDynamo] 📥 Payload recibido: {json.dumps(payload)}")
+        record_id = new_id()
+        logger.debug("[LambdaToDynamo] 📥 Payload recibido: %s", payload)
 
         # Armado del item para DynamoDB
         item = {"id": {"S": record_id}, "data": {"S": json.dumps(payload)}}
@@ -0,0 +1,5 @@
+"""En Lambda `lambda_common` llega por el layer (/opt/python); en los tests, desde el repo."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "..", "layers", "common"))
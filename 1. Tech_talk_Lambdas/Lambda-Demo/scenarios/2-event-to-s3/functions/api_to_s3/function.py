@@ -1,48 +1,120 @@
+import base64
+import gzip
+import io
 import os
 import json
-import uuid
 import boto3  # type: ignore
-import logging
+from boto3.s3.transfer import TransferConfig  # type: ignore
+from lambda_common import metrics
+from lambda_common.aws import BOTO_CONFIG
+from lambda_common.ids import new_id
+from lambda_common.log import flush_logs, get_logger
 
-# Logger configurado como el resto de las lambdas
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter("[%(levelname)s] %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+logger = get_logger("ApiToS3")
 
-s3 = boto3.client("s3", endpoint_url=os.environ.get("AWS_ENDPOINT_URL"))
 
+# cliente creado una sola vez por contenedor (fuera del handler)
+s3 = metrics.instrument(
+    boto3.client("s3", endpoint_url=os.environ.get("AWS_ENDPOINT_URL"), config=BOTO_CONFIG)
+)
 
+
+# "parse": json.loads + json.dumps (como siempre) | "passthrough": el body se sube tal cual
+UPLOAD_MODE = os.environ.get("UPLOAD_MODE", "parse").lower()
+# "full": json.loads del body | "light": sólo chequea que parezca un objeto/array JSON
+VALIDATION = os.environ.get("VALIDATION", "full").lower()
+COMPRESSION = os.environ.get("COMPRESSION", "none").lower()  # "gzip" | "none"
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+MULTIPART_THRESHOLD = int(os.environ.get("MULTIPART_THRESHOLD_BYTES", str(8 * 1024 * 1024)))
+MULTIPART_CHUNK = int(os.environ.get("MULTIPART_CHUNK_BYTES", str(8 * 1024 * 1024)))
+MULTIPART_CONCURRENCY = int(os.environ.get("MULTIPART_CONCURRENCY", "8"))
+# vida de la URL prefirmada; EventCompactor no borra el original antes de que venza
+PRESIGN_EXPIRES_S = int(os.environ.get("PRESIGN_EXPIRES_S", "3600"))
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNK,
+    max_concurrency=MULTIPART_CONCURRENCY,
+)
+
+
+def body_bytes(event):
+    """Body crudo en bytes (decodifica base64 si API Gateway lo mandó así), sin re-serializar."""
+    body = event.get("body") or "{}"
+    if event.get("isBase64Encoded"):
+        return base64.b64decode(body)
+    return body.encode("utf-8") if isinstance(body, str) else body
+
+
+def light_validate(raw):
+    """Validación barata: sin parsear, sólo que empiece/termine como objeto o array JSON."""
+    stripped = raw.strip()
+    if not stripped or (stripped[:1], stripped[-1:]) not in ((b"{", b"}"), (b"[", b"]")):
+        raise ValueError("El body no es un objeto/array JSON")
+
+
+def upload_passthrough(bucket_name, object_key, raw):
+    """Sube el body tal cual (gzip opcional). Sobre el umbral, multipart con partes concurrentes."""
+    extra = {"ContentType": "application/json"}
+    if COMPRESSION == "gzip":
+        raw = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+        extra["ContentEncoding"] = "gzip"
+
+    if len(raw) < MULTIPART_THRESHOLD:
+        s3.put_object(Bucket=bucket_name, Key=object_key, Body=raw, **extra)
+        return len(raw), False
+    s3.upload_fileobj(io.BytesIO(raw), bucket_name, object_key, ExtraArgs=extra, Config=TRANSFER_CONFIG)
+    return len(raw), True
+
+
+@flush_logs
+@metrics.measured("ApiToS3")
 def lambda_handler(event, context):
     bucket_name = os.environ["BUCKET_NAME"]
     body = event.get("body", "{}")
-    correlation_id = str(uuid.uuid4())
+    correlation_id = new_id()
+    m = metrics.current()
 
     logger.info(f"[ApiToS3] 🔑 Correlation ID: {correlation_id}")
     try:
         logger.info("[ApiToS3] ✅ Lambda ApiToS3FunctionApi invocada.")
-        payload = json.loads(body)
-        object_key = f"event-{uuid.uuid4()}.json"
+        object_key = f"event-{new_id()}.json"
 
-        logger.info(f"[ApiToS3] 📥 Payload recibido: {json.dumps(payload)}")
-        logger.info(
-            f"[ApiToS3] 💾 Guardando en bucket '{bucket_name}' con key '{object_key}'"
-        )
+        if UPLOAD_MODE == "passthrough":
+            raw = body_bytes(event)
+            if VALIDATION == "light":
+                light_validate(raw)
+            else:
+                json.loads(raw)
+            logger.info(
+                f"[ApiToS3] 💾 Guardando {len(raw)} bytes en bucket '{bucket_name}' con key '{object_key}'"
+            )
+            stored, multipart = upload_passthrough(bucket_name, object_key, raw)
+            m.observe("body_bytes", len(raw), unit="Bytes")
+            m.observe("stored_bytes", stored, unit="Bytes")
+            m.add("multipart_uploads", int(multipart))
+            logger.info(
+                f"[ApiToS3] 📦 Subidos {stored} bytes (compresión={COMPRESSION}, multipart={multipart})"
+            )
+        else:
+            payload = json.loads(body)
 
-        s3.put_object(
-            Bucket=bucket_name,
-            Key=object_key,
-            Body=json.dumps(payload),
-            ContentType="application/json",
-        )
+            logger.debug("[ApiToS3] 📥 Payload recibido: %s", payload)
+            logger.info(
+                f"[ApiToS3] 💾 Guardando en bucket '{bucket_name}' con key '{object_key}'"
+            )
+
+            s3.put_object(
+                Bucket=bucket_name,
+                Key=object_key,
+                Body=json.dumps(payload),
+                ContentType="application/json",
+            )
 
         publicUri = s3.generate_presigned_url(
             ClientMethod="get_object",
             Params={"Bucket": bucket_name, "Key": object_key},
-            ExpiresIn=3600,
+            ExpiresIn=PRESIGN_EXPIRES_S,
         )
 
         logger.info("[ApiToS3] ✅ Archivo guardado correctamente en S3")
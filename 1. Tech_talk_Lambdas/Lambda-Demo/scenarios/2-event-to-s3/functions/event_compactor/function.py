@@ -0,0 +1,238 @@
+import gzip
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import boto3  # type: ignore
+from lambda_common.aws import BOTO_CONFIG
+from lambda_common.log import flush_logs, get_logger
+
+logger = get_logger("EventCompactor")
+
+
+# cliente creado una sola vez por contenedor (fuera del handler)
+s3 = boto3.client("s3", endpoint_url=os.environ.get("AWS_ENDPOINT_URL"), config=BOTO_CONFIG)
+
+SOURCE_PREFIX = "event-"  # lo que escribe api_to_s3
+COMPACTED_PREFIX = os.environ.get("COMPACTED_PREFIX", "compacted/events/")
+MANIFESTS_PREFIX = COMPACTED_PREFIX + "_manifests/"
+CHECKPOINT_KEY = COMPACTED_PREFIX + "_checkpoint.json"
+# la respuesta de api_to_s3 trae una URL prefirmada al event-*.json: no se borra hasta que venza
+PRESIGN_EXPIRES_S = int(os.environ.get("PRESIGN_EXPIRES_S", "3600"))
+# un evento recién escrito se deja para la próxima corrida (nunca menos que PRESIGN_EXPIRES_S)
+MIN_AGE_S = max(int(os.environ.get("COMPACT_MIN_AGE_S", "60")), PRESIGN_EXPIRES_S)
+# tope de eventos por corrida, para no pasarse del timeout
+MAX_EVENTS = int(os.environ.get("COMPACT_MAX_EVENTS", "20000"))
+READ_CONCURRENCY = int(os.environ.get("COMPACT_READ_CONCURRENCY", "16"))
+
+
+def _get_json(bucket, key, default):
+    try:
+        return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+    except s3.exceptions.NoSuchKey:
+        return default
+
+
+def _put_json(bucket, key, obj):
+    s3.put_object(
+        Bucket=bucket, Key=key, Body=json.dumps(obj).encode("utf-8"), ContentType="application/json"
+    )
+
+
+def _delete(bucket, keys):
+    for i in range(0, len(keys), 1000):
+        chunk = keys[i : i + 1000]
+        s3.delete_objects(
+            Bucket=bucket, Delete={"Objects": [{"Key": k} for k in chunk], "Quiet": True}
+        )
+
+
+def _partition(ms):
+    d = datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+    return d.strftime("dt=%Y-%m-%d"), d.strftime("hour=%H")
+
+
+def _read_event(bucket, key):
+    """("event", body) del evento; api_to_s3 puede haberlo guardado con Content-Encoding: gzip.
+
+    Con UPLOAD_MODE=passthrough y VALIDATION=light puede haber bodies que no son JSON:
+    se devuelven como ("raw", texto) para copiarlos tal cual en vez de trabar el plan.
+    Si la key ya no existe devuelve None.
+    """
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=key)
+    except s3.exceptions.NoSuchKey:
+        return None
+    raw = obj["Body"].read()
+    if obj.get("ContentEncoding") == "gzip" or raw[:2] == b"\x1f\x8b":
+        try:
+            raw = gzip.decompress(raw)
+        except (OSError, EOFError):
+            pass
+    try:
+        return "event", json.loads(raw)
+    except ValueError:
+        return "raw", raw.decode("utf-8", errors="replace")
+
+
+def list_pending(bucket, cutoff_ms, limit=MAX_EVENTS):
+    """[(key, last_modified_ms)] de los event-*.json sueltos más viejos que cutoff (paginado)."""
+    out = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=SOURCE_PREFIX):
+        for o in page.get("Contents", []):
+            ms = int(o["LastModified"].timestamp() * 1000)
+            if ms <= cutoff_ms:
+                out.append((o["Key"], ms))
+                if len(out) >= limit:
+                    return out
+    return out
+
+
+def _plan(pending):
+    """{ "dt=.../hour=..": [(key, ms)] } ordenado por tiempo dentro de cada hora."""
+    parts = {}
+    for key, ms in sorted(pending, key=lambda x: (x[1], x[0])):
+        dt, hour = _partition(ms)
+        parts.setdefault(f"{dt}/{hour}", []).append((key, ms))
+    return parts
+
+
+def _write_part(bucket, part, run_id, events, pool):
+    """NDJSON.gz con una línea {key, ts, event} por evento ({key, ts, raw} si el body no era
+    JSON). La key depende sólo del run_id, así que repetir la corrida pisa el mismo archivo
+    en vez de duplicar. Los eventos que ya no existen se saltean; sin ninguno devuelve None."""
+    keys = [k for k, _ in events]
+    read = list(pool.map(lambda k: _read_event(bucket, k), keys))
+    gone = sum(b is None for b in read)
+    if gone:
+        logger.warning(f"[EventCompactor] ⚠️ {gone} eventos del plan ya no existen en {part}")
+    events, bodies = [e for e, b in zip(events, read) if b is not None], [b for b in read if b is not None]
+    if not events:
+        return None
+    raw_count = 0
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb") as gz:
+        for (key, ms), (field, body) in zip(events, bodies):
+            raw_count += field == "raw"
+            gz.write((json.dumps({"key": key, "ts": ms, field: body}) + "\n").encode("utf-8"))
+    if raw_count:
+        logger.warning(f"[EventCompactor] ⚠️ {raw_count} eventos no-JSON copiados como raw en {part}")
+    part_key = f"{COMPACTED_PREFIX}{part}/part-{run_id}.ndjson.gz"
+    data = buf.getvalue()
+    s3.put_object(
+        Bucket=bucket,
+        Key=part_key,
+        Body=data,
+        ContentType="application/x-ndjson",
+        ContentEncoding="gzip",
+    )
+    return {
+        "key": part_key,
+        "hour": part.split("/")[1][len("hour=") :],
+        "events": len(events),
+        "raw": raw_count,
+        "bytes": len(data),
+        "minTs": events[0][1],
+        "maxTs": events[-1][1],
+    }
+
+
+def _update_manifests(bucket, written):
+    """Un manifiesto por día con sus partes. Se mergea por key de parte: idempotente."""
+    by_day = {}
+    for p in written:
+        by_day.setdefault(p["key"][len(COMPACTED_PREFIX) :].split("/")[0], []).append(p)
+    for dt, parts in by_day.items():
+        key = f"{MANIFESTS_PREFIX}{dt}.json"
+        manifest = _get_json(bucket, key, {"partition": dt, "parts": []})
+        merged = {p["key"]: p for p in manifest["parts"]}
+        merged.update({p["key"]: p for p in parts})
+        manifest["parts"] = sorted(merged.values(), key=lambda p: (p["hour"], p["key"]))
+        manifest["events"] = sum(p["events"] for p in manifest["parts"])
+        _put_json(bucket, key, manifest)
+
+
+def compact(bucket=None, now_ms=None, min_age_s=None):
+    bucket = bucket or os.environ["BUCKET_NAME"]
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    min_age_s = MIN_AGE_S if min_age_s is None else max(min_age_s, PRESIGN_EXPIRES_S)
+
+    ckpt = _get_json(bucket, CHECKPOINT_KEY, {"runs": 0, "events": 0, "pending_delete": [], "plan": None})
+
+    # una corrida anterior que murió después de commitear: terminar sus borrados primero
+    if ckpt.get("pending_delete"):
+        _delete(bucket, ckpt["pending_delete"])
+        ckpt["pending_delete"] = []
+        _put_json(bucket, CHECKPOINT_KEY, ckpt)
+
+    plan = ckpt.get("plan")
+    if plan:
+        # murió a mitad de camino: se repite el mismo plan con el mismo run_id
+        logger.info(f"[EventCompactor] 🔁 Retomando corrida {plan['run_id']}")
+        run_id = plan["run_id"]
+        parts = {p: [tuple(e) for e in evs] for p, evs in plan["parts"].items()}
+    else:
+        pending = list_pending(bucket, now_ms - min_age_s * 1000)
+        if not pending:
+            logger.info(f"[EventCompactor] 💤 Nada para compactar (corridas: {ckpt['runs']})")
+            return {"events": 0, "parts": []}
+        run_id = f"{now_ms}-{ckpt['runs'] + 1:06d}"
+        parts = _plan(pending)
+        # el plan se persiste antes de escribir: repetir la corrida produce las mismas partes
+        ckpt["plan"] = {"run_id": run_id, "parts": parts}
+        _put_json(bucket, CHECKPOINT_KEY, ckpt)
+
+    with ThreadPoolExecutor(max_workers=READ_CONCURRENCY) as pool:
+        written = [_write_part(bucket, part, run_id, evs, pool) for part, evs in sorted(parts.items())]
+    # un plan retomado puede apuntar a keys que ya se borraron: se descartan y el plan se cierra igual
+    written = [p for p in written if p]
+    _update_manifests(bucket, written)
+
+    # commit: sin plan y con los originales como borrados pendientes
+    consumed = [k for evs in parts.values() for k, _ in evs]
+    compacted = sum(p["events"] for p in written)
+    ckpt.update(
+        runs=ckpt["runs"] + 1,
+        events=ckpt.get("events", 0) + compacted,
+        last_run=run_id,
+        plan=None,
+        pending_delete=consumed,
+    )
+    _put_json(bucket, CHECKPOINT_KEY, ckpt)
+
+    _delete(bucket, consumed)
+    ckpt["pending_delete"] = []
+    _put_json(bucket, CHECKPOINT_KEY, ckpt)
+
+    logger.info(
+        f"[EventCompactor] 📦 Corrida {run_id}: {compacted} eventos en {len(written)} partes"
+    )
+    return {"events": compacted, "parts": [p["key"] for p in written]}
+
+
+def read_day(dt, bucket=None):
+    """Eventos de un día (`dt` = "YYYY-MM-DD"): un GET del manifiesto + uno por parte."""
+    bucket = bucket or os.environ["BUCKET_NAME"]
+    manifest = _get_json(bucket, f"{MANIFESTS_PREFIX}dt={dt}.json", {"parts": []})
+    for part in manifest["parts"]:
+        raw = s3.get_object(Bucket=bucket, Key=part["key"])["Body"].read()
+        if raw[:2] == b"\x1f\x8b":
+            raw = gzip.decompress(raw)
+        for line in raw.splitlines():
+            if line.strip():
+                yield json.loads(line)
+
+
+@flush_logs
+def lambda_handler(event, context):
+    # programada con EventBridge (rate(15 minutes)) o invocada a mano con {"minAgeS": n};
+    # n nunca baja de PRESIGN_EXPIRES_S
+    logger.info("[EventCompactor] ✅ Lambda EventCompactor invocada.")
+    try:
+        result = compact(min_age_s=(event or {}).get("minAgeS"))
+        return {"statusCode": 200, "body": json.dumps(result)}
+    except Exception as e:
+        logger.error(f"[EventCompactor] ❌ Error compactando eventos: {str(e)}")
+        return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
@@ -1,22 +1,142 @@
 import json
-import logging
 import os
-import uuid
+from concurrent.futures import ThreadPoolExecutor
 import boto3  # type: ignore
 import botocore  # type: ignore
+from lambda_common import metrics
+from lambda_common.aws import BOTO_CONFIG
+from lambda_common.ids import new_id
+from lambda_common.log import flush_logs, get_logger
 
-# Logger
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+logger = get_logger("Publisher", fmt="[%(asctime)s] [%(levelname)s] %(message)s")
 
 
+# clientes SNS cacheados por región: las invocaciones warm no vuelven a crearlos
+_sns_clients = {}
+
+
+def get_sns_client(region_name):
+    sns = _sns_clients.get(region_name)
+    if sns is None:
+        sns = _sns_clients[region_name] = metrics.instrument(
+            boto3.client("sns", region_name=region_name, config=BOTO_CONFIG)
+        )
+    return sns
+
+
+# PublishBatch acepta hasta 10 entradas por llamada
+PUBLISH_BATCH_SIZE = 10
+PUBLISH_CONCURRENCY = int(os.environ.get("PUBLISH_CONCURRENCY", "4"))
+_pool = None
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=PUBLISH_CONCURRENCY)
+    return _pool
+
+
+def parse_batch_body(body):
+    """Si el body es un array JSON o NDJSON devuelve la lista de entradas crudas, si no None.
+
+    Las líneas NDJSON se devuelven como texto: cada una se valida por separado.
+    """
+    text = body.strip() if isinstance(body, str) else body
+    if isinstance(text, list):
+        return text
+    if not isinstance(text, str):
+        return None
+    if text.startswith("["):
+        return json.loads(text)
+    # primero el body entero: un objeto JSON con saltos de línea no es NDJSON
+    try:
+        json.loads(text)
+        return None
+    except ValueError:
+        pass
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) > 1:
+        return lines
+    return None
+
+
+def validate_entry(raw):
+    """Valida un mensaje del batch; devuelve (mensaje, correlation_id) o lanza ValueError."""
+    message = json.loads(raw) if isinstance(raw, str) else raw
+    if not isinstance(message, dict):
+        raise ValueError("Cada mensaje debe ser un objeto JSON.")
+    correlation_id = str(message.get("correlationId") or new_id())
+    if not message.get("subject") or not message.get("content"):
+        raise ValueError("El mensaje debe incluir los campos 'subject' y 'content'.")
+    # SNS solo acepta strings: un número u objeto rompería el PublishBatch entero
+    if not isinstance(message["subject"], str) or not isinstance(message["content"], str):
+        raise ValueError("Los campos 'subject' y 'content' deben ser strings.")
+    if not message["subject"].strip() or not message["content"].strip():
+        raise ValueError("Los campos 'subject' y 'content' no pueden estar vacíos.")
+    return message, correlation_id
+
+
+def _publish_chunk(sns, topic, chunk):
+    """chunk: [(index, message, correlation_id)] -> [resultado por entrada]."""
+    entries = [
+        {"Id": f"m{index}", "Message": message["content"], "Subject": message["subject"]}
+        for index, message, _ in chunk
+    ]
+    by_id = {f"m{index}": (index, cid) for index, _, cid in chunk}
+    try:
+        res = sns.publish_batch(TopicArn=topic, PublishBatchRequestEntries=entries)
+    except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError) as ex:
+        # BotoCoreError (p.ej. ParamValidationError o un timeout) no trae response
+        if isinstance(ex, botocore.exceptions.ClientError):
+            error_message = ex.response["Error"]["Message"]
+        else:
+            error_message = str(ex)
+        return [
+            {"index": index, "correlationId": cid, "status": "error", "error": error_message}
+            for index, cid in by_id.values()
+        ]
+    out = []
+    for ok in res.get("Successful", []):
+        index, cid = by_id[ok["Id"]]
+        out.append({"index": index, "correlationId": cid, "status": "ok", "messageId": ok["MessageId"]})
+    for ko in res.get("Failed", []):
+        index, cid = by_id[ko["Id"]]
+        out.append(
+            {"index": index, "correlationId": cid, "status": "error", "error": ko.get("Message") or ko.get("Code")}
+        )
+    return out
+
+
+def publish_batch(sns, topic, raw_entries):
+    """Valida cada mensaje, publica los válidos en PublishBatch de a 10 (chunks en paralelo)."""
+    results, valid = [], []
+    for index, raw in enumerate(raw_entries):
+        try:
+            message, cid = validate_entry(raw)
+            valid.append((index, message, cid))
+        except (ValueError, TypeError) as ex:
+            results.append({"index": index, "status": "error", "error": str(ex)})
+
+    chunks = [valid[i : i + PUBLISH_BATCH_SIZE] for i in range(0, len(valid), PUBLISH_BATCH_SIZE)]
+    for chunk_results in _executor().map(lambda c: _publish_chunk(sns, topic, c), chunks):
+        results.extend(chunk_results)
+
+    results.sort(key=lambda r: r["index"])
+    failed = sum(1 for r in results if r["status"] != "ok")
+    return {
+        "results": results,
+        "published": len(results) - failed,
+        "failed": failed,
+        "snsCalls": len(chunks),
+    }
+
+
+@flush_logs
+@metrics.measured("Publisher")
 def lambda_handler(event, context):
-    correlation_id = str(uuid.uuid4())
+    correlation_id = new_id()
+    m = metrics.current()
 
     logger.info(f"[Publisher] 🔑 Correlation ID: {correlation_id}")
     try:
@@ -29,10 +149,29 @@ def lambda_handler(event, context):
 
         logger.info(f"[Publisher] 🌍 Región: {region_name}")
         logger.info(f"[Publisher] 🔗 Topic ARN: {topic}")
-        sns = boto3.client("sns", region_name=region_name)
+        sns = get_sns_client(region_name)
+
+        logger.debug("[Publisher] 📦 Evento recibido: %s", event)
+        body = event.get("body", "{}")
 
-        logger.info(f"[Publisher] 📦 Evento recibido: {json.dumps(event)}")
-        message = json.loads(event.get("body", "{}"))
+        # modo batch: array JSON o NDJSON -> PublishBatch de a 10
+        raw_entries = parse_batch_body(body)
+        if raw_entries is not None:
+            summary = publish_batch(sns, topic, raw_entries)
+            m.add("batch_size", len(raw_entries))
+            m.add("records_ok", summary["published"])
+            m.add("records_failed", summary["failed"])
+            logger.info(
+                f"[Publisher] 📨 Batch: {summary['published']} publicados, "
+                f"{summary['failed']} fallidos, {summary['snsCalls']} llamadas a SNS"
+            )
+            return {
+                "statusCode": 200 if not summary["failed"] else 207,
+                "headers": {"X-Correlation-ID": correlation_id},
+                "body": json.dumps(summary),
+            }
+
+        message = json.loads(body)
 
         content = message.get("content")
         subject = message.get("subject")
@@ -42,12 +181,10 @@ def lambda_handler(event, context):
                 "El mensaje debe incluir los campos 'subject' y 'content'."
             )
 
-        logger.info(
-            f"[Publisher] 📨 Enviando mensaje: subject='{subject}' | content='{content}'"
-        )
+        logger.info("[Publisher] 📨 Enviando mensaje: subject='%s' | content='%s'", subject, content)
         res = sns.publish(TopicArn=topic, Message=content, Subject=subject)
 
-        logger.info(f"[Publisher] ✅ Respuesta SNS: {res}")
+        logger.debug("[Publisher] ✅ Respuesta SNS: %s", res)
 
         return {
             "statusCode": 200,
@@ -1,58 +1,127 @@
 import json
-import logging
-import uuid
+import time
+import os
+from lambda_common import metrics
+from lambda_common.ids import new_id
+from lambda_common.log import SAMPLED, flush_logs, get_logger
 
-# Logger
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+logger = get_logger("Subscriber", fmt="[%(asctime)s] [%(levelname)s] %(message)s")
 
 
-def lambda_handler(event, context):
-    correlation_id = str(uuid.uuid4())
+# "auto": detecta si el body es el sobre de SNS | "true": raw message delivery (el body es el mensaje) | "false": siempre sobre
+RAW_DELIVERY = os.environ.get("SNS_RAW_DELIVERY", "auto").lower()
+# la respuesta trae a lo sumo estos mensajes de muestra: su tamaño no crece con el batch
+RESPONSE_SAMPLE = int(os.environ.get("RESPONSE_SAMPLE", "5"))
 
-    logger.info(f"[Subscriber] 🔑 Correlation ID: {correlation_id}")
-    logger.info("[Subscriber] 📥 Lambda InternalSubscriberFunction fue invocada.")
 
-    try:
-        received_messages = []
+def _is_envelope(raw_body):
+    if RAW_DELIVERY in ("true", "1", "yes"):
+        return False
+    if RAW_DELIVERY in ("false", "0", "no"):
+        return True
+    # camino rápido: el sobre de SNS suele empezar con "Type". Si no (otro orden de campos,
+    # espacios), decode_records lo reconoce igual después de decodificar
+    return '"Type"' in raw_body[:64] and '"Notification"' in raw_body[:96]
+
+
+def _is_notification(decoded):
+    return (
+        isinstance(decoded, dict)
+        and decoded.get("Type") == "Notification"
+        and isinstance(decoded.get("Message"), str)
+    )
+
+
+def _decode_json(text):
+    """dict/list si el texto es JSON; None si no lo es."""
+    if text[:1] in ("{", "["):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+    return None
 
-        for record in event.get("Records", []):
-            raw_body = record.get("body")
-            logger.info(f"[Subscriber] 📨 Mensaje raw recibido: {raw_body}")
-            parsed_body = json.loads(raw_body)
-            sns_message_raw = parsed_body.get("Message")
 
-            if not sns_message_raw:
-                raise ValueError(
-                    "Falta el campo 'Message' en el cuerpo recibido desde SNS"
-                )
+def decode_records(records):
+    """Genera (messageId, subject, content, error) de a un record: memoria constante con el batch."""
+    for record in records:
+        message_id = record.get("messageId")
+        try:
+            raw_body = record.get("body") or ""
+            logger.debug("[Subscriber] 📨 Mensaje raw recibido: %s", raw_body)
+            if _is_envelope(raw_body):
+                parsed_body = json.loads(raw_body)
+                message = parsed_body.get("Message")
+                if not message:
+                    raise ValueError("Falta el campo 'Message' en el cuerpo recibido desde SNS")
+                subject = parsed_body.get("Subject") or "Sin asunto"
+                decoded = _decode_json(message)
+            else:
+                # raw delivery: el body ya es el mensaje y el subject viaja (si viene) como atributo
+                message = raw_body
+                attr = (record.get("messageAttributes") or {}).get("subject") or {}
+                subject = attr.get("stringValue") or "Sin asunto"
+                decoded = _decode_json(message)
+                if RAW_DELIVERY == "auto" and _is_notification(decoded):
+                    # era un sobre que el prefijo no vio: se desenvuelve sin volver a parsear el body
+                    message = decoded["Message"]
+                    subject = decoded.get("Subject") or "Sin asunto"
+                    decoded = _decode_json(message)
 
-            try:
-                sns_message = json.loads(sns_message_raw)
-            except json.JSONDecodeError:
-                sns_message = {"content": sns_message_raw}
+            content = message
+            if decoded is not None:
+                content = decoded.get("content", "Sin contenido") if isinstance(decoded, dict) else decoded
+            yield message_id, subject, content, None
+        except Exception as ex:
+            yield message_id, None, None, ex
 
-            subject = parsed_body.get("Subject", "Sin asunto")
-            content = sns_message.get("content", "Sin contenido")
 
-            logger.info(f"[Subscriber] 📦 Subject: {subject}")
-            logger.info(f"[Subscriber] 📄 Contenido: {content}")
+@flush_logs
+@metrics.measured("Subscriber")
+def lambda_handler(event, context):
+    correlation_id = new_id()
+    m = metrics.current()
+
+    logger.info(f"[Subscriber] 🔑 Correlation ID: {correlation_id}")
+    logger.info("[Subscriber] 📥 Lambda InternalSubscriberFunction fue invocada.")
+
+    try:
+        records = event.get("Records", [])
+        m.add("batch_size", len(records))
+        processed, sample, failures = 0, [], []
+
+        t0 = time.perf_counter()
+        for message_id, subject, content, error in decode_records(records):
+            if error is not None:
+                # sólo este record vuelve a la cola (ReportBatchItemFailures), el resto se confirma
+                logger.warning("[Subscriber] ⚠️ Record %s inválido: %s", message_id, error)
+                failures.append({"itemIdentifier": message_id})
+                m.add("records_failed")
+            else:
+                logger.info("[Subscriber] 📦 Subject: %s", subject, extra=SAMPLED)
+                logger.info("[Subscriber] 📄 Contenido: %s", content, extra=SAMPLED)
+                processed += 1
+                if len(sample) < RESPONSE_SAMPLE:
+                    sample.append({"subject": subject, "content": content})
+            m.observe("record_ms", (time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
 
-            received_messages.append({"subject": subject, "content": content})
+        for record in records:
+            receive_count = (record.get("attributes") or {}).get("ApproximateReceiveCount")
+            if receive_count:
+                m.observe("receive_count", int(receive_count), unit="Count")
+        m.add("records_ok", processed)
 
-        logger.info(
-            "[Subscriber] ✅ Todos los mensajes fueron procesados correctamente."
-        )
+        if failures:
+            logger.info(f"[Subscriber] ⚠️ {processed} procesados, {len(failures)} con error.")
+        else:
+            logger.info("[Subscriber] ✅ Todos los mensajes fueron procesados correctamente.")
 
         return {
             "statusCode": 200,
             "headers": {"X-Correlation-ID": correlation_id},
-            "body": json.dumps({"receivedMessages": received_messages}),
+            "body": json.dumps({"processed": processed, "failed": len(failures), "receivedMessages": sample}),
+            "batchItemFailures": failures,
         }
 
     except Exception as ex:
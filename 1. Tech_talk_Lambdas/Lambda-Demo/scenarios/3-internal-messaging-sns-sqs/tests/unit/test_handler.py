@@ -54,6 +54,88 @@ class TestServiceHandler:
             assert response["statusCode"] == expected_status_code
             assert data is not None
 
+    @pytest.mark.parametrize("as_ndjson", [False, True])
+    @mock_sns
+    def test_publisher_batch(self, publisher_invoked, as_ndjson):
+        """Batch de 25 mensajes (+1 inválido) -> 3 llamadas PublishBatch"""
+        _ = self
+        sns = boto3.client("sns", region_name="us-east-1")
+        topic_arn = sns.create_topic(Name="some-topic")["TopicArn"]
+        messages = [
+            {"subject": "Example", "content": f"mensaje {i}", "correlationId": f"cid-{i}"}
+            for i in range(25)
+        ]
+        messages.append({"subject": "Example"})
+        body = (
+            "\n".join(json.dumps(m) for m in messages)
+            if as_ndjson
+            else json.dumps(messages)
+        )
+        event = {**publisher_invoked, "body": body}
+
+        with patch.dict(os.environ, {"topicArn": topic_arn, "region": "us-east-1"}):
+            context = type("Context", (), {"function_name": "test_publisher"})
+            response = func_prod.lambda_handler(event, context)
+            data = json.loads(response["body"])
+
+            assert response["statusCode"] == 207
+            assert data["published"] == 25
+            assert data["failed"] == 1
+            assert data["snsCalls"] == 3
+            assert data["results"][3]["correlationId"] == "cid-3"
+            assert data["results"][25]["status"] == "error"
+
+    @mock_sns
+    def test_publisher_batch_invalid_fields(self, publisher_invoked):
+        """subject/content no-string o vacíos se reportan por entrada sin tirar el batch"""
+        _ = self
+        sns = boto3.client("sns", region_name="us-east-1")
+        topic_arn = sns.create_topic(Name="some-topic")["TopicArn"]
+        messages = [
+            {"subject": "Example", "content": "ok"},
+            {"subject": 7, "content": "numero"},
+            {"subject": "Example", "content": {"a": 1}},
+            {"subject": "  ", "content": "vacio"},
+        ]
+        event = {**publisher_invoked, "body": json.dumps(messages)}
+
+        with patch.dict(os.environ, {"topicArn": topic_arn, "region": "us-east-1"}):
+            context = type("Context", (), {"function_name": "test_publisher"})
+            response = func_prod.lambda_handler(event, context)
+            data = json.loads(response["body"])
+
+            assert response["statusCode"] == 207
+            assert data["published"] == 1
+            assert data["failed"] == 3
+
+    def test_publish_chunk_botocore_error(self):
+        """Un BotoCoreError (ParamValidationError) marca el chunk como fallido"""
+        _ = self
+        from botocore.exceptions import ParamValidationError
+
+        class _Sns:
+            def publish_batch(self, **_):
+                raise ParamValidationError(report="Subject inválido")
+
+        out = func_prod._publish_chunk(_Sns(), "arn", [(0, {"subject": "s", "content": "c"}, "cid-0")])
+        assert out[0]["status"] == "error"
+        assert "Subject" in out[0]["error"]
+
+    @mock_sns
+    def test_publisher_pretty_printed_single(self, publisher_invoked):
+        """Un objeto JSON con saltos de línea es un mensaje único, no NDJSON"""
+        _ = self
+        sns = boto3.client("sns", region_name="us-east-1")
+        topic_arn = sns.create_topic(Name="some-topic")["TopicArn"]
+        body = json.dumps({"subject": "Example", "content": "hola"}, indent=2)
+        event = {**publisher_invoked, "body": body}
+
+        with patch.dict(os.environ, {"topicArn": topic_arn, "region": "us-east-1"}):
+            context = type("Context", (), {"function_name": "test_publisher"})
+            response = func_prod.lambda_handler(event, context)
+
+            assert response["statusCode"] == 200
+            assert json.loads(response["body"])["sentMessage"] is not None
 
     def test_subscriber(self, incoming_message, context):
         """llamada de lambda con evento y contexto"""
@@ -64,3 +146,39 @@ class TestServiceHandler:
         msgs_count = len(messages)
         assert response["statusCode"] == 200
         assert msgs_count > 0
+
+    def test_subscriber_partial_failure(self, incoming_message, context):
+        """Un record malformado va a batchItemFailures sin tirar el resto; raw delivery sin sobre"""
+        _ = self
+        context.function_name = 'test_subscriber'
+        envelope = {**incoming_message["Records"][0], "messageId": "m-ok"}
+        raw = {
+            "messageId": "m-raw",
+            "body": json.dumps({"content": "sin sobre"}),
+            "messageAttributes": {"subject": {"stringValue": "raw", "dataType": "String"}},
+        }
+        broken = {"messageId": "m-bad", "body": "{\"Type\" : \"Notification\", no es json"}
+        event = {"Records": [envelope, broken, raw]}
+        response = func_subscriber.lambda_handler(event, context)
+        data = json.loads(response["body"])
+        assert response["statusCode"] == 200
+        assert response["batchItemFailures"] == [{"itemIdentifier": "m-bad"}]
+        assert data["processed"] == 2
+        assert data["receivedMessages"][1] == {"subject": "raw", "content": "sin sobre"}
+
+    def test_subscriber_envelope_not_at_start(self, context):
+        """Un sobre de SNS con otro orden de campos se desenvuelve igual (RAW_DELIVERY=auto)"""
+        _ = self
+        context.function_name = 'test_subscriber'
+        envelope = {
+            "MessageId": "sns-1",
+            "TopicArn": "arn:aws:sns:us-east-1:000000000000:some-topic",
+            "Subject": "Example",
+            "Message": json.dumps({"content": "hola"}),
+            "Type": "Notification",
+        }
+        event = {"Records": [{"messageId": "m-1", "body": json.dumps(envelope, indent=2)}]}
+        response = func_subscriber.lambda_handler(event, context)
+        data = json.loads(response["body"])
+        assert response["batchItemFailures"] == []
+        assert data["receivedMessages"] == [{"subject": "Example", "content": "hola"}]
@@ -0,0 +1,151 @@
+# inventory.py
+# Stock de la tabla de reservas (utils/inventory.py): crear/sembrar, ver, y prueba de carga
+# concurrente que verifica las invariantes (nunca negativo, available + reserved == stock inicial,
+# reserved == suma de los ledgers). Sirve contra localstack, DynamoDB Local o un moto server.
+#
+#   PYTHONPATH=Dashboard/src AWS_ENDPOINT_URL=http://localhost:4566 python3 Dashboard/scripts/inventory.py seed --stock 500
+#   ... inventory.py show
+#   ... inventory.py loadtest --orders 2000 --concurrency 32 --stock 300
+import argparse, os, random, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from utils.log import jlog
+from utils import runtime
+from utils.inventory import TABLE, Inventory
+
+PRODUCTS = ["StartUp book", "Lean book", "Serverless mug", "SQS sticker"]
+
+
+def ensure_table(ddb, table):
+    try:
+        ddb.describe_table(TableName=table)
+    except ddb.exceptions.ResourceNotFoundException:
+        ddb.create_table(
+            TableName=table,
+            KeySchema=[{"AttributeName": "sku", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "sku", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        ddb.get_waiter("table_exists").wait(TableName=table)
+        jlog(component="inventory", status="table-created", table=table)
+
+
+def seed(ddb, table, products, stock):
+    """Pisa el stock de cada SKU: available=stock, reserved=0."""
+    for sku in products:
+        ddb.put_item(
+            TableName=table,
+            Item={"sku": {"S": sku}, "available": {"N": str(stock)}, "reserved": {"N": "0"}},
+        )
+    jlog(component="inventory", status="seeded", table=table, products=len(products), stock=stock)
+
+
+def scan(ddb, table, ledger_prefix="order#"):
+    """-> ({sku: (available, reserved)}, {sku: suma de cantidades en los ledgers con ese prefijo})."""
+    stock, ledgers = {}, {}
+    for page in ddb.get_paginator("scan").paginate(TableName=table, ConsistentRead=True):
+        for it in page["Items"]:
+            sku = it["sku"]["S"]
+            if sku.startswith("order#"):
+                if not sku.startswith(ledger_prefix):
+                    continue
+                for s, q in it.get("lines", {}).get("M", {}).items():
+                    ledgers[s] = ledgers.get(s, 0) + int(q["N"])
+            else:
+                stock[sku] = (int(it.get("available", {}).get("N", 0)), int(it.get("reserved", {}).get("N", 0)))
+    return stock, ledgers
+
+
+def loadtest(args, ddb):
+    seed(ddb, args.table, args.products, args.stock)
+    run = f"lt-{int(time.time())}-{os.urandom(2).hex()}"
+
+    def order(i):
+        lines = {}
+        for sku in random.sample(args.products, random.randint(1, min(args.max_lines, len(args.products)))):
+            lines[sku] = random.randint(1, 3)
+        return (f"{run}-{i}", lines)
+
+    orders = [order(i) for i in range(args.orders)]
+    # algunas órdenes se repiten (redelivery): la reserva tiene que ser idempotente
+    orders += random.sample(orders, int(len(orders) * args.redeliver_ratio))
+    random.shuffle(orders)
+    batches = [orders[i : i + args.batch] for i in range(0, len(orders), args.batch)]
+
+    def work(batch):
+        inv = Inventory("inventory-loadtest", store="dynamodb")
+        res = inv.reserve(batch)
+        return res, inv.transactions, inv.conflicts
+
+    t0 = time.perf_counter()
+    counts, tx, conflicts = {}, 0, 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for res, n_tx, n_conf in pool.map(work, batches):
+            tx += n_tx
+            conflicts += n_conf
+            for r in res.values():
+                counts[r["status"]] = counts.get(r["status"], 0) + 1
+    elapsed = time.perf_counter() - t0
+
+    stock, ledgers = scan(ddb, args.table, ledger_prefix=f"order#{run}-")
+    errors = []
+    for sku in args.products:
+        available, reserved = stock.get(sku, (0, 0))
+        if available < 0:
+            errors.append(f"{sku}: available negativo ({available})")
+        if available + reserved != args.stock:
+            errors.append(f"{sku}: available+reserved={available + reserved} != {args.stock}")
+        if reserved != ledgers.get(sku, 0):
+            errors.append(f"{sku}: reserved={reserved} != ledgers={ledgers.get(sku, 0)}")
+    report = {
+        "component": "inventory",
+        "status": "loadtest",
+        "run": run,
+        "orders": len(orders),
+        "batches": len(batches),
+        "elapsed_s": round(elapsed, 2),
+        "orders_per_s": round(len(orders) / elapsed, 1) if elapsed else 0,
+        "results": counts,
+        "transactions": tx,
+        "conflicts": conflicts,
+        "stock": {sku: {"available": a, "reserved": r} for sku, (a, r) in stock.items()},
+        "ok": not errors,
+        "errors": errors,
+    }
+    jlog(**report)
+    return report
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Stock de la tabla de reservas")
+    p.add_argument("command", choices=["seed", "show", "loadtest"])
+    p.add_argument("--table", default=TABLE)
+    p.add_argument("--region", default=os.getenv("AWS_DEFAULT_REGION", "us-east-1"))
+    p.add_argument("--products", type=lambda s: s.split(","), default=PRODUCTS, help="SKUs separados por coma")
+    p.add_argument("--stock", type=int, default=500)
+    p.add_argument("--orders", type=int, default=1000, help="loadtest: órdenes distintas")
+    p.add_argument("--batch", type=int, default=10, help="loadtest: órdenes por reserve() (batch SQS)")
+    p.add_argument("--concurrency", type=int, default=16, help="loadtest: invocaciones simultáneas")
+    p.add_argument("--max-lines", type=int, default=2, help="loadtest: líneas máximas por orden")
+    p.add_argument("--redeliver-ratio", type=float, default=0.1, help="loadtest: proporción de órdenes repetidas")
+    args = p.parse_args(argv)
+    os.environ.setdefault("AWS_MAX_POOL_CONNECTIONS", str(args.concurrency))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    ddb = runtime.client("dynamodb", region_name=args.region)
+    ensure_table(ddb, args.table)
+    if args.command == "seed":
+        seed(ddb, args.table, args.products, args.stock)
+    elif args.command == "show":
+        stock, ledgers = scan(ddb, args.table)
+        for sku, (available, reserved) in sorted(stock.items()):
+            jlog(component="inventory", sku=sku, available=available, reserved=reserved, ledgers=ledgers.get(sku, 0))
+    else:
+        return 0 if loadtest(args, ddb)["ok"] else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+# loadgen.py
+# Generador de carga para los pipelines de la demo: SQS SendMessageBatch (demo-thr) o
+# SNS PublishBatch (demo-fanout-topic), con perfiles de tasa constante / rampa / ráfagas.
+#
+#   PYTHONPATH=Dashboard/src AWS_ENDPOINT_URL=http://localhost:4566 \
+#     python3 Dashboard/scripts/loadgen.py sqs --queue demo-thr --rate 200 --duration 30
+#   ... loadgen.py sns --topic demo-fanout-topic --profile ramp --rate 10 --to-rate 300 --duration 60
+#   ... loadgen.py sqs --queue demo-thr --count 100           # lo que hacía seed_throttling.sh
+import argparse, asyncio, json, os, random, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from utils.log import jlog
+from utils import runtime
+from utils.ids import ulid
+
+BATCH_MAX = 10  # tope de SendMessageBatch / PublishBatch
+TICK_S = 0.05
+
+EVENTS = [("OrderPlaced", "high"), ("OrderPlaced", "low"), ("OrderUpdated", "low"), ("OrderShipped", "high")]
+PRODUCTS = ["StartUp book", "Lean book", "Serverless mug", "SQS sticker"]
+
+
+def rate_at(args, t):
+    """Mensajes/seg objetivo a los t segundos de arrancar."""
+    if args.profile == "ramp":
+        frac = min(1.0, t / args.duration) if args.duration else 1.0
+        return args.rate + (args.to_rate - args.rate) * frac
+    if args.profile == "burst":
+        in_burst = (t % args.burst_every) < args.burst_for
+        return args.burst_rate if in_burst else args.rate
+    return args.rate
+
+
+def make_message(args, seq):
+    """Cuerpo con correlationId y sentAt: el pipeline puede medir latencia punta a punta."""
+    event_type, priority = random.choice(EVENTS)
+    msg = {
+        "correlationId": ulid(),
+        "sentAt": int(time.time() * 1000),
+        "seq": seq,
+        "loadgen": args.run_id,
+    }
+    if args.target == "sns":
+        msg.update(
+            orderId=ulid(),
+            eventType=event_type,
+            priority=priority,
+            product=random.choice(PRODUCTS),
+            quantity=random.randint(1, 3),
+            price=random.choice([10, 15, 20]),
+        )
+    if args.force_fail and random.random() < args.force_fail_ratio:
+        msg["forceFail"] = args.force_fail
+    if args.pad:
+        msg["pad"] = "x" * args.pad
+    return msg
+
+
+class Sender:
+    """Una llamada batch (hasta 10 mensajes); devuelve (ok, [códigos de error], ms)."""
+
+    def __init__(self, args):
+        self.args = args
+        if args.target == "sqs":
+            self.client = runtime.client("sqs", region_name=args.region)
+            self.url = args.queue_url or self.client.get_queue_url(QueueName=args.queue)["QueueUrl"]
+        else:
+            self.client = runtime.client("sns", region_name=args.region)
+            self.arn = args.topic_arn or self.client.create_topic(Name=args.topic)["TopicArn"]
+
+    def send(self, msgs):
+        t0 = time.perf_counter()
+        try:
+            if self.args.target == "sqs":
+                res = self.client.send_message_batch(
+                    QueueUrl=self.url,
+                    Entries=[{"Id": str(i), "MessageBody": json.dumps(m)} for i, m in enumerate(msgs)],
+                )
+            else:
+                res = self.client.publish_batch(
+                    TopicArn=self.arn,
+                    PublishBatchRequestEntries=[
+                        {
+                            "Id": str(i),
+                            "Message": json.dumps(m),
+                            "MessageAttributes": {
+                                "eventType": {"DataType": "String", "StringValue": m["eventType"]},
+                                "priority": {"DataType": "String", "StringValue": m["priority"]},
+                            },
+                        }
+                        for i, m in enumerate(msgs)
+                    ],
+                )
+            errors = [f.get("Code", "Failed") for f in res.get("Failed", [])]
+            return len(res.get("Successful", [])), errors, (time.perf_counter() - t0) * 1000
+        except Exception as e:
+            code = getattr(e, "response", {}).get("Error", {}).get("Code") or type(e).__name__
+            return 0, [code] * len(msgs), (time.perf_counter() - t0) * 1000
+
+
+class Stats:
+    def __init__(self):
+        self.sent = self.failed = self.calls = 0
+        self.errors = {}
+        self.lat = []
+
+    def add(self, ok, errors, ms):
+        self.calls += 1
+        self.sent += ok
+        self.failed += len(errors)
+        for code in errors:
+            self.errors[code] = self.errors.get(code, 0) + 1
+        self.lat.append(ms)
+
+    def pct(self, p):
+        s = sorted(self.lat)
+        return round(s[min(len(s) - 1, int(p / 100 * len(s)))], 2) if s else 0
+
+
+async def run(args):
+    sender = Sender(args)
+    stats = Stats()
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="loadgen")
+    # no más de `concurrency` llamadas en vuelo: si el destino no da abasto, la tasa lograda baja
+    slots = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+
+    async def send(msgs):
+        try:
+            stats.add(*await loop.run_in_executor(pool, sender.send, msgs))
+        finally:
+            slots.release()
+
+    start = time.monotonic()
+    due, scheduled, last_report = 0.0, 0, 0
+    while True:
+        t = time.monotonic() - start
+        if (args.duration and t >= args.duration) or (args.count and scheduled >= args.count):
+            break
+        due += rate_at(args, t) * TICK_S
+        target = min(int(due), args.count) if args.count else int(due)
+        while scheduled < target:
+            n = min(args.batch, target - scheduled)
+            msgs = [make_message(args, scheduled + i) for i in range(n)]
+            scheduled += n
+            await slots.acquire()
+            task = asyncio.ensure_future(send(msgs))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if int(t) > last_report:
+            last_report = int(t)
+            jlog(component="loadgen", status="progress", t=last_report, target_rate=round(rate_at(args, t), 1),
+                 scheduled=scheduled, sent=stats.sent, failed=stats.failed, inflight=len(tasks))
+        await asyncio.sleep(TICK_S)
+
+    if tasks:
+        await asyncio.wait(tasks)
+    pool.shutdown()
+    elapsed = time.monotonic() - start
+    report = {
+        "component": "loadgen",
+        "status": "done",
+        "run": args.run_id,
+        "target": args.target,
+        "profile": args.profile,
+        "elapsed_s": round(elapsed, 2),
+        "scheduled": scheduled,
+        "sent": stats.sent,
+        "failed": stats.failed,
+        "errors": stats.errors,
+        "calls": stats.calls,
+        "achieved_rate": round(stats.sent / elapsed, 1) if elapsed else 0,
+        "call_p50_ms": stats.pct(50),
+        "call_p99_ms": stats.pct(99),
+    }
+    jlog(**report)
+    return report
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Generador de carga SQS/SNS para la demo")
+    p.add_argument("target", choices=["sqs", "sns"])
+    p.add_argument("--queue", default="demo-thr")
+    p.add_argument("--queue-url")
+    p.add_argument("--topic", default="demo-fanout-topic")
+    p.add_argument("--topic-arn")
+    p.add_argument("--region", default=os.getenv("AWS_DEFAULT_REGION", "us-east-1"))
+    p.add_argument("--profile", choices=["constant", "ramp", "burst"], default="constant")
+    p.add_argument("--rate", type=float, default=50, help="msgs/seg (inicio de la rampa / base de ráfagas)")
+    p.add_argument("--to-rate", type=float, default=500, help="ramp: tasa al final")
+    p.add_argument("--burst-rate", type=float, default=1000, help="burst: tasa durante la ráfaga")
+    p.add_argument("--burst-every", type=float, default=10, help="burst: período en segundos")
+    p.add_argument("--burst-for", type=float, default=2, help="burst: duración de cada ráfaga")
+    p.add_argument("--duration", type=float, default=30, help="segundos (0 = hasta --count)")
+    p.add_argument("--count", type=int, default=0, help="corta después de N mensajes")
+    p.add_argument("--batch", type=int, default=BATCH_MAX)
+    p.add_argument("--concurrency", type=int, default=16, help="llamadas batch en vuelo")
+    p.add_argument("--force-fail", help="agrega forceFail=<servicio|all> a una parte de los mensajes")
+    p.add_argument("--force-fail-ratio", type=float, default=0.1)
+    p.add_argument("--pad", type=int, default=0, help="bytes de relleno por mensaje")
+    args = p.parse_args(argv)
+    args.batch = max(1, min(BATCH_MAX, args.batch))
+    if args.count and not args.duration:
+        args.duration = 0
+    if not args.count and not args.duration:
+        p.error("hace falta --duration o --count")
+    # el pool HTTP del cliente tiene que alcanzar para todas las llamadas en vuelo
+    os.environ.setdefault("AWS_MAX_POOL_CONNECTIONS", str(args.concurrency))
+    args.run_id = f"lg-{int(time.time())}-{os.urandom(2).hex()}"
+    return args
+
+
+if __name__ == "__main__":
+    report = asyncio.run(run(parse_args()))
+    sys.exit(1 if report["failed"] else 0)
@@ -0,0 +1,292 @@
+# local_runtime.py
+# Event source mapping SQS -> handler en local, contra localstack o un moto server.
+# Imita al poller de Lambda: long-poll, BatchSize + MaximumBatchingWindow, concurrencia que
+# escala según el backlog (un proceso por "contenedor"), ReportBatchItemFailures y visibility
+# timeout. El maxReceiveCount -> DLQ lo aplica la cola (RedrivePolicy); si la cola no tiene,
+# --dlq/--max-receive lo emulan acá. Cada segundo muestra concurrencia / en vuelo / backlog / drenado.
+#
+#   PYTHONPATH=Dashboard/src AWS_ENDPOINT_URL=http://localhost:4566 python3 Dashboard/scripts/local_runtime.py \
+#     --queue demo-thr --handler Dashboard/src/workers/throttling-dlq/Stressed_worker.py:handler \
+#     --batch-size 10 --max-concurrency 8 --until-empty
+import argparse, importlib.util, json, multiprocessing as mp, os, queue, sys, time, uuid
+from utils.log import jlog
+from utils import runtime
+
+RECEIVE_MAX = 10  # tope de ReceiveMessage por llamada
+
+
+def load_handler(spec):
+    """"ruta/al/archivo.py:handler" -> callable (cada proceso lo importa una vez: contenedor "warm")."""
+    path, _, name = spec.partition(":")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    mod_spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+    mod = importlib.util.module_from_spec(mod_spec)
+    mod_spec.loader.exec_module(mod)
+    return getattr(mod, name or "handler")
+
+
+class Context:
+    def __init__(self, name, timeout_s):
+        self.function_name = name
+        self.aws_request_id = str(uuid.uuid4())
+        self._deadline = time.monotonic() + timeout_s
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+def to_record(m, queue_arn, region):
+    """Mensaje de ReceiveMessage -> record con la forma del evento SQS de Lambda."""
+    return {
+        "messageId": m["MessageId"],
+        "receiptHandle": m["ReceiptHandle"],
+        "body": m["Body"],
+        "attributes": m.get("Attributes", {}),
+        "messageAttributes": {
+            k: {
+                "stringValue": v.get("StringValue"),
+                "dataType": v.get("DataType"),
+                "stringListValues": [],
+                "binaryListValues": [],
+            }
+            for k, v in m.get("MessageAttributes", {}).items()
+        },
+        "md5OfBody": m.get("MD5OfBody"),
+        "eventSource": "aws:sqs",
+        "eventSourceARN": queue_arn,
+        "awsRegion": region,
+    }
+
+
+def queue_info(sqs, url):
+    attrs = sqs.get_queue_attributes(QueueUrl=url, AttributeNames=["All"])["Attributes"]
+    redrive = json.loads(attrs.get("RedrivePolicy") or "{}")
+    return {
+        "arn": attrs["QueueArn"],
+        "visibility": int(attrs.get("VisibilityTimeout", 30)),
+        "max_receive": int(redrive.get("maxReceiveCount", 0)),
+        "dlq_arn": redrive.get("deadLetterTargetArn"),
+    }
+
+
+def _dlq_url(sqs, arn):
+    return sqs.get_queue_url(QueueName=arn.rsplit(":", 1)[1])["QueueUrl"] if arn else None
+
+
+def _receive_batch(sqs, url, cfg, stop):
+    """Junta hasta batch_size mensajes; con ventana > 0 sigue poleando hasta llenarse o vencer la ventana."""
+    msgs = []
+    window_end = time.monotonic() + cfg["window_s"]
+    while not stop.is_set() and len(msgs) < cfg["batch_size"]:
+        left = window_end - time.monotonic()
+        wait = cfg["wait_s"] if not msgs else max(0, min(cfg["wait_s"], int(left)))
+        res = sqs.receive_message(
+            QueueUrl=url,
+            MaxNumberOfMessages=min(RECEIVE_MAX, cfg["batch_size"] - len(msgs)),
+            WaitTimeSeconds=wait,
+            VisibilityTimeout=cfg["visibility"],
+            AttributeNames=["All"],
+            MessageAttributeNames=["All"],
+        )
+        got = res.get("Messages", [])
+        msgs.extend(got)
+        if not msgs:
+            return msgs  # long-poll vacío
+        if cfg["window_s"] <= 0 or time.monotonic() >= window_end or (not got and left <= 0):
+            break
+    return msgs
+
+
+def _delete(sqs, url, handles):
+    for i in range(0, len(handles), RECEIVE_MAX):
+        chunk = handles[i : i + RECEIVE_MAX]
+        sqs.delete_message_batch(
+            QueueUrl=url, Entries=[{"Id": str(j), "ReceiptHandle": h} for j, h in enumerate(chunk)]
+        )
+
+
+def poller(idx, cfg, stats, stop):
+    """Un "contenedor": importa el handler una vez y polea/invoca/borra hasta que le piden parar."""
+    handler = load_handler(cfg["handler"])
+    # cliente propio: runtime vacía en el fork el cache heredado de run()
+    sqs = runtime.client("sqs", region_name=cfg["region"])
+    url, info = cfg["url"], cfg["info"]
+    dlq_url = _dlq_url(sqs, cfg["dlq_arn"])
+    while not stop.is_set():
+        msgs = _receive_batch(sqs, url, cfg, stop)
+        if not msgs:
+            stats.put(("empty", idx))
+            continue
+
+        # redrive emulado (cola sin RedrivePolicy): lo que ya se recibió de más va a la DLQ sin invocar
+        records, dead = [], []
+        for m in msgs:
+            count = int(m.get("Attributes", {}).get("ApproximateReceiveCount", "1"))
+            (dead if cfg["emulate_redrive"] and count > cfg["max_receive"] else records).append(m)
+        for i in range(0, len(dead), RECEIVE_MAX):
+            chunk = dead[i : i + RECEIVE_MAX]
+            sqs.send_message_batch(
+                QueueUrl=dlq_url, Entries=[{"Id": str(j), "MessageBody": m["Body"]} for j, m in enumerate(chunk)]
+            )
+            _delete(sqs, url, [m["ReceiptHandle"] for m in chunk])
+        if not records:
+            stats.put(("batch", idx, 0, 0, 0.0, len(dead)))
+            continue
+
+        event = {"Records": [to_record(m, info["arn"], cfg["region"]) for m in records]}
+        t0 = time.perf_counter()
+        try:
+            res = handler(event, Context(cfg["name"], cfg["timeout_s"])) or {}
+            failures = {f.get("itemIdentifier") for f in res.get("batchItemFailures", [])}
+            ids = {m["MessageId"] for m in records}
+            if failures - ids or None in failures or "" in failures:
+                failures = ids  # identificador inválido: Lambda lo trata como fallo de todo el batch
+        except Exception as e:
+            jlog(component="local-esm", status="handler-error", worker=idx, error=str(e))
+            failures = {m["MessageId"] for m in records}
+        ms = (time.perf_counter() - t0) * 1000
+
+        # los exitosos se borran; los fallidos reaparecen cuando vence el visibility timeout
+        _delete(sqs, url, [m["ReceiptHandle"] for m in records if m["MessageId"] not in failures])
+        stats.put(("batch", idx, len(records), len(failures), ms, len(dead)))
+
+
+def backlog(sqs, url):
+    a = sqs.get_queue_attributes(
+        QueueUrl=url,
+        AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"],
+    )["Attributes"]
+    return int(a.get("ApproximateNumberOfMessages", 0)), int(a.get("ApproximateNumberOfMessagesNotVisible", 0))
+
+
+def run(args):
+    sqs = runtime.client("sqs", region_name=args.region)
+    url = args.queue_url or sqs.get_queue_url(QueueName=args.queue)["QueueUrl"]
+    info = queue_info(sqs, url)
+    cfg = {
+        "handler": args.handler,
+        "name": args.name or os.path.basename(args.handler.split(":")[0])[:-3],
+        "region": args.region,
+        "url": url,
+        "info": info,
+        "batch_size": args.batch_size,
+        "window_s": args.window,
+        "wait_s": min(20, args.wait),
+        "visibility": args.visibility_timeout or info["visibility"],
+        "max_receive": args.max_receive if args.max_receive is not None else info["max_receive"],
+        "dlq_arn": info["dlq_arn"] or (args.dlq and sqs.get_queue_attributes(
+            QueueUrl=sqs.get_queue_url(QueueName=args.dlq)["QueueUrl"], AttributeNames=["QueueArn"]
+        )["Attributes"]["QueueArn"]),
+        "timeout_s": args.timeout,
+    }
+    cfg["emulate_redrive"] = bool(not info["dlq_arn"] and cfg["dlq_arn"] and cfg["max_receive"])
+    dlq_url = _dlq_url(sqs, cfg["dlq_arn"])
+    jlog(component="local-esm", status="start", queue=url, batch_size=cfg["batch_size"], window_s=cfg["window_s"],
+         visibility=cfg["visibility"], max_receive=cfg["max_receive"], dlq=cfg["dlq_arn"],
+         redrive="emulated" if cfg["emulate_redrive"] else ("queue" if info["dlq_arn"] else "off"),
+         min_concurrency=args.min_concurrency, max_concurrency=args.max_concurrency)
+
+    ctx = mp.get_context("fork")
+    stats = ctx.Queue()
+    workers = {}  # idx -> (proceso, evento de stop)
+
+    def scale_to(n):
+        while len(workers) < n:
+            idx = max(workers, default=-1) + 1
+            stop = ctx.Event()
+            p = ctx.Process(target=poller, args=(idx, cfg, stats, stop), daemon=True)
+            p.start()
+            workers[idx] = (p, stop)
+        while len(workers) > n:
+            idx = max(workers)
+            workers.pop(idx)[1].set()  # termina su batch en curso y sale
+
+    scale_to(args.min_concurrency)
+    start = time.monotonic()
+    totals = {"invocations": 0, "records": 0, "failed": 0, "dlq_moved": 0}
+    idle_since = None
+    try:
+        while True:
+            tick_end = time.monotonic() + args.report_every
+            tick = {"invocations": 0, "records": 0, "failed": 0, "dlq_moved": 0, "empty": 0, "full": 0, "ms": []}
+            while time.monotonic() < tick_end:
+                try:
+                    ev = stats.get(timeout=max(0.01, tick_end - time.monotonic()))
+                except queue.Empty:
+                    continue
+                if ev[0] == "empty":
+                    tick["empty"] += 1
+                    continue
+                _, idx, n, failed, ms, dead = ev
+                tick["dlq_moved"] += dead
+                if n:
+                    tick["invocations"] += 1
+                    tick["records"] += n
+                    tick["failed"] += failed
+                    tick["ms"].append(ms)
+                    tick["full"] += n >= args.batch_size
+            for k in totals:
+                totals[k] += tick[k]
+
+            visible, inflight_msgs = backlog(sqs, url)
+            done = tick["records"] - tick["failed"]
+            jlog(component="local-esm", status="tick", t=round(time.monotonic() - start, 1),
+                 concurrency=len(workers), invocations=tick["invocations"], records=tick["records"],
+                 failed=tick["failed"], dlq_moved=tick["dlq_moved"], backlog=visible, in_flight_msgs=inflight_msgs,
+                 dlq_depth=backlog(sqs, dlq_url)[0] if dlq_url else 0,
+                 drain_rate=round(done / args.report_every, 1),
+                 avg_ms=round(sum(tick["ms"]) / len(tick["ms"]), 1) if tick["ms"] else 0)
+
+            # escalado: como el poller de Lambda, sube de a uno mientras haya backlog y batches llenos,
+            # baja cuando los pollers vuelven vacíos
+            if visible > 0 and (tick["full"] or visible > len(workers) * args.batch_size):
+                scale_to(min(args.max_concurrency, len(workers) + args.scale_step))
+            elif tick["empty"] >= len(workers) and len(workers) > args.min_concurrency:
+                scale_to(len(workers) - 1)
+
+            if args.duration and time.monotonic() - start >= args.duration:
+                break
+            if args.until_empty:
+                idle_since = (idle_since or time.monotonic()) if visible + inflight_msgs == 0 else None
+                if idle_since and time.monotonic() - idle_since >= args.idle_s:
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scale_to(0)
+    elapsed = time.monotonic() - start
+    report = {"component": "local-esm", "status": "done", "elapsed_s": round(elapsed, 1), **totals,
+              "records_per_s": round((totals["records"] - totals["failed"]) / elapsed, 1) if elapsed else 0}
+    jlog(**report)
+    return report
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Event source mapping SQS -> handler en local")
+    p.add_argument("--queue", default="demo-thr")
+    p.add_argument("--queue-url")
+    p.add_argument("--handler", required=True, help="ruta/al/worker.py:handler")
+    p.add_argument("--name", help="function_name del contexto")
+    p.add_argument("--region", default=os.getenv("AWS_DEFAULT_REGION", "us-east-1"))
+    p.add_argument("--batch-size", type=int, default=10)
+    p.add_argument("--window", type=float, default=0, help="MaximumBatchingWindowInSeconds")
+    p.add_argument("--wait", type=int, default=20, help="WaitTimeSeconds del long-poll")
+    p.add_argument("--visibility-timeout", type=int, help="default: el de la cola")
+    p.add_argument("--max-receive", type=int, help="default: maxReceiveCount del RedrivePolicy de la cola")
+    p.add_argument("--dlq", help="nombre de la DLQ si la cola no tiene RedrivePolicy")
+    p.add_argument("--timeout", type=float, default=10, help="timeout de la función (segundos)")
+    p.add_argument("--min-concurrency", type=int, default=1)
+    p.add_argument("--max-concurrency", type=int, default=5)
+    p.add_argument("--scale-step", type=int, default=1)
+    p.add_argument("--report-every", type=float, default=1.0)
+    p.add_argument("--duration", type=float, default=0, help="segundos (0 = sin límite)")
+    p.add_argument("--until-empty", action="store_true", help="terminar cuando la cola queda vacía")
+    p.add_argument("--idle-s", type=float, default=3)
+    args = p.parse_args(argv)
+    args.min_concurrency = max(1, args.min_concurrency)
+    args.max_concurrency = max(args.min_concurrency, args.max_concurrency)
+    return args
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,365 @@
+# redrive.py
+# Redrive masivo de DLQs a su cola de origen (lo que hace /dlq/:dlq/retry del dashboard, pero de a miles).
+# Varios receptores por DLQ con long-poll de 10 mensajes; cada lote sale con SendMessageBatch y recién
+# los que llegaron se borran de la DLQ con DeleteMessageBatch (los que fallan quedan en la DLQ).
+# Filtros por correlationId / forceFail / antigüedad, --strip-force-fail para que no vuelvan a fallar,
+# tope de msgs/seg y checkpoint para retomar una corrida cortada sin reenviar lo ya enviado.
+#
+#   PYTHONPATH=Dashboard/src AWS_ENDPOINT_URL=http://localhost:4566 python3 Dashboard/scripts/redrive.py \
+#     --dlq demo-shipping-sqs-dlq --force-fail shipping --strip-force-fail --rate 50
+#   ... redrive.py                                            # las 4 DLQs de la demo, todo
+#   ... redrive.py --dlq demo-thr-dlq --min-age 600 --checkpoint /tmp/redrive.json --dry-run
+import argparse, json, os, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from utils.log import jlog
+from utils import runtime
+
+BATCH_MAX = 10  # tope de ReceiveMessage / SendMessageBatch / DeleteMessageBatch
+DLQS = ["demo-fulfill-sqs-dlq", "demo-analytics-sqs-dlq", "demo-shipping-sqs-dlq", "demo-thr-dlq"]
+
+
+# --- mensajes ---
+def unwrap(body):
+    """body -> (envelope SNS o None, dict de la orden); un body que no es JSON queda como {}."""
+    try:
+        msg = json.loads(body)
+    except ValueError:
+        return None, {}
+    if isinstance(msg, dict) and msg.get("Type") == "Notification" and isinstance(msg.get("Message"), str):
+        try:
+            inner = json.loads(msg["Message"])
+        except ValueError:
+            return None, {}
+        return msg, inner if isinstance(inner, dict) else {}
+    return None, msg if isinstance(msg, dict) else {}
+
+
+def strip_force_fail(body):
+    """Mismo body sin `forceFail` (dentro del envelope SNS si lo hay); None si no tenía."""
+    env, msg = unwrap(body)
+    if "forceFail" not in msg:
+        return None
+    msg = {k: v for k, v in msg.items() if k != "forceFail"}
+    if env is None:
+        return json.dumps(msg)
+    return json.dumps({**env, "Message": json.dumps(msg)})
+
+
+def age_s(m, msg, now):
+    """Antigüedad: sentAt/timestamp del body (alta original), si no SentTimestamp de SQS."""
+    ts = msg.get("sentAt") or msg.get("timestamp") or m.get("Attributes", {}).get("SentTimestamp")
+    try:
+        return now - float(ts) / 1000
+    except (TypeError, ValueError):
+        return None
+
+
+def matches(args, m, now):
+    _, msg = unwrap(m["Body"])
+    if args.cid and msg.get("correlationId") not in args.cid:
+        return False
+    if args.force_fail:
+        ff = args.force_fail.lower()
+        if ff == "any" and not msg.get("forceFail"):
+            return False
+        if ff == "none" and msg.get("forceFail"):
+            return False
+        if ff not in ("any", "none") and not runtime.should_fail(ff, msg):
+            return False
+    if args.min_age or args.max_age:
+        age = age_s(m, msg, now)
+        if age is None or age < args.min_age or (args.max_age and age > args.max_age):
+            return False
+    return True
+
+
+def send_attributes(m):
+    # el formato de ReceiveMessage trae campos que SendMessageBatch no acepta (StringListValues, ...)
+    keep = ("DataType", "StringValue", "BinaryValue")
+    return {k: {f: v[f] for f in keep if f in v} for k, v in m.get("MessageAttributes", {}).items()}
+
+
+# --- estado compartido ---
+class Checkpoint:
+    """Progreso por DLQ en un JSON: contadores y los messageId enviados pero todavía no borrados.
+
+    Se escribe antes de borrar: si la corrida se corta entre el envío y el borrado, al retomar
+    esos mensajes se borran de la DLQ sin reenviarlos.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def queue(self, dlq):
+        return self.state.setdefault(dlq, {"redriven": 0, "skipped": 0, "pending": []})
+
+    def is_pending(self, dlq, mid):
+        with self._lock:
+            return mid in self.queue(dlq)["pending"]
+
+    def sent(self, dlq, ids):
+        with self._lock:
+            q = self.queue(dlq)
+            q["pending"].extend(i for i in ids if i not in q["pending"])
+            self._save()
+
+    def deleted(self, dlq, ids, skipped=0):
+        with self._lock:
+            q = self.queue(dlq)
+            done = set(ids)
+            q["pending"] = [i for i in q["pending"] if i not in done]
+            q["redriven"] += len(done)
+            q["skipped"] += skipped
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        self.state["updatedAt"] = int(time.time() * 1000)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)  # atómico: un corte no deja el checkpoint a medio escribir
+
+
+class RateLimiter:
+    """Token bucket compartido por todos los receptores (msgs/seg; 0 = sin tope)."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def take(self, n):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + n / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.received = self.redriven = self.skipped = self.resumed = self.failed = self.calls = 0
+        self.claimed = 0  # cupo de --max ya tomado por los receptores
+        self.errors = {}
+
+    def add(self, **kw):
+        with self._lock:
+            for k, v in kw.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def claim(self, n, cap):
+        """Cuántos de `n` entran todavía en `cap` (0 = sin tope); los toma del cupo."""
+        with self._lock:
+            n = n if not cap else max(0, min(n, cap - self.claimed))
+            self.claimed += n
+            return n
+
+    def error(self, code, n=1):
+        with self._lock:
+            self.failed += n
+            self.errors[code] = self.errors.get(code, 0) + n
+
+
+# --- redrive ---
+def _code(e):
+    return getattr(e, "response", {}).get("Error", {}).get("Code") or type(e).__name__
+
+
+def source_queue(sqs, dlq_url, dlq):
+    """Cola de origen de la DLQ: la que la tiene en su RedrivePolicy; si no, el nombre sin "-dlq"."""
+    try:
+        urls = sqs.list_dead_letter_source_queues(QueueUrl=dlq_url).get("queueUrls", [])
+    except Exception:
+        urls = []
+    if len(urls) == 1:
+        return urls[0]
+    return sqs.get_queue_url(QueueName=dlq[: -len("-dlq")] if dlq.endswith("-dlq") else dlq)["QueueUrl"]
+
+
+def _delete(sqs, url, msgs):
+    """-> messageIds borrados."""
+    if not msgs:
+        return []
+    res = sqs.delete_message_batch(
+        QueueUrl=url, Entries=[{"Id": str(i), "ReceiptHandle": m["ReceiptHandle"]} for i, m in enumerate(msgs)]
+    )
+    return [msgs[int(e["Id"])]["MessageId"] for e in res.get("Successful", [])]
+
+
+def redrive_batch(args, sqs, q, msgs, ckpt, limiter, stats):
+    """Un lote recibido: filtra, reenvía a la cola de origen y borra de la DLQ sólo lo que llegó."""
+    now = time.time()
+    # ya enviados en una corrida anterior (checkpoint): sólo falta borrarlos
+    resumed = [m for m in msgs if ckpt.is_pending(q["dlq"], m["MessageId"])]
+    resumed_ids = {m["MessageId"] for m in resumed}
+    todo = [m for m in msgs if m["MessageId"] not in resumed_ids and matches(args, m, now)]
+    skipped = len(msgs) - len(resumed) - len(todo)
+    stats.add(received=len(msgs), skipped=skipped, resumed=len(resumed))
+    # con --max entre varios receptores: cada lote toma su parte del cupo antes de enviar
+    todo = todo[: stats.claim(len(todo), args.max)]
+    if args.dry_run:
+        stats.add(redriven=len(todo))
+        return
+    sent = []
+    if todo:
+        limiter.take(len(todo))
+        entries = []
+        for i, m in enumerate(todo):
+            e = {"Id": str(i), "MessageBody": (args.strip_force_fail and strip_force_fail(m["Body"])) or m["Body"]}
+            attrs = send_attributes(m)
+            if attrs:
+                e["MessageAttributes"] = attrs
+            entries.append(e)
+        try:
+            res = sqs.send_message_batch(QueueUrl=q["source_url"], Entries=entries)
+            sent = [todo[int(e["Id"])] for e in res.get("Successful", [])]
+            for f in res.get("Failed", []):
+                stats.error(f.get("Code", "Failed"))
+        except Exception as e:
+            stats.error(_code(e), len(todo))
+        stats.add(calls=1, claimed=len(sent) - len(todo))  # lo no enviado devuelve el cupo
+    # los que no se reenviaron quedan en la DLQ (vuelven a verse cuando vence el visibility timeout)
+    ckpt.sent(q["dlq"], [m["MessageId"] for m in sent])
+    try:
+        deleted = _delete(sqs, q["url"], sent + resumed)
+    except Exception as e:
+        stats.error(_code(e), len(sent + resumed))
+        deleted = []
+    ckpt.deleted(q["dlq"], deleted, skipped=skipped)
+    stats.add(redriven=len(set(deleted) - resumed_ids))
+
+
+def receiver(args, sqs, q, ckpt, limiter, stats, stop):
+    """Long-poll de a 10 hasta que la DLQ no devuelve nada nuevo (--idle-polls seguidos) o --max."""
+    idle = 0
+    while not stop.is_set() and idle < args.idle_polls:
+        try:
+            res = sqs.receive_message(
+                QueueUrl=q["url"],
+                MaxNumberOfMessages=BATCH_MAX,
+                WaitTimeSeconds=args.wait,
+                VisibilityTimeout=args.visibility_timeout,
+                AttributeNames=["All"],
+                MessageAttributeNames=["All"],
+            )
+        except Exception as e:
+            stats.error(_code(e))
+            idle += 1
+            time.sleep(1)
+            continue
+        # los que no pasan el filtro (o tardaron más que el visibility) reaparecen: no cuentan
+        # como nuevos ni se reenvían dos veces, aunque los reciba otro receptor
+        with q["lock"]:
+            msgs = [m for m in res.get("Messages", []) if m["MessageId"] not in q["seen"]]
+            q["seen"].update(m["MessageId"] for m in msgs)
+        if not msgs:
+            idle += 1
+            continue
+        idle = 0
+        redrive_batch(args, sqs, q, msgs, ckpt, limiter, stats)
+        if args.max and stats.claimed >= args.max:
+            stop.set()
+
+
+def run(args):
+    sqs = runtime.client("sqs", region_name=args.region)
+    queues = []
+    for dlq in args.dlq:
+        try:
+            url = sqs.get_queue_url(QueueName=dlq)["QueueUrl"]
+        except sqs.exceptions.QueueDoesNotExist:
+            jlog(component="redrive", status="missing-queue", dlq=dlq)
+            continue
+        src = args.to_url or (args.to and sqs.get_queue_url(QueueName=args.to)["QueueUrl"]) or source_queue(sqs, url, dlq)
+        queues.append({"dlq": dlq, "url": url, "source_url": src, "seen": set(), "lock": threading.Lock()})
+        jlog(component="redrive", status="start", dlq=dlq, source=src, receivers=args.receivers, rate=args.rate,
+             dry_run=args.dry_run)
+
+    ckpt = Checkpoint(args.checkpoint)
+    limiter = RateLimiter(args.rate)
+    stats = Stats()
+    stop = threading.Event()
+    start = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=max(1, len(queues) * args.receivers), thread_name_prefix="redrive")
+    futures = [
+        pool.submit(receiver, args, sqs, q, ckpt, limiter, stats, stop) for q in queues for _ in range(args.receivers)
+    ]
+    try:
+        while not all(f.done() for f in futures):
+            time.sleep(1)
+            jlog(component="redrive", status="progress", t=int(time.monotonic() - start), received=stats.received,
+                 redriven=stats.redriven, skipped=stats.skipped, failed=stats.failed)
+    except KeyboardInterrupt:
+        # los lotes en curso terminan (envío + borrado + checkpoint) antes de salir
+        stop.set()
+    pool.shutdown(wait=True)
+    for f in futures:
+        if f.exception() is not None:
+            stats.error(type(f.exception()).__name__)
+            jlog(component="redrive", status="receiver-error", error=str(f.exception()))
+
+    elapsed = time.monotonic() - start
+    report = {
+        "component": "redrive",
+        "status": "done",
+        "dlqs": [q["dlq"] for q in queues],
+        "dry_run": args.dry_run,
+        "elapsed_s": round(elapsed, 2),
+        "received": stats.received,
+        "redriven": stats.redriven,
+        "skipped": stats.skipped,
+        "resumed": stats.resumed,
+        "failed": stats.failed,
+        "errors": stats.errors,
+        "send_calls": stats.calls,
+        "achieved_rate": round(stats.redriven / elapsed, 1) if elapsed else 0,
+        "checkpoint": args.checkpoint,
+    }
+    jlog(**report)
+    return report
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Redrive de DLQs a su cola de origen")
+    p.add_argument("--dlq", type=lambda s: s.split(","), default=DLQS, help="DLQs separadas por coma")
+    p.add_argument("--to", help="cola destino (por defecto la de origen de cada DLQ)")
+    p.add_argument("--to-url")
+    p.add_argument("--region", default=os.getenv("AWS_DEFAULT_REGION", "us-east-1"))
+    p.add_argument("--receivers", type=int, default=4, help="receptores concurrentes por DLQ")
+    p.add_argument("--wait", type=int, default=2, help="segundos de long-poll")
+    p.add_argument("--idle-polls", type=int, default=2, help="polls vacíos seguidos para dar la DLQ por drenada")
+    p.add_argument("--visibility-timeout", type=int, default=60,
+                   help="los que no pasan el filtro quedan ocultos este tiempo")
+    p.add_argument("--rate", type=float, default=0, help="tope de msgs/seg reenviados (0 = sin tope)")
+    p.add_argument("--max", type=int, default=0, help="corta después de N reenviados")
+    p.add_argument("--cid", type=lambda s: set(s.split(",")), help="sólo estos correlationId (separados por coma)")
+    p.add_argument("--force-fail", help="any | none | <servicio>: filtra por forceFail del mensaje")
+    p.add_argument("--min-age", type=float, default=0, help="sólo mensajes con al menos N segundos")
+    p.add_argument("--max-age", type=float, default=0, help="sólo mensajes con a lo sumo N segundos (0 = sin tope)")
+    p.add_argument("--strip-force-fail", action="store_true", help="reenvía sin forceFail (no vuelven a fallar)")
+    p.add_argument("--checkpoint", help="JSON de progreso para retomar una corrida cortada")
+    p.add_argument("--dry-run", action="store_true", help="sólo cuenta lo que se reenviaría")
+    args = p.parse_args(argv)
+    if (args.to or args.to_url) and len(args.dlq) > 1:
+        p.error("--to/--to-url sólo con una --dlq")
+    args.receivers = max(1, args.receivers)
+    args.wait = max(0, min(20, args.wait))
+    # el pool HTTP del cliente tiene que alcanzar para todos los receptores
+    os.environ.setdefault("AWS_MAX_POOL_CONNECTIONS", str(max(16, len(args.dlq) * args.receivers)))
+    return args
+
+
+if __name__ == "__main__":
+    report = run(parse_args())
+    sys.exit(1 if report["failed"] else 0)
@@ -13,9 +13,12 @@ if [[ -z "${TOPIC_ARN:-}" || "${TOPIC_ARN}" == "None" ]]; then
   TOPIC_ARN="$(awslocal sns create-topic --name "${TOPIC_NAME}" --query TopicArn --output text)"
 fi
 
-# --- CID portable ---
+# --- CID portable (ULID de utils/ids.py si hay python: ordena por tiempo) ---
+SRC_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/../src" && pwd)"
 cid() {
-  if command -v uuidgen >/dev/null 2>&1; then
+  if command -v python3 >/dev/null 2>&1; then
+    PYTHONPATH="$SRC_DIR" python3 -c 'from utils.ids import ulid; print(ulid())'
+  elif command -v uuidgen >/dev/null 2>&1; then
     uuidgen | tr '[:upper:]' '[:lower:]'
   elif command -v openssl >/dev/null 2>&1; then
     openssl rand -hex 16
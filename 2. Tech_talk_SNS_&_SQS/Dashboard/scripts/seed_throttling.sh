@@ -1,7 +1,7 @@
 #!/usr/bin/env bash
 set -euo pipefail
-URL=$(awslocal sqs get-queue-url --queue-name demo-thr --query QueueUrl --output text)
-for i in $(seq 1 100); do
-  awslocal sqs send-message --queue-url "$URL" --message-body "msg-$i"
-done
-echo "100 messages sent"
\ No newline at end of file
+# 100 mensajes a demo-thr con SendMessageBatch (antes: 100 `awslocal sqs send-message` en serie)
+# para más carga: make load-thr RATE=... DURATION=... PROFILE=constant|ramp|burst
+cd "$(dirname "$0")/.."
+PYTHONPATH=src AWS_ENDPOINT_URL="${AWS_ENDPOINT_URL:-http://localhost:4566}" \
+  python3 scripts/loadgen.py sqs --queue demo-thr --count "${COUNT:-100}" --rate "${RATE:-200}" --duration 0
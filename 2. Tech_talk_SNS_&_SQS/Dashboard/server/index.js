@@ -2,6 +2,7 @@
 const express = require('express');
 const cors = require('cors');
 const crypto = require('crypto');
+const zlib = require('zlib');
 
 const {
   SQSClient,
@@ -72,8 +73,100 @@ app.use((req, _res, next) => {
 });
 
 // ----------------------- Helpers ---------------------
+// ULID monótono (mismo formato que Dashboard/src/utils/ids.py): 26 caracteres que ordenan
+// por tiempo, así traces/{cid}/ y orders/{orderId} se pueden listar por rango (StartAfter)
+const ULID_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ';
+let ulidLastMs = -1;
+let ulidLastRand = 0n;
+
+function encodeBase32(n, len) {
+  let out = '';
+  for (let i = 0; i < len; i++) {
+    out = ULID_ALPHABET[Number(n & 31n)] + out;
+    n >>= 5n;
+  }
+  return out;
+}
+
+function ulidSeed() {
+  // bit alto en 0: margen para incrementar dentro del mismo ms
+  return BigInt('0x' + crypto.randomBytes(10).toString('hex')) >> 1n;
+}
+
+function ulid() {
+  const ms = Date.now();
+  if (ms > ulidLastMs) {
+    ulidLastMs = ms;
+    ulidLastRand = ulidSeed();
+  } else if (++ulidLastRand >> 80n) {
+    ulidLastMs += 1;
+    ulidLastRand = ulidSeed();
+  }
+  return encodeBase32((BigInt(ulidLastMs) << 80n) | ulidLastRand, 26);
+}
+
+function ulidTimePrefix(ms) {
+  return encodeBase32(BigInt(Math.max(0, Math.floor(ms))), 10);
+}
+
 function uuid() {
-  return crypto.randomUUID();
+  return ulid();
+}
+
+// layout de keys de alto ritmo (mismo que Dashboard/src/utils/keys.py)
+// "flat": traces/{cid}/..., orders/{id}.json | "hashed": traces/{shard}/{cid}/..., orders/{shard}/{id}.json
+// con "hashed" los listados de esos prefijos se hacen por shard, en paralelo
+const KEY_LAYOUT = (process.env.KEY_LAYOUT || 'flat').toLowerCase();
+const KEY_SHARDS = Number(process.env.KEY_SHARDS || 16);
+const SHARD_WIDTH = Math.max(KEY_SHARDS - 1, 1).toString(16).length;
+const SHARDED_BASE = /^(traces|orders|analytics\/[^/]+|shipping\/[^/]+)\/$/;
+
+function shardOf(id, shards = KEY_SHARDS) {
+  const width = Math.max(shards - 1, 1).toString(16).length;
+  const h = crypto.createHash('md5').update(String(id)).digest('hex');
+  return (parseInt(h.slice(0, 8), 16) % shards).toString(16).padStart(width, '0');
+}
+
+function shardPrefixes(base) {
+  if (KEY_LAYOUT !== 'hashed' || !SHARDED_BASE.test(base)) return [base];
+  return Array.from({ length: KEY_SHARDS }, (_, n) =>
+    `${base}${n.toString(16).padStart(SHARD_WIDTH, '0')}/`
+  );
+}
+
+function tracePrefix(cid, layout = KEY_LAYOUT) {
+  return layout === 'hashed' ? `traces/${shardOf(cid)}/${cid}/` : `traces/${cid}/`;
+}
+
+function traceKey(cid, step, layout = KEY_LAYOUT) {
+  return `${tracePrefix(cid, layout)}${step}.json`;
+}
+
+// traces/{cid}/{step}.json o traces/{shard}/{cid}/{step}.json -> { cid, step } (null si no es un paso)
+function parseTraceKey(key) {
+  let parts = key.split('/');
+  if (parts.length === 4 && parts[1].length === SHARD_WIDTH && /^[0-9a-f]+$/.test(parts[1]))
+    parts = [parts[0], ...parts.slice(2)];
+  if (parts.length !== 3 || parts[1].startsWith('_') || !parts[2].endsWith('.json')) return null;
+  return { cid: parts[1], step: parts[2].slice(0, -'.json'.length) };
+}
+
+// fan-in: lista cada shard del prefijo en paralelo
+async function listSharded(base, lister = listAllKeys) {
+  return (await Promise.all(shardPrefixes(base).map((p) => lister(p)))).flat();
+}
+
+// keys de un cid: un solo List (el shard sale del cid); si no hay, el prefijo del otro layout
+async function listTrace(cid) {
+  const keys = await listKeys(tracePrefix(cid));
+  if (keys.length) return keys;
+  return listKeys(tracePrefix(cid, KEY_LAYOUT === 'hashed' ? 'flat' : 'hashed'));
+}
+
+async function getTraceJson(cid, step) {
+  const obj = await getJsonOr(traceKey(cid, step), null);
+  if (obj != null) return obj;
+  return getJsonOr(traceKey(cid, step, KEY_LAYOUT === 'hashed' ? 'flat' : 'hashed'), null);
 }
 
 async function ensureBucket(name) {
@@ -103,18 +196,138 @@ async function listKeys(prefix) {
   return (out.Contents || []).map((o) => o.Key);
 }
 
+// igual que listKeys pero pagina (sin el tope de 1000 keys)
+async function listAllKeys(prefix, startAfter) {
+  const keys = [];
+  let token;
+  do {
+    const out = await s3.send(
+      new ListObjectsV2Command({
+        Bucket: DATA_BUCKET,
+        Prefix: prefix,
+        StartAfter: token ? undefined : startAfter,
+        ContinuationToken: token,
+      })
+    );
+    for (const o of out.Contents || []) keys.push(o.Key);
+    token = out.IsTruncated ? out.NextContinuationToken : undefined;
+  } while (token);
+  return keys;
+}
+
+// keys {prefix}{ULID}... desde sinceMs: arranca el listado ahí en vez de recorrer todo el prefijo
+async function listKeysSince(prefix, sinceMs) {
+  const keys = [];
+  let token;
+  do {
+    const out = await s3.send(
+      new ListObjectsV2Command({
+        Bucket: DATA_BUCKET,
+        Prefix: prefix,
+        StartAfter: token ? undefined : prefix + ulidTimePrefix(sinceMs),
+        ContinuationToken: token,
+      })
+    );
+    for (const o of out.Contents || []) {
+      // '_index', '_segments', etc. ordenan después de los ULID: no son ids
+      if (ULID_ALPHABET.includes(o.Key.charAt(prefix.length))) keys.push(o.Key);
+    }
+    token = out.IsTruncated ? out.NextContinuationToken : undefined;
+  } while (token);
+  return keys;
+}
+
+// decoder de MessagePack (el subconjunto que escribe msgpack de Python: nil/bool/int/float/str/bin/array/map)
+function msgpackDecode(buf) {
+  let pos = 0;
+  const u = (n) => {
+    let v = 0;
+    for (let i = 0; i < n; i++) v = v * 256 + buf[pos++];
+    return v;
+  };
+  const i = (n) => {
+    const v = n === 1 ? buf.readInt8(pos) : n === 2 ? buf.readInt16BE(pos) : n === 4 ? buf.readInt32BE(pos) : Number(buf.readBigInt64BE(pos));
+    pos += n;
+    return v;
+  };
+  const str = (n) => buf.toString('utf8', pos, (pos += n));
+  const arr = (n) => Array.from({ length: n }, () => read());
+  const map = (n) => {
+    const o = {};
+    for (let k = 0; k < n; k++) o[read()] = read();
+    return o;
+  };
+  function read() {
+    const b = buf[pos++];
+    if (b <= 0x7f) return b;
+    if (b >= 0xe0) return b - 0x100;
+    if ((b & 0xf0) === 0x80) return map(b & 0x0f);
+    if ((b & 0xf0) === 0x90) return arr(b & 0x0f);
+    if ((b & 0xe0) === 0xa0) return str(b & 0x1f);
+    switch (b) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: case 0xc5: case 0xc6: { const n = u(1 << (b - 0xc4)); return buf.subarray(pos, (pos += n)); }
+      case 0xca: { const v = buf.readFloatBE(pos); pos += 4; return v; }
+      case 0xcb: { const v = buf.readDoubleBE(pos); pos += 8; return v; }
+      case 0xcc: return u(1);
+      case 0xcd: return u(2);
+      case 0xce: return u(4);
+      case 0xcf: { const v = Number(buf.readBigUInt64BE(pos)); pos += 8; return v; }
+      case 0xd0: return i(1);
+      case 0xd1: return i(2);
+      case 0xd2: return i(4);
+      case 0xd3: return i(8);
+      case 0xd9: return str(u(1));
+      case 0xda: return str(u(2));
+      case 0xdb: return str(u(4));
+      case 0xdc: return arr(u(2));
+      case 0xdd: return arr(u(4));
+      case 0xde: return map(u(2));
+      case 0xdf: return map(u(4));
+      default: throw new Error(`msgpack: tipo 0x${b.toString(16)} no soportado`);
+    }
+  }
+  return read();
+}
+
+// cuerpo de un GetObject -> objeto: JSON plano, gzip (Content-Encoding o magic) o MessagePack
+// (mismos formatos que Dashboard/src/utils/codec.py)
+async function decodeBody(obj) {
+  let buf = Buffer.from(await obj.Body.transformToByteArray());
+  if ((obj.ContentEncoding || '').toLowerCase() === 'gzip' || (buf[0] === 0x1f && buf[1] === 0x8b))
+    buf = zlib.gunzipSync(buf);
+  if (/^application\/(x-)?msgpack/.test(obj.ContentType || '')) return msgpackDecode(buf);
+  return JSON.parse(buf.toString('utf8'));
+}
+
 async function getJsonOr(key, fallback) {
   try {
     const obj = await s3.send(
       new GetObjectCommand({ Bucket: DATA_BUCKET, Key: key })
     );
-    const txt = await obj.Body.transformToString();
-    return JSON.parse(txt);
+    return await decodeBody(obj);
   } catch {
     return fallback;
   }
 }
 
+// reemplaza los {"$ref": key, "path"?} (TRACE_PAYLOADS=ref) por el contenido referido
+async function resolveRefs(value, load) {
+  if (Array.isArray(value)) return Promise.all(value.map((v) => resolveRefs(v, load)));
+  if (!value || typeof value !== 'object') return value;
+  const ks = Object.keys(value);
+  if (typeof value.$ref === 'string' && ks.every((k) => k === '$ref' || k === 'path')) {
+    const out = await load(value.$ref);
+    if (out == null) return value;
+    return value.path && typeof out === 'object' ? out[value.path] ?? value : out;
+  }
+  const o = {};
+  for (const k of ks) o[k] = await resolveRefs(value[k], load);
+  return o;
+}
+
 async function putJson(key, obj) {
   await s3.send(
     new PutObjectCommand({
@@ -268,11 +481,103 @@ async function recordReplenishment({
   return obj;
 }
 
+// trazas en segmentos NDJSON (workers con TRACE_SINK=segment)
+// y segmentos compactados (workers/compaction/trace_compactor.py)
+// índice global cid -> segmentos, por día del ULID del cid y hash (mismo que utils/trace_store.py):
+// traces/_index/cids/dt=YYYY-MM-DD/{shard}.json. Lo mantiene el compactador, que también junta
+// los índices pendientes de los workers
+const TRACE_INDEX_SHARDS = Number(process.env.TRACE_INDEX_SHARDS || 16);
+const CID_INDEX_PREFIX = 'traces/_index/cids/';
+const PENDING_INDEX_PREFIX = 'traces/_index/pending/';
+const DAY_MS = 24 * 3600 * 1000;
+
+// ms del ULID del cid (acepta prefijo) o null si no es un ULID
+function cidTimeMs(cid) {
+  const tail = String(cid).slice(-26).toUpperCase();
+  if (tail.length < 26 || [...tail].some((c) => !ULID_ALPHABET.includes(c))) return null;
+  let n = 0;
+  for (const c of tail.slice(0, 10)) n = n * 32 + ULID_ALPHABET.indexOf(c);
+  return n;
+}
+
+function dayOf(ms) {
+  const d = new Date(ms);
+  // mismo rango que datetime en Python (años 1..9999)
+  return Number.isNaN(d.getTime()) || d.getUTCFullYear() > 9999 ? null : d.toISOString().slice(0, 10);
+}
+
+function cidIndexKey(cid) {
+  const ms = cidTimeMs(cid);
+  const day = (ms != null && dayOf(ms)) || 'none';
+  return `${CID_INDEX_PREFIX}dt=${day}/${shardOf(cid, TRACE_INDEX_SHARDS)}.json`;
+}
+
+// shards del índice; con sinceMs sólo los días desde ahí (más los cids sin fecha)
+async function cidIndexKeys(sinceMs = null) {
+  const all = (await listAllKeys(CID_INDEX_PREFIX)).filter((k) => k.endsWith('.json'));
+  if (sinceMs == null) return all;
+  const from = `${CID_INDEX_PREFIX}dt=${dayOf(sinceMs)}`;
+  return all.filter((k) => k >= from || k.startsWith(`${CID_INDEX_PREFIX}dt=none/`));
+}
+
+// índice: cid -> [{ segment, offset, length, steps }]
+// { cid }: sólo ese cid (un GET de su shard) | { pendingOnly }: sólo lo que el compactador no juntó
+// (lo ya juntado está en traces/_index/counters.json) | { sinceMs }: sólo shards desde ese día
+async function loadSegmentIndex({ cid = null, pendingOnly = false, sinceMs = null } = {}) {
+  const byCid = new Map();
+  const add = (c, ent) => {
+    if (cid != null && c !== cid) return;
+    const arr = byCid.get(c) || [];
+    if (!arr.some((e) => e.segment === ent.segment)) arr.push(ent);
+    byCid.set(c, arr);
+  };
+  // primero los pendientes: el compactador escribe el shard antes de borrarlos.
+  // Un segmento es posterior al cid: se lista desde el día anterior (margen de reloj)
+  const fromMs = cid != null ? cidTimeMs(cid) : sinceMs;
+  const fromDay = fromMs != null ? dayOf(fromMs - DAY_MS) : null;
+  const pending = (
+    await listAllKeys(PENDING_INDEX_PREFIX, fromDay ? `${PENDING_INDEX_PREFIX}dt=${fromDay}` : undefined)
+  ).filter((k) => k.endsWith('.idx.json'));
+  for (const idx of await Promise.all(pending.map((k) => getJsonOr(k, null)))) {
+    if (!idx) continue;
+    for (const [c, ent] of Object.entries(idx.cids || {})) add(c, { segment: idx.segment, ...ent });
+  }
+  if (pendingOnly) return byCid;
+  const shardKeys = cid != null ? [cidIndexKey(cid)] : await cidIndexKeys(sinceMs);
+  for (const doc of await Promise.all(shardKeys.map((k) => getJsonOr(k, null))))
+    for (const [c, ents] of Object.entries(doc?.cids || {})) for (const ent of ents) add(c, ent);
+  return byCid;
+}
+
+// keys "virtuales" (traceKey) para que la vista por cid no cambie
+function segmentTraceKeys(byCid) {
+  const out = [];
+  for (const [cid, ents] of byCid)
+    for (const e of ents) for (const st of e.steps) out.push(traceKey(cid, st));
+  return out;
+}
+
+// lee sólo las líneas del cid (GET con Range)
+async function readSegmentSteps(ent) {
+  const obj = await s3.send(
+    new GetObjectCommand({
+      Bucket: DATA_BUCKET,
+      Key: ent.segment,
+      Range: `bytes=${ent.offset}-${ent.offset + ent.length - 1}`,
+    })
+  );
+  const txt = await obj.Body.transformToString();
+  return txt
+    .split('\n')
+    .filter(Boolean)
+    .map((l) => JSON.parse(l));
+}
+
 // helper: lee el 00-published
 async function getPublished(cid) {
-  const obj = await s3.send(new GetObjectCommand({ Bucket: DATA_BUCKET, Key: `traces/${cid}/00-published.json` }));
-  const body = await obj.Body.transformToString();
-  return JSON.parse(body).message || JSON.parse(body);
+  const obj = await getTraceJson(cid, '00-published');
+  if (obj == null) throw new Error(`sin 00-published para ${cid}`);
+  return obj.message || obj;
 }
 
 
@@ -354,9 +659,12 @@ app.get('/queues', async (_req, res) => {
 });
 
 // listar archivos S3
+// ?since=<ms> => sólo keys con ULID desde ese momento (ej. prefix=orders/)
 app.get('/files', async (req, res) => {
   const prefix = String(req.query.prefix || '');
-  const keys = await listKeys(prefix);
+  const keys = req.query.since
+    ? await listSharded(prefix, (p) => listKeysSince(p, Number(req.query.since)))
+    : await listSharded(prefix, listKeys);
   keys.sort((a, b) => (a < b ? -1 : 1));
   res.json(keys.slice(-150));
 });
@@ -369,6 +677,9 @@ app.get('/file', async (req, res) => {
     const obj = await s3.send(
       new GetObjectCommand({ Bucket: DATA_BUCKET, Key: key })
     );
+    // gzip / MessagePack (ARTIFACT_ENCODING): se devuelve el JSON decodificado
+    if (obj.ContentEncoding === 'gzip' || /msgpack/.test(obj.ContentType || ''))
+      return res.json(await decodeBody(obj));
     res.setHeader(
       'Content-Type',
       obj.ContentType || 'application/octet-stream'
@@ -380,13 +691,31 @@ app.get('/file', async (req, res) => {
 });
 
 // trazas (resumen por CID)
-app.get('/traces', async (_req, res) => {
-  const keys = await listKeys('traces/');
-  const ids = [...new Set(keys.map((k) => k.split('/')[1]).filter(Boolean))];
+// ?since=<ms> => sólo trazas con correlationId (ULID) desde ese momento
+app.get('/traces', async (req, res) => {
+  const since = req.query.since ? Number(req.query.since) : null;
+  const keys =
+    since != null
+      ? await listSharded('traces/', (p) => listKeysSince(p, since))
+      : await listSharded('traces/');
+  const segs = await loadSegmentIndex({ sinceMs: since });
+  if (since != null) {
+    const from = ulidTimePrefix(since);
+    for (const id of [...segs.keys()]) if (id < from) segs.delete(id);
+  }
+  const ids = [
+    ...new Set([
+      ...keys.map((k) => parseTraceKey(k)?.cid).filter(Boolean),
+      ...segs.keys(),
+    ]),
+  ];
   const out = [];
   for (const id of ids) {
-    const child = await listKeys(`traces/${id}/`);
-    const names = child.map((k) => k.split('/').pop());
+    const child = await listTrace(id);
+    const names = [
+      ...child,
+      ...segmentTraceKeys(new Map([[id, segs.get(id) || []]])),
+    ].map((k) => k.split('/').pop());
     out.push({
       id,
       published: names.includes('00-published.json'),
@@ -403,10 +732,23 @@ app.get('/traces', async (_req, res) => {
 
 app.get('/trace/:id', async (req, res) => {
   const id = req.params.id;
-  const child = await listKeys(`traces/${id}/`);
-  const keys = child.sort();
+  const child = await listTrace(id);
+  const byKey = new Map();
+  for (const k of child) byKey.set(k, await getJsonOr(k, null));
+  const segs = (await loadSegmentIndex({ cid: id })).get(id) || [];
+  for (const ent of segs)
+    for (const rec of await readSegmentSteps(ent))
+      byKey.set(traceKey(id, rec.step), rec.data);
+  // $ref: primero los pasos ya leídos (pueden estar compactados), después S3
+  const cache = new Map();
+  const load = async (k) => {
+    if (byKey.has(k)) return byKey.get(k);
+    if (!cache.has(k)) cache.set(k, await getJsonOr(k, null));
+    return cache.get(k);
+  };
   const steps = [];
-  for (const k of keys) steps.push({ key: k, data: await getJsonOr(k, null) });
+  for (const k of [...byKey.keys()].sort())
+    steps.push({ key: k, data: await resolveRefs(byKey.get(k), load) });
 
   const wantsHtml =
     req.query.format === 'html' ||
@@ -428,7 +770,7 @@ app.get('/trace/:id', async (req, res) => {
 // payload publicado (para reproducir en Visualizer por cid)
 app.get('/trace/:id/published', async (req, res) => {
   const id = req.params.id;
-  const obj = await getJsonOr(`traces/${id}/00-published.json`, null);
+  const obj = await getTraceJson(id, '00-published');
   const payload = obj?.message ?? obj;
   if (!payload) return res.status(404).json({ error: 'not found' });
   res.json(payload);
@@ -464,11 +806,11 @@ app.post('/seed/fanout-trace', async (_req, res) => {
   for (const e of events) {
     const correlationId = uuid();
     const orderId = uuid();
-    await putJson(`traces/${correlationId}/00-published.json`, {
+    await putJson(traceKey(correlationId, '00-published'), {
       t: Date.now(),
       message: { orderId, ...e, correlationId },
     });
-    await putJson(`traces/${correlationId}/01-routes.json`, {
+    await putJson(traceKey(correlationId, '01-routes'), {
       fulfillment: ['OrderPlaced', 'OrderUpdated'].includes(e.eventType),
       analytics:
         ['OrderPlaced', 'OrderShipped'].includes(e.eventType) &&
@@ -523,12 +865,12 @@ app.post('/replay/:cid', async (req, res) => {
 
   await s3.send(new PutObjectCommand({
     Bucket: DATA_BUCKET,
-    Key: `traces/${newCid}/00-published.json`,
+    Key: traceKey(newCid, '00-published'),
     Body: Buffer.from(JSON.stringify({ t: Date.now(), message: msg })),
   }));
   await s3.send(new PutObjectCommand({
     Bucket: DATA_BUCKET,
-    Key: `traces/${newCid}/01-routes.json`,
+    Key: traceKey(newCid, '01-routes'),
     Body: Buffer.from(JSON.stringify(routes)),
   }));
 
@@ -550,12 +892,8 @@ app.get('/published/:cid', async (req, res) => {
 
   // 1) intento directo: 00-published.json
   try {
-    const obj = await s3.send(new GetObjectCommand({
-      Bucket: DATA_BUCKET,
-      Key: `traces/${cid}/00-published.json`
-    }));
-    const body = await obj.Body.transformToString();
-    const parsed = JSON.parse(body);
+    const parsed = await getTraceJson(cid, '00-published');
+    if (parsed == null) throw new Error('sin 00-published');
     const msg = parsed?.message ?? parsed;
     return res.json({ ok: true, cid, message: msg });
   } catch (_) {
@@ -564,10 +902,7 @@ app.get('/published/:cid', async (req, res) => {
 
   // 2) fallback: mirar /trace/:cid y buscar el mejor paso disponible
   try {
-    const d = await s3.send(new ListObjectsV2Command({
-      Bucket: DATA_BUCKET, Prefix: `traces/${cid}/`
-    }));
-    const keys = (d.Contents || []).map(o => o.Key).sort();
+    const keys = (await listTrace(cid)).sort();
     if (!keys.length) return res.status(404).json({ ok:false, error:'CID sin traces' });
 
     // prioridad: 00-published → cualquiera con "-received" → cualquiera con "processed" → el primero
@@ -580,8 +915,7 @@ app.get('/published/:cid', async (req, res) => {
     if (!key) return res.status(404).json({ ok:false, error:'Sin artefactos JSON' });
 
     const obj = await s3.send(new GetObjectCommand({ Bucket: DATA_BUCKET, Key: key }));
-    const body = await obj.Body.transformToString();
-    const data = JSON.parse(body);
+    const data = await decodeBody(obj);
 
     // intel para extraer mensaje:
     // - si vino como { message: {...} } lo usamos
@@ -620,11 +954,11 @@ app.post('/seed/custom', async (req, res) => {
     correlationId: cId,
     ...payload,
   };
-  await putJson(`traces/${cId}/00-published.json`, {
+  await putJson(traceKey(cId, '00-published'), {
     t: Date.now(),
     message: msg,
   });
-  await putJson(`traces/${cId}/01-routes.json`, {
+  await putJson(traceKey(cId, '01-routes'), {
     fulfillment: ['OrderPlaced', 'OrderUpdated'].includes(eventType),
     analytics:
       ['OrderPlaced', 'OrderShipped'].includes(eventType) &&
@@ -756,8 +1090,50 @@ app.post('/domain/replenishments/create', async (req, res) => {
   res.json({ ok: true, replenishment: obj });
 });
 
+// rollups de analytics_worker con ROLLUP_STORE=s3: un objeto por hora con totales por producto.
+// Con ROLLUP_STORE=dynamodb (default) no hay objetos acá y /domain/metrics cae al escaneo de analytics/.
+async function loadRollups() {
+  const keys = await listAllKeys('rollups/analytics/');
+  const docs = await Promise.all(keys.map((k) => getJsonOr(k, null)));
+  return docs.filter(Boolean);
+}
+
 // inventario: Actualizo inventario
-app.get('/domain/metrics', async (_req, res) => {
+// ?by=bucket => serie por hora ({ bucket, products: [...] })
+app.get('/domain/metrics', async (req, res) => {
+  const rollups = await loadRollups();
+  if (rollups.length) {
+    const row = (id, t) => ({
+      productId: id,
+      unitsSold: Number(t.quantity || 0),
+      totalRevenue: Number(t.revenue || 0),
+      orders: Number(t.count || 0),
+    });
+    if (req.query.by === 'bucket') {
+      return res.json(
+        rollups
+          .sort((a, b) => String(a.bucket).localeCompare(String(b.bucket)))
+          .map((d) => ({
+            bucket: d.bucket,
+            products: Object.entries(d.products || {}).map(([id, t]) => row(id, t)),
+          }))
+      );
+    }
+    const agg = new Map();
+    for (const d of rollups) {
+      for (const [id, t] of Object.entries(d.products || {})) {
+        const cur = agg.get(id) || row(id, {});
+        const add = row(id, t);
+        cur.unitsSold += add.unitsSold;
+        cur.totalRevenue = Math.round((cur.totalRevenue + add.totalRevenue) * 100) / 100;
+        cur.orders += add.orders;
+        agg.set(id, cur);
+      }
+    }
+    return res.json([...agg.values()]);
+  }
+
+  // sin rollups (datos previos): escaneo de analytics/
   const keys = await listKeys('analytics/');
   const agg = new Map();
   for (const k of keys) {
@@ -765,7 +1141,7 @@ app.get('/domain/metrics', async (_req, res) => {
       const obj = await s3.send(
         new GetObjectCommand({ Bucket: DATA_BUCKET, Key: k })
       );
-      const d = JSON.parse(await obj.Body.transformToString());
+      const d = await decodeBody(obj);
       const id = d.productId || d.product || 'UNKNOWN';
       const cur = agg.get(id) || {
         productId: id,
@@ -864,11 +1240,11 @@ app.post('/domain/order', async (req, res) => {
       price: unitPrice,
     };
 
-    await putJson(`traces/${correlationId}/00-published.json`, {
+    await putJson(traceKey(correlationId, '00-published'), {
       t: Date.now(),
       message: payload,
     });
-    await putJson(`traces/${correlationId}/01-routes.json`, {
+    await putJson(traceKey(correlationId, '01-routes'), {
       fulfillment: true,
       analytics: true,
     });
@@ -901,12 +1277,9 @@ app.post('/domain/order', async (req, res) => {
 function countBySuffix(keys, suffix) {
   return keys.filter((k) => k.endsWith(suffix)).length;
 }
-// helper para contar objetos bajo un prefijo (p.ej. orders/)
+// helper para contar objetos bajo un prefijo (p.ej. orders/, un List por shard)
 async function countPrefix(prefix) {
-  const out = await s3.send(
-    new ListObjectsV2Command({ Bucket: DATA_BUCKET, Prefix: prefix })
-  );
-  return (out.Contents || []).length;
+  return (await listSharded(prefix, listKeys)).length;
 }
 
 app.get('/metrics', async (_req, res) => {
@@ -927,22 +1300,37 @@ app.get('/metrics', async (_req, res) => {
     );
 
     // 2) contadores por trazas (por presencia de archivos)
-    const tkeys = await listKeys('traces/'); // todas las trazas
+    const tkeys = [
+      ...(await listSharded('traces/')), // todas las trazas (por shard, en paralelo)
+      // + las que están en segmentos de los workers sin juntar (el resto viene en el contador)
+      ...segmentTraceKeys(await loadSegmentIndex({ pendingOnly: true })),
+    ];
+    const compacted =
+      (await getJsonOr('traces/_index/counters.json', null))?.metricsByTrace || {};
     const metricsByTrace = {
-      published: countBySuffix(tkeys, '00-published.json'),
-      routed: countBySuffix(tkeys, '01-routes.json'),
-      f_recv: countBySuffix(tkeys, '10-fulfillment-received.json'),
-      f_done: countBySuffix(tkeys, '20-fulfillment-processed.json'),
-      a_recv: countBySuffix(tkeys, '11-analytics-received.json'),
-      a_done: countBySuffix(tkeys, '21-analytics-processed.json'),
-      s_recv: countBySuffix(tkeys, '12-shipping-received.json'), 
-      s_done: countBySuffix(tkeys, '22-shipping-processed.json'),
+      published: countBySuffix(tkeys, '00-published.json') + (compacted.published || 0),
+      routed: countBySuffix(tkeys, '01-routes.json') + (compacted.routed || 0),
+      f_recv: countBySuffix(tkeys, '10-fulfillment-received.json') + (compacted.f_recv || 0),
+      f_done: countBySuffix(tkeys, '20-fulfillment-processed.json') + (compacted.f_done || 0),
+      a_recv: countBySuffix(tkeys, '11-analytics-received.json') + (compacted.a_recv || 0),
+      a_done: countBySuffix(tkeys, '21-analytics-processed.json') + (compacted.a_done || 0),
+      s_recv: countBySuffix(tkeys, '12-shipping-received.json') + (compacted.s_recv || 0),
+      s_done: countBySuffix(tkeys, '22-shipping-processed.json') + (compacted.s_done || 0),
     };
 
     // 3) “procesados OK” = artefactos generados en S3
     const processed = {
       fulfillment: await countPrefix('orders/'),
-      analytics: await countPrefix('analytics/'),
+      // con rollups: suma de los contadores por hora (no depende del tope de 1000 keys del listado)
+      analytics: await loadRollups().then((docs) =>
+        docs.length
+          ? docs.reduce(
+              (n, d) =>
+                n + Object.values(d.products || {}).reduce((m, t) => m + Number(t.count || 0), 0),
+              0
+            )
+          : countPrefix('analytics/')
+      ),
     };
 
     // 4) DLQ “stock actual” (pendientes)
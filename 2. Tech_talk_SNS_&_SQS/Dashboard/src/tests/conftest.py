@@ -0,0 +1,101 @@
+"""Los utils se importan igual que en los workers (`utils.*` desde Dashboard/src) y AWS es moto."""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# antes de importar utils: runtime lee el endpoint y el bucket al cargar
+os.environ.pop("AWS_ENDPOINT_URL", None)
+os.environ.update(
+    AWS_ACCESS_KEY_ID="testing",
+    AWS_SECRET_ACCESS_KEY="testing",
+    AWS_DEFAULT_REGION="us-east-1",
+    AWS_REQUEST_CHECKSUM_CALCULATION="when_required",
+)
+
+from botocore.exceptions import ClientError  # noqa: E402
+from moto import mock_aws  # noqa: E402
+from utils import runtime  # noqa: E402
+
+
+@pytest.fixture
+def s3():
+    """Cliente S3 (moto) con el DATA_BUCKET creado; runtime.client("s3") devuelve este mismo."""
+    with mock_aws():
+        runtime._clients.clear()
+        client = runtime.client("s3")
+        client.create_bucket(Bucket=runtime.DATA_BUCKET)
+        yield client
+    runtime._clients.clear()
+
+
+@pytest.fixture
+def dynamodb():
+    with mock_aws():
+        runtime._clients.clear()
+        yield runtime.client("dynamodb")
+    runtime._clients.clear()
+
+
+def client_error(code, op="PutObject", **extra):
+    return ClientError({"Error": {"Code": code, "Message": code}, **extra}, op)
+
+
+class Faulty:
+    """Envuelve un cliente boto3: `fail(op, when, error)` hace fallar las llamadas a `op`
+    para las que `when(kwargs)` es verdadero (o las primeras `times`) y anota cada llamada."""
+
+    def __init__(self, client):
+        self._client = client
+        self._rules = []
+        self.calls = []  # [(op, kwargs)]
+
+    def fail(self, op, error, when=None, times=None, before=None):
+        self._rules.append({"op": op, "error": error, "when": when, "times": times, "before": before})
+        return self
+
+    def __getattr__(self, op):
+        fn = getattr(self._client, op)
+        if not callable(fn):
+            return fn
+
+        def call(*args, **kw):
+            self.calls.append((op, kw))
+            for rule in self._rules:
+                if rule["op"] != op or (rule["when"] and not rule["when"](kw)) or rule["times"] == 0:
+                    continue
+                if rule["times"] is not None:
+                    rule["times"] -= 1
+                if rule["before"]:
+                    rule["before"](kw)
+                raise rule["error"]
+            return fn(*args, **kw)
+
+        return call
+
+
+class Lockstep:
+    """Las primeras `n` lecturas esperan a estar todas hechas: los escritores leen el mismo ETag."""
+
+    def __init__(self, client, n=2):
+        self._client = client
+        self._barrier = threading.Barrier(n)
+        self._lock = threading.Lock()
+        self._left = n
+
+    def __getattr__(self, op):
+        return getattr(self._client, op)
+
+    def _wait(self):
+        with self._lock:
+            first, self._left = self._left > 0, self._left - 1
+        if first:
+            self._barrier.wait(5)
+
+    def get_object(self, **kw):
+        try:
+            return self._client.get_object(**kw)
+        finally:
+            self._wait()
@@ -0,0 +1,133 @@
+"""Breaker: closed -> open -> half-open -> closed, ventana por intervalos y límite AIMD"""
+import pytest
+
+from utils import backpressure, runtime
+from utils.backpressure import CLOSED, HALF_OPEN, OPEN, Breaker, CircuitOpen
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(backpressure.time, "monotonic", c)
+    return c
+
+
+def _open(b):
+    for _ in range(backpressure.MIN_CALLS):
+        b.record(10, True)
+    assert b.state == OPEN
+
+
+def test_opens_on_sustained_errors(clock):
+    b = Breaker("test")
+    for _ in range(backpressure.MIN_CALLS - 1):
+        b.record(10, True)
+    # con menos de MIN_CALLS no hay muestra suficiente
+    assert b.state == CLOSED
+    b.record(10, True)
+    assert b.state == OPEN
+    assert not b.allow()
+    with pytest.raises(CircuitOpen):
+        with b.slot():
+            pass
+    assert b.rejected == 1
+
+
+def test_errors_below_rate_keep_it_closed(clock):
+    b = Breaker("test")
+    for i in range(backpressure.MIN_CALLS * 2):
+        b.record(10, i % 3 == 0)
+    assert b.state == CLOSED
+
+
+def test_slow_calls_count_as_errors(clock):
+    b = Breaker("test")
+    for _ in range(backpressure.MIN_CALLS):
+        b.record(backpressure.SLOW_MS, False)
+    assert b.state == OPEN
+
+
+def test_half_open_probes_close_it(clock):
+    b = Breaker("test")
+    _open(b)
+    clock.now += backpressure.COOLDOWN_S
+    assert b.allow()
+    assert b.state == HALF_OPEN
+    for _ in range(backpressure.PROBES):
+        b.record(10, False)
+    assert b.state == CLOSED
+    # la ventana arranca limpia: los errores de antes no la vuelven a abrir
+    b.record(10, True)
+    assert b.state == CLOSED
+
+
+def test_failed_probe_reopens_with_longer_cooldown(clock):
+    b = Breaker("test")
+    _open(b)
+    clock.now += backpressure.COOLDOWN_S
+    assert b.allow()
+    b.record(10, True)
+    assert b.state == OPEN
+    clock.now += backpressure.COOLDOWN_S
+    assert not b.allow()
+    clock.now += backpressure.COOLDOWN_S
+    assert b.allow()
+    assert b.state == HALF_OPEN
+
+
+def test_old_intervals_leave_the_window(clock):
+    b = Breaker("test")
+    for _ in range(backpressure.MIN_CALLS - 1):
+        b.record(10, True)
+    clock.now += backpressure.WINDOW_S + backpressure._BUCKET_S
+    for _ in range(backpressure.MIN_CALLS - 1):
+        b.record(10, False)
+    b.record(10, True)
+    assert b.state == CLOSED
+    assert b._stats(clock.now)[0] == backpressure.MIN_CALLS
+
+
+def test_window_stats_p90_from_histogram(clock):
+    b = Breaker("test")
+    for ms in [1] * 9 + [700]:
+        b.record(ms, False)
+    n, rate, p90 = b._stats(clock.now)
+    assert (n, rate) == (10, 0.0)
+    assert p90 == backpressure.LAT_BOUNDS[0]
+    # más allá del último límite el p90 es la máxima observada
+    for _ in range(10):
+        b.record(20000, False)
+    assert b._stats(clock.now)[2] == 20000
+
+
+def test_aimd_limit(clock):
+    b = Breaker("test")
+    assert b.limit == backpressure.MAX_INFLIGHT
+    b.record(backpressure.TARGET_MS + 1, False)
+    assert b.limit == backpressure.MAX_INFLIGHT / 2
+    # a lo sumo una baja por segundo
+    b.record(backpressure.TARGET_MS + 1, False)
+    assert b.limit == backpressure.MAX_INFLIGHT / 2
+    clock.now += 1
+    b.record(10, True)
+    assert b.limit == backpressure.MAX_INFLIGHT / 4
+    for _ in range(50):
+        b.record(10, False)
+    assert b.limit == backpressure.MAX_INFLIGHT
+
+
+def test_botocore_hooks_ignore_not_found(s3):
+    b = backpressure.breaker("s3")
+    calls, errors = b.calls, b.errors
+    with pytest.raises(s3.exceptions.ClientError):
+        s3.head_object(Bucket=runtime.DATA_BUCKET, Key="no-existe.json")
+    s3.put_object(Bucket=runtime.DATA_BUCKET, Key="k.json", Body=b"{}")
+    assert (b.calls - calls, b.errors - errors) == (2, 0)
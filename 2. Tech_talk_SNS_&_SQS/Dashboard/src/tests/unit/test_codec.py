@@ -0,0 +1,72 @@
+"""codec: JSON/gzip/MessagePack y payloads por referencia (`$ref`)"""
+import json
+
+import pytest
+
+from utils import codec, runtime, trace_store
+from utils.s3_writer import BatchWriter
+from utils.trace_store import TraceSink
+
+BIG = {"items": [{"product": f"SKU-{i}", "quantity": i} for i in range(50)]}
+
+
+@pytest.mark.parametrize("encoding", ["json", "gzip", "msgpack"])
+def test_encode_decode_round_trip(encoding):
+    body, headers = codec.encode(BIG, encoding)
+    assert codec.decode(body, headers.get("ContentType"), headers.get("ContentEncoding")) == BIG
+
+
+def test_small_objects_skip_gzip():
+    body, headers = codec.encode({"a": 1}, "gzip")
+    assert headers == {"ContentType": codec.JSON_TYPE}
+    assert body == b'{"a":1}'
+
+
+def test_gzip_is_deterministic():
+    assert codec.encode(BIG, "gzip")[0] == codec.encode(BIG, "gzip")[0]
+
+
+def test_msgpack_without_lib_falls_back_to_gzip(monkeypatch):
+    monkeypatch.setattr(codec, "msgpack", None)
+    _, headers = codec.encode(BIG, "msgpack")
+    assert headers == {"ContentType": codec.JSON_TYPE, "ContentEncoding": "gzip"}
+
+
+def test_read_plain_json_and_default(s3):
+    s3.put_object(Bucket=runtime.DATA_BUCKET, Key="old.json", Body=json.dumps({"a": 1}).encode())
+    assert codec.read(s3, runtime.DATA_BUCKET, "old.json") == {"a": 1}
+    assert codec.read(s3, runtime.DATA_BUCKET, "missing.json", None) is None
+    with pytest.raises(s3.exceptions.NoSuchKey):
+        codec.read(s3, runtime.DATA_BUCKET, "missing.json")
+
+
+def test_resolve_nested_refs_and_paths():
+    store = {"orders/o-1.json": {"orderId": "o-1", "total": 3}}
+    value = {"order": codec.ref("orders/o-1.json"), "list": [codec.ref("orders/o-1.json", "total")], "n": 1}
+    assert codec.resolve(value, store.__getitem__) == {"order": store["orders/o-1.json"], "list": [3], "n": 1}
+    # lo que no se puede leer queda como referencia
+    missing = codec.ref("orders/o-2.json")
+    assert codec.resolve(missing, store.__getitem__) == missing
+    # un dict con más campos que $ref/path no es una referencia
+    assert codec.resolve({"$ref": "x", "other": 1}, store.__getitem__) == {"$ref": "x", "other": 1}
+
+
+@pytest.mark.parametrize("mode", ["objects", "segment"])
+@pytest.mark.parametrize("encoding", ["json", "gzip"])
+def test_trace_refs_round_trip(s3, mode, encoding):
+    order = {"orderId": "o-1", **BIG}
+    with BatchWriter(s3, runtime.DATA_BUCKET) as w:
+        traces = TraceSink(w, "fulfillment", mode=mode, payloads="ref")
+        artifact = w.put_json("orders/o-1.json", order, encoding=encoding)
+        traces.put("cid-1", "10-fulfillment-received", {"message": order})
+        data = {
+            "order": traces.payload(order, "orders/o-1.json"),
+            "id": traces.payload("o-1", "orders/o-1.json", "orderId"),
+        }
+        traces.put("cid-1", "20-fulfillment-processed", data, after=artifact)
+        traces.flush()
+
+    raw = trace_store.read_trace(s3, runtime.DATA_BUCKET, "cid-1", resolve=False)
+    assert raw[1]["data"]["order"] == {"$ref": "orders/o-1.json"}
+    steps = trace_store.read_trace(s3, runtime.DATA_BUCKET, "cid-1")
+    assert steps[1]["data"] == {"order": order, "id": "o-1"}
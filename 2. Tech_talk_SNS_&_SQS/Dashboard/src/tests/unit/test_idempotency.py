@@ -0,0 +1,86 @@
+"""Idempotency: prefetch de marcadores y marca recién después de las escrituras del record"""
+import json
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from utils import idempotency, runtime
+from utils.idempotency import Idempotency, TtlLru
+from utils.orders import decode
+from utils.s3_writer import BatchWriter
+
+
+@pytest.fixture(autouse=True)
+def fresh_lru(monkeypatch):
+    # el LRU vive mientras el contenedor esté warm: cada test arranca "en frío"
+    monkeypatch.setattr(idempotency, "_lru", TtlLru(100, idempotency.TTL_S))
+
+
+def _record(mid, cid):
+    return {"messageId": mid, "body": json.dumps({"correlationId": cid, "orderId": f"o-{mid}"})}
+
+
+def _markers(s3):
+    return [
+        o["Key"]
+        for o in s3.list_objects_v2(Bucket=runtime.DATA_BUCKET, Prefix=idempotency.PREFIX).get("Contents", [])
+    ]
+
+
+def test_mark_then_prefetch_on_cold_container(s3, monkeypatch):
+    r = _record("m-1", "cid-1")
+    with BatchWriter(s3, runtime.DATA_BUCKET) as w:
+        Idempotency("fulfillment", store="s3").mark(w, r)
+    assert _markers(s3) == ["idempotency/fulfillment/cid/cid-1.json"]
+
+    monkeypatch.setattr(idempotency, "_lru", TtlLru(100, idempotency.TTL_S))
+    idem = Idempotency("fulfillment", store="s3")
+    idem.prefetch([r, _record("m-2", "cid-2")])
+    assert idem.seen(r)
+    assert not idem.seen(_record("m-2", "cid-2"))
+    assert (idem.hits_store, idem.hits_local, idem.misses) == (1, 0, 1)
+
+
+def test_redelivery_with_other_message_id_is_seen(s3):
+    with BatchWriter(s3, runtime.DATA_BUCKET) as w:
+        Idempotency("fulfillment", store="s3").mark(w, _record("m-1", "cid-1"))
+    idem = Idempotency("fulfillment", store="s3")
+    # re-envío desde la DLQ: otro messageId, mismo correlationId
+    assert idem.seen(_record("m-9", "cid-1"))
+    assert idem.hits_local == 1
+
+
+def test_mark_after_failed_write_leaves_no_marker(s3):
+    r = _record("m-1", "cid-1")
+    failed = Future()
+    failed.set_exception(RuntimeError("PutObject"))
+    with BatchWriter(s3, runtime.DATA_BUCKET, raise_errors=False) as w:
+        fut = Idempotency("fulfillment", store="s3").mark(w, r, after=failed)
+    assert fut.exception() is not None
+    assert _markers(s3) == []
+    assert not Idempotency("fulfillment", store="s3").seen(r)
+
+
+def test_expired_marker_is_not_seen(s3):
+    key = "fulfillment/cid/cid-1"
+    Idempotency("fulfillment", store="s3")._write(key, time.time() - 1)
+    idem = Idempotency("fulfillment", store="s3")
+    idem.prefetch([_record("m-1", "cid-1")])
+    assert not idem.seen(_record("m-1", "cid-1"))
+
+
+def test_prefetch_uses_decoded_orders_for_the_key(s3):
+    r = _record("m-1", "cid-1")
+    idem = Idempotency("fulfillment", store="s3")
+    idem.prefetch([r], orders=[decode(r)])
+    # el body ya no se vuelve a parsear: la key sale del Order decodificado
+    assert idem.key_for({"messageId": "m-1", "body": "no es json"}) == "fulfillment/cid/cid-1"
+
+
+def test_memory_store_never_touches_s3(s3):
+    r = _record("m-1", "cid-1")
+    with BatchWriter(s3, runtime.DATA_BUCKET) as w:
+        Idempotency("shipping", store="memory").mark(w, r)
+    assert _markers(s3) == []
+    assert Idempotency("shipping", store="memory").seen(r)
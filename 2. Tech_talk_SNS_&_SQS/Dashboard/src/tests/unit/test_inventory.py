@@ -0,0 +1,102 @@
+"""Inventory: reserva en una TransactWriteItems por batch y aislamiento orden por orden"""
+import pytest
+
+from tests.conftest import Faulty, client_error
+from utils import inventory, runtime
+from utils.inventory import DUPLICATE, ERROR, INSUFFICIENT, RESERVED, Inventory
+
+
+@pytest.fixture
+def table(dynamodb):
+    dynamodb.create_table(
+        TableName=inventory.TABLE,
+        KeySchema=[{"AttributeName": "sku", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "sku", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    for sku, available in (("SKU-1", 10), ("SKU-2", 1)):
+        dynamodb.put_item(
+            TableName=inventory.TABLE,
+            Item={"sku": {"S": sku}, "available": {"N": str(available)}, "reserved": {"N": "0"}},
+        )
+    return dynamodb
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(inventory.time, "sleep", lambda s: None)
+
+
+def _stock(ddb, sku):
+    item = ddb.get_item(TableName=inventory.TABLE, Key={"sku": {"S": sku}})["Item"]
+    return int(item["available"]["N"]), int(item["reserved"]["N"])
+
+
+def test_batch_reserved_in_one_transaction(table):
+    inv = Inventory("fulfillment", store="dynamodb")
+    out = inv.reserve([("o-1", {"SKU-1": 2}), ("o-2", {"SKU-1": 3, "SKU-2": 1})])
+    assert out == {"o-1": {"status": RESERVED}, "o-2": {"status": RESERVED}}
+    assert inv.transactions == 1
+    assert _stock(table, "SKU-1") == (5, 5)
+    assert _stock(table, "SKU-2") == (0, 1)
+
+
+def test_short_order_is_isolated_from_the_batch(table):
+    inv = Inventory("fulfillment", store="dynamodb")
+    out = inv.reserve([("o-1", {"SKU-1": 2}), ("o-2", {"SKU-2": 5}), ("o-3", {"SKU-1": 1})])
+    assert out["o-1"] == {"status": RESERVED}
+    assert out["o-3"] == {"status": RESERVED}
+    assert out["o-2"]["status"] == INSUFFICIENT
+    [short] = out["o-2"]["short"]
+    assert (short["sku"], short["requested"]) == ("SKU-2", 5)
+    # 1 del batch + 1 por orden al aislar
+    assert inv.transactions == 4
+    assert _stock(table, "SKU-1") == (7, 3)
+    assert _stock(table, "SKU-2") == (1, 0)
+
+
+def test_redelivered_order_is_duplicate(table):
+    Inventory("fulfillment", store="dynamodb").reserve([("o-1", {"SKU-1": 2})])
+    out = Inventory("fulfillment", store="dynamodb").reserve([("o-1", {"SKU-1": 2})])
+    assert out == {"o-1": {"status": DUPLICATE}}
+    assert _stock(table, "SKU-1") == (8, 2)
+
+
+def test_same_order_twice_in_batch(table):
+    out = Inventory("fulfillment", store="dynamodb").reserve([("o-1", {"SKU-1": 1}), ("o-1", {"SKU-1": 1})])
+    assert out == {"o-1": {"status": RESERVED}}
+    assert _stock(table, "SKU-1") == (9, 1)
+
+
+def test_transaction_conflict_is_retried(table, monkeypatch):
+    conflict = client_error(
+        "TransactionCanceledException",
+        op="TransactWriteItems",
+        CancellationReasons=[{"Code": "None"}, {"Code": "TransactionConflict"}],
+    )
+    faulty = Faulty(table).fail("transact_write_items", conflict, times=2)
+    monkeypatch.setattr(runtime, "client", lambda service, *a, **kw: faulty)
+    inv = Inventory("fulfillment", store="dynamodb")
+    assert inv.reserve([("o-1", {"SKU-1": 1})]) == {"o-1": {"status": RESERVED}}
+    assert (inv.transactions, inv.conflicts) == (3, 2)
+
+
+def test_other_errors_fail_the_group(table, monkeypatch):
+    faulty = Faulty(table).fail("transact_write_items", client_error("AccessDeniedException", op="TransactWriteItems"))
+    monkeypatch.setattr(runtime, "client", lambda service, *a, **kw: faulty)
+    out = Inventory("fulfillment", store="dynamodb").reserve([("o-1", {"SKU-1": 1}), ("o-2", {"SKU-1": 1})])
+    assert {o: r["status"] for o, r in out.items()} == {"o-1": ERROR, "o-2": ERROR}
+
+
+def test_groups_split_at_transaction_limit(table, monkeypatch):
+    monkeypatch.setattr(inventory, "TX_MAX_ITEMS", 4)
+    inv = Inventory("fulfillment", store="dynamodb")
+    # cada orden son 2 items (ledger + SKU): 2 órdenes por transacción
+    out = inv.reserve([(f"o-{i}", {"SKU-1": 1}) for i in range(5)])
+    assert all(r["status"] == RESERVED for r in out.values())
+    assert inv.transactions == 3
+
+
+def test_off_store_reserves_without_io():
+    out = Inventory("fulfillment", store="off").reserve([("o-1", {"SKU-1": 1})])
+    assert out == {"o-1": {"status": RESERVED}}
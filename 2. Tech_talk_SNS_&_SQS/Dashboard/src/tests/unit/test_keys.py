@@ -0,0 +1,67 @@
+"""keys: layout "flat"/"hashed" y lecturas que cruzan los dos"""
+from utils import keys, runtime
+
+
+def _put(s3, *ks):
+    for k in ks:
+        s3.put_object(Bucket=runtime.DATA_BUCKET, Key=k, Body=b"{}")
+
+
+def test_shard_is_stable_and_fixed_width():
+    assert keys.shard_of("cid-1") == keys.shard_of("cid-1")
+    assert keys.shard_of("cid-1", 256) in keys.all_shards(256)
+    assert {len(s) for s in keys.all_shards(256)} == {2}
+    assert len({keys.shard_of(f"o-{i}") for i in range(500)}) == keys.SHARDS
+
+
+def test_keys_per_layout():
+    shard = keys.shard_of("o-1")
+    assert keys.order_key("o-1", "flat") == "orders/o-1.json"
+    assert keys.order_key("o-1", "hashed") == f"orders/{shard}/o-1.json"
+    assert keys.shipping_key("o-1", "c", "hashed") == f"shipping/OrderShipped/{shard}/o-1-c.json"
+    assert keys.prefixes("orders/", "flat") == ["orders/"]
+    assert len(keys.prefixes("orders/", "hashed")) == keys.SHARDS
+
+
+def test_parse_trace_key_both_layouts():
+    assert keys.parse_trace_key("traces/cid-1/10-fulfillment-received.json") == ("cid-1", "10-fulfillment-received")
+    hashed = keys.trace_key("cid-1", "10-fulfillment-received", "hashed")
+    assert keys.parse_trace_key(hashed) == ("cid-1", "10-fulfillment-received")
+    assert keys.parse_trace_key("traces/_segments/dt=2024-01-01/x.ndjson") is None
+    assert keys.parse_trace_key("traces/_index/counters.json") is None
+
+
+def test_list_loose_traces_flat_skips_internal_prefixes(s3):
+    _put(
+        s3,
+        "traces/01J0ULID/00-published.json",
+        "traces/_index/counters.json",
+        "traces/_index/pending/dt=2024-01-01/x.ndjson.idx.json",
+        "traces/_segments/dt=2024-01-01/x.ndjson",
+        "traces/cid-1/10-fulfillment-received.json",
+    )
+    got = [o["Key"] for o in keys.list_loose_traces(s3, runtime.DATA_BUCKET, "flat")]
+    assert got == ["traces/01J0ULID/00-published.json", "traces/cid-1/10-fulfillment-received.json"]
+
+
+def test_list_loose_traces_hashed_lists_every_shard(s3):
+    loose = [keys.trace_key(f"cid-{i}", "00-published", "hashed") for i in range(20)]
+    _put(s3, *loose, "traces/_segments/dt=2024-01-01/x.ndjson")
+    got = [o["Key"] for o in keys.list_loose_traces(s3, runtime.DATA_BUCKET, "hashed")]
+    assert sorted(got) == sorted(loose)
+
+
+def test_list_trace_falls_back_to_the_other_layout(s3):
+    old = keys.trace_key("cid-1", "00-published", "flat")
+    _put(s3, old)
+    # el layout pasó a "hashed" después de escribir la traza
+    assert keys.list_trace(s3, runtime.DATA_BUCKET, "cid-1", "hashed") == [old]
+    new = keys.trace_key("cid-2", "00-published", "hashed")
+    _put(s3, new)
+    assert keys.list_trace(s3, runtime.DATA_BUCKET, "cid-2", "flat") == [new]
+
+
+def test_list_keys_fans_in_shards(s3):
+    ks = [keys.order_key(f"o-{i}", "hashed") for i in range(10)]
+    _put(s3, *ks)
+    assert sorted(keys.list_keys(s3, runtime.DATA_BUCKET, "orders/", "hashed")) == sorted(ks)
@@ -0,0 +1,66 @@
+"""orders: una pasada de decodificación por batch y poison antes de cualquier I/O"""
+import json
+
+import pytest
+
+from utils.orders import MAX_QUANTITY, Poison, decode, decode_batch
+
+
+def _rec(mid, msg):
+    return {"messageId": mid, "body": msg if isinstance(msg, str) else json.dumps(msg)}
+
+
+def _sns(mid, msg):
+    envelope = {"Type": "Notification", "MessageId": "sns-1", "Message": json.dumps(msg)}
+    return _rec(mid, envelope)
+
+
+def test_decode_plain_and_sns_envelope():
+    msg = {"correlationId": "cid-1", "orderId": "o-1", "product": "SKU-1", "quantity": "2", "price": "9.5",
+           "sentAt": "1700000000000", "forceFail": ["Analytics"]}
+    for rec in (_rec("m-1", msg), _sns("m-1", msg)):
+        o = decode(rec)
+        assert (o.message_id, o.correlation_id, o.order_id) == ("m-1", "cid-1", "o-1")
+        assert (o.product, o.quantity, o.price, o.ts) == ("SKU-1", 2, 9.5, 1700000000000)
+        assert o.lines == {"SKU-1": 2}
+        assert o.fails("analytics") and not o.fails("shipping")
+
+
+def test_items_are_summed_per_sku():
+    o = decode(_rec("m-1", {"items": [{"product": "A", "quantity": 2}, {"productId": "A"}, {"product": "B"}]}))
+    assert o.lines == {"A": 3, "B": 1}
+
+
+def test_keep_message_false_drops_the_dict():
+    assert decode(_rec("m-1", {"orderId": "o-1"}), keep_message=False).message is None
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        "no es json",
+        "[1, 2]",
+        {"quantity": True},
+        {"quantity": 0},
+        {"quantity": MAX_QUANTITY + 1},
+        {"quantity": 1.5},
+        {"price": "NaN"},
+        {"price": -1},
+        {"items": {"product": "A"}},
+        {"items": [{"product": "A", "quantity": -1}]},
+        {"sentAt": "ayer"},
+    ],
+)
+def test_poison(body):
+    with pytest.raises(Poison):
+        decode(_rec("m-1", body))
+
+
+def test_decode_batch_splits_poison_and_logs_it(capsys):
+    recs = [_rec("m-1", {"orderId": "o-1"}), _rec("m-2", "{roto"), _sns("m-3", {"quantity": 0}), _rec("m-4", {})]
+    ok, poison = decode_batch(recs, "fulfillment")
+    assert [r["messageId"] for r, _ in ok] == ["m-1", "m-4"]
+    assert [o.order_id for _, o in ok] == ["o-1", None]
+    assert poison == ["m-2", "m-3"]
+    logged = [json.loads(line) for line in capsys.readouterr().out.splitlines() if '"poison"' in line]
+    assert [(e["component"], e["id"]) for e in logged] == [("fulfillment", "m-2"), ("fulfillment", "m-3")]
@@ -0,0 +1,133 @@
+"""Rollup: merge por bucket de tiempo con PUT condicional y reintento ante conflictos"""
+import json
+import threading
+
+import pytest
+
+from tests.conftest import Faulty, Lockstep, client_error
+from utils import rollups, runtime
+from utils.rollups import Rollup, bucket_of
+from utils.s3_writer import BatchWriter
+
+TS = 1_700_000_000_000  # 2023-11-14T22:13:20Z
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(rollups.time, "sleep", lambda s: None)
+
+
+def _doc(s3, bucket):
+    key = f"{rollups.PREFIX}{bucket.replace(':', '')}.json"
+    return json.loads(s3.get_object(Bucket=runtime.DATA_BUCKET, Key=key)["Body"].read())
+
+
+def _faulty(s3, monkeypatch):
+    # Rollup usa el cliente de runtime, no el del writer
+    faulty = Faulty(s3)
+    monkeypatch.setattr(runtime, "client", lambda service, *a, **kw: faulty)
+    return faulty
+
+
+def _flush(client, rollup):
+    with BatchWriter(client, runtime.DATA_BUCKET, raise_errors=False) as w:
+        futs = rollup.flush(w)
+    return {b: f.exception() or f.result() for b, f in futs.items()}
+
+
+def test_bucket_of_truncates_to_bucket_start():
+    assert bucket_of(TS, 3600) == "2023-11-14T22:00"
+    assert bucket_of(TS, 60) == "2023-11-14T22:13"
+
+
+def test_flush_creates_then_merges(s3):
+    r = Rollup("analytics", store="s3")
+    b = r.add("SKU-1", 2, 10.0, TS)
+    r.add("SKU-1", 1, 10.0, TS)
+    r.add("SKU-2", 1, 5.5, TS)
+    assert _flush(s3, r) == {b: b}
+    assert r.totals == {}
+
+    r.add("SKU-1", 3, 10.0, TS)
+    _flush(s3, r)
+    products = _doc(s3, b)["products"]
+    assert products["SKU-1"] == {"quantity": 6, "revenue": 60.0, "count": 3}
+    assert products["SKU-2"] == {"quantity": 1, "revenue": 5.5, "count": 1}
+    assert r.writes == 2
+
+
+def test_conflict_rereads_and_keeps_the_other_writer(s3, monkeypatch):
+    r = Rollup("analytics", store="s3")
+    b = r.add("SKU-1", 1, 10.0, TS)
+    key = f"{rollups.PREFIX}{b.replace(':', '')}.json"
+
+    def concurrent_writer(_):
+        # otra invocación escribió el mismo bucket entre nuestro GET y nuestro PUT
+        doc = rollups.merge({"bucket": b}, {"SKU-1": {"quantity": 5, "revenue": 50.0, "count": 5}})
+        s3.put_object(Bucket=runtime.DATA_BUCKET, Key=key, Body=json.dumps(doc).encode("utf-8"))
+
+    faulty = _faulty(s3, monkeypatch).fail(
+        "put_object", client_error("PreconditionFailed"), times=1, before=concurrent_writer
+    )
+    assert _flush(faulty, r) == {b: b}
+    assert r.conflicts == 1
+    assert _doc(s3, b)["products"]["SKU-1"] == {"quantity": 6, "revenue": 60.0, "count": 6}
+    # cada intento relee el documento antes de mezclar
+    assert [op for op, _ in faulty.calls] == ["get_object", "put_object", "get_object", "put_object"]
+
+
+@pytest.mark.parametrize("existing", [False, True])
+def test_concurrent_merges_against_real_etag(s3, monkeypatch, existing):
+    if existing:
+        seed = Rollup("analytics", store="s3")
+        seed.add("SKU-1", 10, 1.0, TS)
+        _flush(s3, seed)
+    lockstep = Lockstep(s3)
+    monkeypatch.setattr(runtime, "client", lambda service, *a, **kw: lockstep)
+    writers = [Rollup("analytics", store="s3") for _ in range(2)]
+    for i, r in enumerate(writers, 1):
+        b = r.add("SKU-1", i, 1.0, TS)
+    threads = [threading.Thread(target=_flush, args=(s3, r)) for r in writers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # el PUT condicional de uno de los dos falló de verdad (If-Match / If-None-Match) y releyó
+    assert sum(r.conflicts for r in writers) == 1
+    assert sum(r.writes for r in writers) == 2
+    expected = {"quantity": 13, "revenue": 13.0, "count": 3} if existing else {"quantity": 3, "revenue": 3.0, "count": 2}
+    assert _doc(s3, b)["products"]["SKU-1"] == expected
+
+
+def test_gives_up_after_max_attempts(s3, monkeypatch):
+    monkeypatch.setattr(rollups, "MAX_ATTEMPTS", 3)
+    r = Rollup("analytics", store="s3")
+    b = r.add("SKU-1", 1, 10.0, TS)
+    faulty = _faulty(s3, monkeypatch).fail("put_object", client_error("PreconditionFailed"))
+    err = _flush(faulty, r)[b]
+    assert isinstance(err, RuntimeError)
+    assert r.conflicts == 3
+
+
+def test_other_errors_are_not_retried(s3, monkeypatch):
+    r = Rollup("analytics", store="s3")
+    b = r.add("SKU-1", 1, 10.0, TS)
+    faulty = _faulty(s3, monkeypatch).fail("put_object", client_error("AccessDenied"))
+    assert "AccessDenied" in str(_flush(faulty, r)[b])
+    assert r.conflicts == 0
+
+
+def test_dynamodb_store_adds_atomically(dynamodb, s3):
+    dynamodb.create_table(
+        TableName=rollups.TABLE,
+        KeySchema=[{"AttributeName": "pk", "KeyType": "HASH"}, {"AttributeName": "sk", "KeyType": "RANGE"}],
+        AttributeDefinitions=[{"AttributeName": "pk", "AttributeType": "S"}, {"AttributeName": "sk", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    for quantity in (2, 3):
+        r = Rollup("analytics")
+        b = r.add("SKU-1", quantity, 10.0, TS)
+        assert _flush(s3, r) == {b: b}
+    item = dynamodb.get_item(TableName=rollups.TABLE, Key={"pk": {"S": b}, "sk": {"S": "SKU-1"}})["Item"]
+    assert [float(item[k]["N"]) for k in ("quantity", "revenue", "count")] == [5, 50.0, 2]
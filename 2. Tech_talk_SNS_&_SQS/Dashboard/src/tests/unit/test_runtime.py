@@ -0,0 +1,34 @@
+"""runtime: cache de clientes por proceso y hooks de botocore"""
+import multiprocessing as mp
+
+from utils import backpressure, metrics, runtime
+
+
+def _child(q):
+    q.put((len(runtime._clients), runtime.client("sqs", region_name="us-east-1") is not None))
+
+
+def test_forked_child_starts_with_empty_cache(s3):
+    assert runtime._clients
+    ctx = mp.get_context("fork")
+    q = ctx.Queue()
+    p = ctx.Process(target=_child, args=(q,))
+    p.start()
+    p.join(10)
+    assert q.get(timeout=1) == (0, True)
+    # el padre conserva los suyos
+    assert runtime.client("s3") is s3
+
+
+def test_one_hook_pass_feeds_metrics_and_breaker(s3):
+    b = backpressure.breaker("s3")
+    calls = b.calls
+
+    @metrics.measured("test")
+    def handler(event, context):
+        s3.put_object(Bucket=runtime.DATA_BUCKET, Key="k.json", Body=b"{}")
+        return metrics.current()
+
+    m = handler({}, None)
+    assert len(m._values["s3_ms"]) == 1
+    assert b.calls - calls == 1
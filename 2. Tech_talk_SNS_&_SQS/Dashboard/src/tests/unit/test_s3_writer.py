@@ -0,0 +1,62 @@
+"""BatchWriter: escrituras en paralelo y orden con `after=`"""
+import threading
+import time
+
+import pytest
+
+from tests.conftest import Faulty, client_error
+from utils import runtime
+from utils.s3_writer import BatchWriter
+
+
+def _keys(s3):
+    return [o["Key"] for o in s3.list_objects_v2(Bucket=runtime.DATA_BUCKET).get("Contents", [])]
+
+
+def test_after_starts_only_when_dependency_finished(s3):
+    order = []
+    gate = threading.Event()
+
+    def slow():
+        gate.wait(1)
+        order.append("a")
+        return "a"
+
+    with BatchWriter(s3, runtime.DATA_BUCKET) as w:
+        first = w.call("a", slow)
+        second = w.call("b", lambda: order.append("b") or "b", after=first)
+        time.sleep(0.05)
+        assert not second.done()
+        gate.set()
+    assert order == ["a", "b"]
+    assert second.result() == "b"
+
+
+def test_put_json_after_dependency(s3):
+    with BatchWriter(s3, runtime.DATA_BUCKET) as w:
+        artifact = w.put_json("orders/o-1.json", {"orderId": "o-1"})
+        trace = w.put_json("traces/cid-1/20-fulfillment-processed.json", {"ok": True}, after=artifact)
+    assert trace.result() == "traces/cid-1/20-fulfillment-processed.json"
+    assert sorted(_keys(s3)) == ["orders/o-1.json", "traces/cid-1/20-fulfillment-processed.json"]
+
+
+def test_failed_dependency_skips_dependent_write(s3):
+    faulty = Faulty(s3).fail("put_object", client_error("InternalError"), when=lambda kw: kw["Key"].startswith("orders/"))
+    w = BatchWriter(faulty, runtime.DATA_BUCKET, raise_errors=False)
+    artifact = w.put_json("orders/o-1.json", {"orderId": "o-1"})
+    trace = w.put_json("traces/cid-1/20-fulfillment-processed.json", {"ok": True}, after=artifact)
+    errors = w.wait()
+
+    assert len(errors) == 2
+    assert trace.exception() is artifact.exception()
+    # la traza dependiente ni se intentó
+    assert [kw["Key"] for op, kw in faulty.calls if op == "put_object"] == ["orders/o-1.json"]
+    assert _keys(s3) == []
+
+
+def test_exit_raises_first_error(s3):
+    faulty = Faulty(s3).fail("put_object", client_error("InternalError"))
+    with pytest.raises(Exception) as exc:
+        with BatchWriter(faulty, runtime.DATA_BUCKET) as w:
+            w.put_json("orders/o-1.json", {})
+    assert "InternalError" in str(exc.value)
@@ -0,0 +1,22 @@
+"""shipping_worker: la traza de error no depende de que se haya escrito el 12-shipping-received"""
+import json
+
+from tests.conftest import Faulty, client_error
+from utils import codec, keys, runtime, trace_store
+
+
+def test_error_trace_keeps_the_body_inline_with_ref_payloads(s3, monkeypatch):
+    from workers.fanout import shipping_worker
+
+    monkeypatch.setattr(trace_store, "TRACE_PAYLOADS", "ref")
+    faulty = Faulty(s3).fail(
+        "put_object", client_error("InternalError"), when=lambda kw: kw["Key"].endswith("12-shipping-received.json")
+    )
+    monkeypatch.setattr(shipping_worker, "s3", faulty)
+    body = json.dumps({"correlationId": "cid-1", "orderId": "o-1", "product": "SKU-1", "quantity": 1})
+    res = shipping_worker.handler({"Records": [{"messageId": "m-1", "body": body}]}, None)
+
+    assert res["batchItemFailures"] == [{"itemIdentifier": "m-1"}]
+    err = codec.read(s3, runtime.DATA_BUCKET, keys.trace_key("cid-1", "98-shipping-error"))
+    assert err["body"] == body
+    assert "InternalError" in err["error"]
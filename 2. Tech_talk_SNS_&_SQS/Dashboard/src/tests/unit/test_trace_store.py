@@ -0,0 +1,151 @@
+"""TraceSink en modo "segment": un NDJSON por batch y futures por paso; índice global por día"""
+import json
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from tests.conftest import Faulty, Lockstep, client_error
+from utils import ids, keys, runtime, trace_store
+from utils.s3_writer import BatchWriter
+from utils.trace_store import TraceSink
+from workers.compaction import trace_compactor
+
+TS = 1_700_000_000_000  # 2023-11-14T22:13:20Z
+
+
+def _cid():
+    # ULID de TS: ids.ulid(TS) no vuelve atrás si el proceso ya generó ids más nuevos
+    return ids.time_prefix(TS) + ids.ulid()[10:]
+
+
+def _keys(s3, prefix=""):
+    return [o["Key"] for o in s3.list_objects_v2(Bucket=runtime.DATA_BUCKET, Prefix=prefix).get("Contents", [])]
+
+
+def _failed(err):
+    fut = Future()
+    fut.set_exception(err)
+    return fut
+
+
+def test_segment_flush_writes_segment_and_pending_index(s3):
+    with BatchWriter(s3, runtime.DATA_BUCKET) as w:
+        traces = TraceSink(w, "fulfillment", mode="segment")
+        recv = traces.put("cid-1", "10-fulfillment-received", {"orderId": "o-1"})
+        done = traces.put("cid-1", "20-fulfillment-processed", {"ok": True})
+        other = traces.put("cid-2", "10-fulfillment-received", {"orderId": "o-2"})
+        assert not recv.done()
+        traces.flush()
+    assert all(f.exception() is None for f in (recv, done, other))
+
+    [segment] = _keys(s3, trace_store.SEGMENTS_PREFIX)
+    assert _keys(s3, trace_store.PENDING_PREFIX) == [trace_store.pending_index_key(segment)]
+    steps = trace_store.read_trace(s3, runtime.DATA_BUCKET, "cid-1")
+    assert [s["data"] for s in steps] == [{"orderId": "o-1"}, {"ok": True}]
+
+
+def test_step_after_failed_future_is_left_out(s3):
+    with BatchWriter(s3, runtime.DATA_BUCKET, raise_errors=False) as w:
+        traces = TraceSink(w, "fulfillment", mode="segment")
+        err = RuntimeError("artefacto")
+        skipped = traces.put("cid-1", "20-fulfillment-processed", {"ok": True}, after=_failed(err))
+        kept = traces.put("cid-1", "10-fulfillment-received", {})
+        traces.flush()
+    assert skipped.exception() is err
+    assert kept.exception() is None
+    steps = trace_store.read_trace(s3, runtime.DATA_BUCKET, "cid-1")
+    assert [s["key"].rsplit("/", 1)[1] for s in steps] == ["10-fulfillment-received.json"]
+
+
+def test_failed_segment_write_fails_every_step(s3):
+    faulty = Faulty(s3).fail(
+        "put_object", client_error("SlowDown"), when=lambda kw: kw["Key"].startswith(trace_store.SEGMENTS_PREFIX)
+    )
+    with BatchWriter(faulty, runtime.DATA_BUCKET, raise_errors=False) as w:
+        traces = TraceSink(w, "fulfillment", mode="segment")
+        futs = [traces.put(f"cid-{i}", "10-fulfillment-received", {}) for i in range(3)]
+        # como en los workers: flush antes de revisar los futures de cada record
+        traces.flush()
+        errors = [f.exception() for f in futs]
+    assert all(e is not None and "SlowDown" in str(e) for e in errors)
+    # sin segmento no hay índice que apunte a él
+    assert _keys(s3) == []
+
+
+def test_objects_mode_is_one_put_per_step(s3):
+    with BatchWriter(s3, runtime.DATA_BUCKET) as w:
+        traces = TraceSink(w, "fulfillment", mode="objects")
+        fut = traces.put("cid-1", "10-fulfillment-received", {"a": 1})
+        assert traces.flush() is None
+    assert fut.result() == "traces/cid-1/10-fulfillment-received.json"
+
+
+@pytest.fixture(autouse=True)
+def fresh_pending_cache(monkeypatch):
+    monkeypatch.setattr(trace_store, "_pending_cache", {})
+
+
+def test_cid_index_key_uses_the_ulid_day():
+    cid = _cid()
+    assert trace_store.cid_day(cid) == trace_store.cid_day("TRK-" + cid) == "2023-11-14"
+    assert trace_store.cid_index_key(cid).startswith("traces/_index/cids/dt=2023-11-14/")
+    assert trace_store.cid_index_key("cid-1").startswith("traces/_index/cids/dt=none/")
+
+
+def test_pending_indexes_are_read_once(s3):
+    with BatchWriter(s3, runtime.DATA_BUCKET) as w:
+        traces = TraceSink(w, "fulfillment", mode="segment")
+        traces.put("cid-1", "10-fulfillment-received", {})
+        traces.flush()
+    faulty = Faulty(s3)
+    for _ in range(2):
+        assert [e["steps"] for e in trace_store.segment_entries(faulty, runtime.DATA_BUCKET, "cid-1")] == [
+            ["10-fulfillment-received"]
+        ]
+    pending = [kw["Key"] for op, kw in faulty.calls if op == "get_object" and "/pending/" in kw["Key"]]
+    assert len(pending) == 1
+
+
+def test_concurrent_folds_keep_both_entries(s3, monkeypatch):
+    monkeypatch.setattr(trace_compactor.time, "sleep", lambda s: None)
+    # dos cids del mismo día y shard: las dos corridas pisan el mismo archivo
+    cid = _cid()
+    key = trace_store.cid_index_key(cid)
+    other = next(c for c in (_cid() for _ in range(500)) if trace_store.cid_index_key(c) == key)
+    lockstep = Lockstep(s3)
+    results = []
+
+    def fold(c, seg):
+        additions = {c: [{"segment": seg, "steps": []}]}
+        results.append(trace_compactor._fold_index(lockstep, runtime.DATA_BUCKET, additions))
+
+    threads = [threading.Thread(target=fold, args=a) for a in ((cid, "seg-a"), (other, "seg-b"))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(results) == [(1, 0), (1, 1)]
+    doc = json.loads(s3.get_object(Bucket=runtime.DATA_BUCKET, Key=key)["Body"].read())
+    assert {c: [e["segment"] for e in ents] for c, ents in doc["cids"].items()} == {cid: ["seg-a"], other: ["seg-b"]}
+
+
+def test_compactor_moves_flat_shards_to_day_shards(s3):
+    cid = _cid()
+    flat = f"{trace_store.CID_INDEX_PREFIX}{keys.shard_of(cid, trace_store.CID_INDEX_SHARDS)}.json"
+    ent = {"segment": "traces/_segments/dt=2023-11-14/x.ndjson", "offset": 0, "length": 9, "steps": ["00-published"]}
+    s3.put_object(Bucket=runtime.DATA_BUCKET, Key=flat, Body=json.dumps({"cids": {cid: [ent]}}).encode())
+    s3.put_object(
+        Bucket=runtime.DATA_BUCKET,
+        Key=trace_compactor.CHECKPOINT_KEY,
+        Body=json.dumps({"runs": 1, "counters": {"published": 1}, "cid_index": True}).encode(),
+    )
+
+    trace_compactor.compact(client=s3, bucket=runtime.DATA_BUCKET, now_ms=TS, min_age_s=0)
+
+    assert _keys(s3, trace_store.CID_INDEX_PREFIX) == [trace_store.cid_index_key(cid)]
+    assert trace_store.segment_entries(s3, runtime.DATA_BUCKET, cid) == [ent]
+    # lo migrado ya estaba contado
+    counters = json.loads(s3.get_object(Bucket=runtime.DATA_BUCKET, Key=trace_store.COUNTERS_KEY)["Body"].read())
+    assert counters["metricsByTrace"] == {"published": 1}
@@ -0,0 +1,254 @@
+import bisect, threading, time
+from collections import deque
+from utils.log import jlog, env
+
+# Backpressure del lado del cliente para S3/DynamoDB (uno por servicio, vive mientras el contenedor esté warm).
+# - ventana de las últimas llamadas: latencia y tasa de error (5xx, throttling, timeouts; no 404/409/412)
+# - circuito: "closed" -> "open" con error sostenido (no se llama más; el batch se difiere a la cola)
+#   -> "half-open" después del cooldown (pocas llamadas de prueba) -> "closed" u "open" de nuevo
+# - límite de llamadas en vuelo AIMD: baja a la mitad si la latencia pasa el objetivo, sube de a 1 si no
+ENABLED = env("BREAKER_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+WINDOW_S = float(env("BREAKER_WINDOW_S", "10"))
+MIN_CALLS = int(env("BREAKER_MIN_CALLS", "20"))
+ERROR_RATE = float(env("BREAKER_ERROR_RATE", "0.5"))
+# una llamada más lenta que esto cuenta como fallida (S3 "colgado" no devuelve error, sólo tarda)
+SLOW_MS = float(env("BREAKER_SLOW_MS", "3000"))
+COOLDOWN_S = float(env("BREAKER_COOLDOWN_S", "5"))
+MAX_COOLDOWN_S = float(env("BREAKER_MAX_COOLDOWN_S", "60"))
+PROBES = int(env("BREAKER_PROBES", "3"))
+TARGET_MS = float(env("BACKPRESSURE_TARGET_MS", "500"))
+MAX_INFLIGHT = int(env("S3_WRITE_CONCURRENCY", "8"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+# la ventana se lleva en BUCKETS intervalos con contadores (no una muestra por llamada):
+# registrar es O(1) y la memoria no crece con el ritmo de llamadas
+BUCKETS = 10
+_BUCKET_S = max(WINDOW_S / BUCKETS, 0.05)
+# histograma de latencia por intervalo (ms): el p90 sale de acá sólo en report() y en las transiciones
+LAT_BOUNDS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# códigos que indican que el servicio está saturado (aunque el status sea 400, como en DynamoDB)
+THROTTLE_CODES = (
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+    "ServiceUnavailable",
+    "InternalError",
+    "RequestTimeout",
+)
+
+
+class _Bucket:
+    __slots__ = ("idx", "calls", "errors", "hist", "max_ms")
+
+    def __init__(self, idx):
+        self.idx = idx
+        self.calls = 0
+        self.errors = 0
+        self.hist = [0] * (len(LAT_BOUNDS) + 1)
+        self.max_ms = 0.0
+
+
+class CircuitOpen(Exception):
+    """La llamada no se hizo: el circuito del servicio está abierto."""
+
+
+class Breaker:
+    """Estado de salud de un servicio downstream, compartido por todas las invocaciones del proceso.
+
+    `allow()` antes de arrancar trabajo, `slot()` alrededor de cada llamada (respeta el límite
+    en vuelo y falla rápido con el circuito abierto), `record(ms, error)` con cada resultado
+    (lo hacen solos los hooks de botocore de `instrument`).
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.state = CLOSED
+        self.limit = float(MAX_INFLIGHT)
+        self.inflight = 0
+        self._window = deque()  # _Bucket, del más viejo al actual
+        self._w_calls = 0  # totales de la ventana (se restan al descartar un intervalo)
+        self._w_errors = 0
+        self._cond = threading.Condition()
+        self._opened_at = 0.0
+        self._cooldown = COOLDOWN_S
+        self._probes_ok = 0
+        self._last_decrease = 0.0
+        # contadores desde el último report()
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.transitions = 0
+
+    # --- estado ---
+    def _transition(self, state, **why):
+        prev, self.state = self.state, state
+        self.transitions += 1
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self.limit = 1.0
+        if state == HALF_OPEN:
+            self._probes_ok = 0
+        if state == CLOSED:
+            self._cooldown = COOLDOWN_S
+            self._window.clear()
+            self._w_calls = self._w_errors = 0
+        jlog(component="backpressure", status=f"circuit-{state}", service=self.service, prev=prev,
+             limit=round(self.limit, 1), **why)
+
+    def _evict(self, idx):
+        while self._window and self._window[0].idx <= idx - BUCKETS:
+            b = self._window.popleft()
+            self._w_calls -= b.calls
+            self._w_errors -= b.errors
+
+    def _stats(self, now):
+        """(llamadas, tasa de error, p90 ms) de la ventana; el p90 recorre el histograma (report/transiciones)."""
+        self._evict(int(now / _BUCKET_S))
+        n = self._w_calls
+        if not n:
+            return 0, 0.0, 0.0
+        hist = [sum(col) for col in zip(*(b.hist for b in self._window))]
+        rank, seen = 0.9 * n, 0
+        for i, c in enumerate(hist):
+            seen += c
+            if seen >= rank:
+                # cota superior del intervalo; el último no tiene cota: la latencia máxima observada
+                p90 = LAT_BOUNDS[i] if i < len(LAT_BOUNDS) else max(b.max_ms for b in self._window)
+                return n, self._w_errors / n, float(p90)
+        return n, self._w_errors / n, 0.0
+
+    def allow(self):
+        """¿Conviene empezar trabajo nuevo contra este servicio?"""
+        if not ENABLED:
+            return True
+        with self._cond:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self._cooldown:
+                    return False
+                self._transition(HALF_OPEN, cooldown_s=self._cooldown)
+            return True
+
+    def record(self, ms, error):
+        if not ENABLED:
+            return
+        now = time.monotonic()
+        slow = ms >= SLOW_MS
+        with self._cond:
+            self.calls += 1
+            self.errors += error
+            idx = int(now / _BUCKET_S)
+            if not self._window or self._window[-1].idx != idx:
+                self._window.append(_Bucket(idx))
+                self._evict(idx)
+            b = self._window[-1]
+            b.calls += 1
+            b.errors += bool(error or slow)
+            b.hist[bisect.bisect_left(LAT_BOUNDS, ms)] += 1
+            b.max_ms = max(b.max_ms, ms)
+            self._w_calls += 1
+            self._w_errors += bool(error or slow)
+            # AIMD del límite en vuelo (a lo sumo una baja por segundo: una ráfaga lenta no lo lleva a 1)
+            if error or ms > TARGET_MS:
+                if now - self._last_decrease >= 1.0:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(float(MAX_INFLIGHT), self.limit + 1.0 / self.limit)
+            if self.state == HALF_OPEN:
+                if error or slow:
+                    # la prueba falló: otra vez abierto, con más espera
+                    self._cooldown = min(MAX_COOLDOWN_S, self._cooldown * 2)
+                    self._transition(OPEN, reason="probe-failed", ms=round(ms, 1))
+                else:
+                    self._probes_ok += 1
+                    if self._probes_ok >= PROBES:
+                        self._transition(CLOSED, probes=self._probes_ok)
+            elif self.state == CLOSED:
+                n = self._w_calls
+                if n >= MIN_CALLS and self._w_errors >= ERROR_RATE * n:
+                    _, rate, p90 = self._stats(now)
+                    self._transition(OPEN, reason="error-rate", window=n, error_rate=round(rate, 2),
+                                     p90_ms=round(p90, 1))
+            self._cond.notify_all()
+
+    # --- llamadas ---
+    def slot(self):
+        return _Slot(self)
+
+    def _acquire(self):
+        with self._cond:
+            while True:
+                if ENABLED and self.state == OPEN:
+                    if time.monotonic() - self._opened_at < self._cooldown:
+                        self.rejected += 1
+                        raise CircuitOpen(f"{self.service}: circuito abierto")
+                    self._transition(HALF_OPEN, cooldown_s=self._cooldown)
+                if not ENABLED or self.inflight < max(1, int(self.limit)):
+                    self.inflight += 1
+                    return
+                # backpressure: se espera un lugar (o que el circuito se abra)
+                self._cond.wait(timeout=0.1)
+
+    def _release(self):
+        with self._cond:
+            self.inflight -= 1
+            self._cond.notify_all()
+
+    # --- batch ---
+    def defer(self, component, ids):
+        """Registra los records que vuelven a la cola sin intentarse (mismo contrato que Stressed_worker)."""
+        if ids:
+            jlog(component=component, status="deferred", service=self.service, state=self.state, records=len(ids))
+        return ids
+
+    def report(self, component):
+        if not ENABLED:
+            return
+        with self._cond:
+            n, rate, p90 = self._stats(time.monotonic())
+            jlog(component=component, status="backpressure", service=self.service, state=self.state,
+                 limit=round(self.limit, 1), window=n, error_rate=round(rate, 2), p90_ms=round(p90, 1),
+                 calls=self.calls, errors=self.errors, rejected=self.rejected, transitions=self.transitions)
+            self.calls = self.errors = self.rejected = self.transitions = 0
+
+
+class _Slot:
+    __slots__ = ("b",)
+
+    def __init__(self, b):
+        self.b = b
+
+    def __enter__(self):
+        self.b._acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.b._release()
+        return False
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def breaker(service):
+    b = _breakers.get(service)
+    if b is None:
+        with _lock:
+            b = _breakers.setdefault(service, Breaker(service))
+    return b
+
+
+# --- cada llamada AWS alimenta el breaker de su servicio (los hooks de botocore están en utils.runtime) ---
+def record_call(svc, ms, status, parsed):
+    code = (parsed.get("Error") or {}).get("Code", "")
+    breaker(svc).record(ms, status >= 500 or status == 429 or code in THROTTLE_CODES)
+
+
+def record_call_error(svc, ms):
+    # sin respuesta HTTP (timeout, conexión rechazada)
+    breaker(svc).record(ms, True)
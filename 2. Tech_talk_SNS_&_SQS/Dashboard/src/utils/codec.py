@@ -0,0 +1,73 @@
+import gzip, json
+from utils.log import env
+
+try:  # opcional: MessagePack (binario, más chico y rápido que JSON)
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+# formato de los objetos que escribe BatchWriter.put_json (trazas y artefactos)
+# "json": texto compacto | "gzip": JSON comprimido (Content-Encoding: gzip) | "msgpack": sin la lib cae a gzip
+ENCODING = env("ARTIFACT_ENCODING", "json").lower()
+GZIP_LEVEL = int(env("ARTIFACT_GZIP_LEVEL", "6"))
+# por debajo de esto gzip agrega más (header + trailer) de lo que ahorra: se guarda JSON plano
+GZIP_MIN_BYTES = int(env("ARTIFACT_GZIP_MIN_BYTES", "256"))
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPE = "application/msgpack"
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def encode(obj, encoding=None):
+    """obj -> (bytes, {ContentType, [ContentEncoding]}) listo para put_object(**headers)."""
+    encoding = (encoding or ENCODING).lower()
+    if encoding == "msgpack" and msgpack is not None:
+        return msgpack.packb(obj, use_bin_type=True, default=str), {"ContentType": MSGPACK_TYPE}
+    body = json.dumps(obj, separators=(",", ":"), default=str).encode("utf-8")
+    if encoding in ("gzip", "msgpack") and len(body) >= GZIP_MIN_BYTES:
+        # mtime=0: mismo objeto -> mismos bytes (ETag estable)
+        return gzip.compress(body, GZIP_LEVEL, mtime=0), {"ContentType": JSON_TYPE, "ContentEncoding": "gzip"}
+    return body, {"ContentType": JSON_TYPE}
+
+
+def decode(body, content_type=None, content_encoding=None):
+    """Inversa de `encode`; acepta también objetos viejos sin headers (JSON plano)."""
+    if (content_encoding or "").lower() == "gzip" or body[:2] == _GZIP_MAGIC:
+        body = gzip.decompress(body)
+    if (content_type or "").split(";")[0].strip() in (MSGPACK_TYPE, "application/x-msgpack"):
+        if msgpack is None:
+            raise RuntimeError("objeto MessagePack: falta instalar msgpack")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
+
+
+def read(s3, bucket, key, default=...):
+    """GET + decode; con `default` devuelve eso si la key no existe."""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=key)
+    except s3.exceptions.NoSuchKey:
+        if default is ...:
+            raise
+        return default
+    return decode(obj["Body"].read(), obj.get("ContentType"), obj.get("ContentEncoding"))
+
+
+# --- payloads por referencia ---
+def ref(key, path=None):
+    """Marcador `{"$ref": key[, "path": campo]}`: el payload ya está en `key`, no se duplica."""
+    return {"$ref": key, **({"path": path} if path else {})}
+
+
+def resolve(value, load):
+    """Reemplaza los `$ref` de `value` (recursivo) con `load(key)`; los que no se pueden leer quedan."""
+    if isinstance(value, list):
+        return [resolve(v, load) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if isinstance(value.get("$ref"), str) and set(value) <= {"$ref", "path"}:
+        try:
+            out = load(value["$ref"])
+        except Exception:
+            return value
+        return out.get(value["path"], value) if value.get("path") and isinstance(out, dict) else out
+    return {k: resolve(v, load) for k, v in value.items()}
@@ -0,0 +1,194 @@
+import json, threading, time
+from collections import OrderedDict
+from botocore.exceptions import ClientError
+from utils.log import jlog, env
+from utils import runtime
+from utils.s3_writer import executor
+
+# "s3": marcador idempotency/{stage}/{key}.json | "dynamodb": put condicional | "memory": sólo LRU
+STORE = env("IDEMPOTENCY_STORE", "s3").lower()
+TABLE = env("IDEMPOTENCY_TABLE", "demo-idempotency")
+PREFIX = env("IDEMPOTENCY_PREFIX", "idempotency/")
+TTL_S = int(env("IDEMPOTENCY_TTL_S", "86400"))
+LRU_SIZE = int(env("IDEMPOTENCY_LRU_SIZE", "10000"))
+# "correlation": correlationId + stage (sobrevive a re-envíos desde la DLQ) | "message": messageId
+KEY_MODE = env("IDEMPOTENCY_KEY", "correlation").lower()
+ENABLED = env("IDEMPOTENCY_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+
+
+class TtlLru:
+    """LRU acotado con vencimiento por entrada (evicción por TTL y por tamaño)."""
+
+    def __init__(self, size, ttl_s):
+        self.size = size
+        self.ttl_s = ttl_s
+        self._d = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now=None):
+        now = now if now is not None else time.time()
+        with self._lock:
+            exp = self._d.get(key)
+            if exp is None:
+                return False
+            if exp <= now:
+                del self._d[key]
+                return False
+            self._d.move_to_end(key)
+            return True
+
+    def put(self, key, expires_at):
+        with self._lock:
+            self._d[key] = expires_at
+            self._d.move_to_end(key)
+            while len(self._d) > self.size:
+                self._d.popitem(last=False)
+
+    def __len__(self):
+        return len(self._d)
+
+
+# vive mientras el contenedor esté "warm"
+_lru = TtlLru(LRU_SIZE, TTL_S)
+
+
+class Idempotency:
+    """Deduplicación por stage para los workers SQS.
+
+    Uso por batch: `prefetch(records)` consulta en paralelo los que no están en el LRU,
+    `seen(record)` dice si ya se procesó (se acusa sin I/O) y `mark(w, record, after=fut)`
+    deja el marcador recién cuando terminó la última escritura del record.
+    """
+
+    def __init__(self, stage, store=None, enabled=None):
+        self.stage = stage
+        self.store = (store or STORE).lower()
+        self.enabled = ENABLED if enabled is None else enabled
+        self.hits_local = 0
+        self.hits_store = 0
+        self.misses = 0
+        self._found = {}  # key -> bool, resultado del prefetch de esta invocación
+        self._cids = {}  # messageId -> correlationId de las órdenes ya decodificadas (sin re-parsear el body)
+
+    def key_for(self, record):
+        mid = record.get("messageId") or record.get("messageID")
+        if KEY_MODE == "correlation":
+            if mid in self._cids:
+                cid = self._cids[mid]
+            else:
+                try:
+                    body = record.get("body")
+                    cid = (json.loads(body) if isinstance(body, str) else body or {}).get("correlationId")
+                except Exception:
+                    cid = None
+            if cid:
+                return f"{self.stage}/cid/{cid}"
+        return f"{self.stage}/mid/{mid}"
+
+    # --- backing store ---
+    def _lookup(self, key):
+        now = time.time()
+        if self.store == "s3":
+            # HEAD alcanza: el vencimiento viaja en la metadata del marcador
+            try:
+                head = runtime.client("s3").head_object(
+                    Bucket=runtime.DATA_BUCKET, Key=f"{PREFIX}{key}.json"
+                )
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                    return None
+                raise
+            exp = float(head.get("Metadata", {}).get("expires-at", 0))
+            return exp if exp > now else None
+        if self.store == "dynamodb":
+            item = runtime.client("dynamodb").get_item(
+                TableName=TABLE, Key={"pk": {"S": key}}, ConsistentRead=True
+            ).get("Item")
+            if not item:
+                return None
+            exp = float(item["expiresAt"]["N"])
+            return exp if exp > now else None
+        return None
+
+    def _write(self, key, expires_at):
+        if self.store == "s3":
+            runtime.client("s3").put_object(
+                Bucket=runtime.DATA_BUCKET,
+                Key=f"{PREFIX}{key}.json",
+                Body=json.dumps({"t": int(time.time() * 1000), "expiresAt": expires_at}).encode("utf-8"),
+                Metadata={"expires-at": str(int(expires_at))},
+            )
+        elif self.store == "dynamodb":
+            ddb = runtime.client("dynamodb")
+            try:
+                # condicional: no pisa un marcador vigente de otra invocación concurrente
+                ddb.put_item(
+                    TableName=TABLE,
+                    Item={"pk": {"S": key}, "expiresAt": {"N": str(int(expires_at))}},
+                    ConditionExpression="attribute_not_exists(pk) OR expiresAt < :now",
+                    ExpressionAttributeValues={":now": {"N": str(int(time.time()))}},
+                )
+            except ddb.exceptions.ConditionalCheckFailedException:
+                pass  # ya estaba marcado: mismo resultado
+        return key
+
+    # --- API por batch ---
+    def prefetch(self, records, orders=()):
+        """`orders`: utils.orders.Order ya decodificadas de esos records (para no volver a parsear)."""
+        for o in orders:
+            self._cids[o.message_id] = o.correlation_id
+        if not self.enabled:
+            return
+        todo = [k for k in {self.key_for(r) for r in records} if not _lru.get(k)]
+        if not todo or self.store == "memory":
+            return
+        for key, exp in zip(todo, executor().map(self._lookup, todo)):
+            self._found[key] = exp is not None
+            if exp is not None:
+                _lru.put(key, exp)
+
+    def seen(self, record):
+        if not self.enabled:
+            return False
+        key = self.key_for(record)
+        if _lru.get(key):
+            if self._found.get(key):
+                self.hits_store += 1
+            else:
+                self.hits_local += 1
+            return True
+        if key not in self._found and self.store != "memory":
+            # no pasó por prefetch: consulta puntual
+            exp = self._lookup(key)
+            if exp is not None:
+                _lru.put(key, exp)
+                self.hits_store += 1
+                return True
+        self.misses += 1
+        return False
+
+    def mark(self, writer, record, after=None):
+        if not self.enabled:
+            return None
+        key = self.key_for(record)
+        expires_at = time.time() + TTL_S
+
+        def _done():
+            self._write(key, expires_at)
+            _lru.put(key, expires_at)
+            return key
+
+        return writer.call(f"idempotency:{key}", _done, after=after)
+
+    def report(self, component=None):
+        if not self.enabled:
+            return
+        jlog(
+            component=component or self.stage,
+            status="idempotency",
+            store=self.store,
+            hits_local=self.hits_local,
+            hits_store=self.hits_store,
+            misses=self.misses,
+            lru_size=len(_lru),
+        )
@@ -0,0 +1,62 @@
+import os, threading, time
+
+# ULID (https://github.com/ulid/spec): 48 bits de ms + 80 bits aleatorios en base32 de Crockford.
+# 26 caracteres que ordenan lexicográficamente por tiempo: las keys `orders/{id}`, `traces/{id}/...`
+# se pueden listar por rango con StartAfter=prefijo + time_prefix(ms).
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_DECODE = {c: i for i, c in enumerate(ALPHABET)}
+_RAND_BITS = 80
+
+_lock = threading.Lock()
+_last_ms = -1
+_last_rand = 0
+_pid = None
+
+
+def _encode(n, length):
+    out = []
+    for _ in range(length):
+        out.append(ALPHABET[n & 31])
+        n >>= 5
+    return "".join(reversed(out))
+
+
+def ulid(now_ms=None):
+    """ID monótono: dentro del mismo ms (o si el reloj vuelve atrás) incrementa la parte aleatoria.
+
+    La semilla aleatoria por ms hace que dos procesos/contenedores no choquen; después de un
+    fork se vuelve a sembrar. Costo por llamada: un lock y, como mucho, un os.urandom por ms.
+    """
+    global _last_ms, _last_rand, _pid
+    ms = int(time.time() * 1000) if now_ms is None else int(now_ms)
+    with _lock:
+        pid = os.getpid()
+        if pid != _pid:
+            _pid, _last_ms = pid, -1
+        if ms > _last_ms:
+            # bit alto en 0: deja margen para incrementar sin desbordar
+            _last_ms, _last_rand = ms, int.from_bytes(os.urandom(10), "big") >> 1
+        else:
+            _last_rand += 1
+            if _last_rand >> _RAND_BITS:
+                _last_ms, _last_rand = _last_ms + 1, int.from_bytes(os.urandom(10), "big") >> 1
+        ms, rand = _last_ms, _last_rand
+    return _encode((ms << _RAND_BITS) | rand, 26)
+
+
+def new_id(prefix=""):
+    """`new_id("TRK-")` -> "TRK-01J..."."""
+    return f"{prefix}{ulid()}"
+
+
+def time_prefix(ms):
+    """Los 10 primeros caracteres de cualquier ULID de ese ms (para StartAfter / rangos)."""
+    return _encode(int(ms), 10)
+
+
+def timestamp_ms(id_):
+    """ms de un ULID (acepta prefijo: "TRK-01J..." -> ms)."""
+    n = 0
+    for c in id_[-26:][:10].upper():
+        n = n * 32 + _DECODE[c]
+    return n
@@ -0,0 +1,154 @@
+import random, time
+from botocore.exceptions import ClientError
+from utils.log import jlog, env
+from utils import runtime
+
+# "dynamodb": reserva atómica con contadores condicionales | "off": no reserva (todo sale "reserved").
+# "off" por defecto: con "dynamodb" y la tabla sin stock sembrado (make seed-inventory) todo sale "insufficient"
+STORE = env("INVENTORY_STORE", "off").lower()
+TABLE = env("INVENTORY_TABLE", "demo-inventory")
+MAX_ATTEMPTS = int(env("INVENTORY_MAX_ATTEMPTS", "6"))
+TX_MAX_ITEMS = 100  # tope de TransactWriteItems
+
+# cancelaciones que se resuelven reintentando (otra transacción tocó los mismos items)
+RETRYABLE = ("TransactionConflict", "ThrottlingError", "ProvisionedThroughputExceeded", "RequestLimitExceeded")
+
+RESERVED, DUPLICATE, INSUFFICIENT, ERROR = "reserved", "duplicate", "insufficient", "error"
+
+
+def _ledger_key(order_id):
+    return f"order#{order_id}"
+
+
+class Inventory:
+    """Reserva de stock en DynamoDB para fulfillment.
+
+    Cada SKU es un item `{sku, available, reserved}`; reservar es
+    `available -= q, reserved += q` con la condición `available >= q`, junto con un
+    item `order#{orderId}` que sólo se crea si no existe (la reserva es idempotente
+    ante redeliveries). Por batch, `reserve(orders)` intenta todo en una
+    TransactWriteItems (cantidades sumadas por SKU); si alguna condición falla,
+    se aísla orden por orden para reportar el faltante de cada una. Los
+    TransactionConflict se reintentan con backoff.
+    """
+
+    def __init__(self, component, store=None):
+        self.component = component
+        self.store = (store or STORE).lower()
+        self.enabled = self.store != "off"
+        self.transactions = 0
+        self.conflicts = 0
+        self.insufficient = 0
+
+    # --- transacción ---
+    def _items(self, group):
+        """Items de la transacción: primero un ledger por orden, después un update por SKU."""
+        now = str(int(time.time() * 1000))
+        items = [
+            {
+                "Put": {
+                    "TableName": TABLE,
+                    "Item": {
+                        "sku": {"S": _ledger_key(order_id)},
+                        "lines": {"M": {s: {"N": str(q)} for s, q in lines.items()}},
+                        "t": {"N": now},
+                    },
+                    "ConditionExpression": "attribute_not_exists(sku)",
+                }
+            }
+            for order_id, lines in group
+        ]
+        totals = {}
+        for _, lines in group:
+            for sku, q in lines.items():
+                totals[sku] = totals.get(sku, 0) + q
+        skus = list(totals)
+        items += [
+            {
+                "Update": {
+                    "TableName": TABLE,
+                    "Key": {"sku": {"S": sku}},
+                    "UpdateExpression": "SET available = available - :q, reserved = if_not_exists(reserved, :zero) + :q",
+                    "ConditionExpression": "available >= :q",
+                    "ExpressionAttributeValues": {":q": {"N": str(totals[sku])}, ":zero": {"N": "0"}},
+                    "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+                }
+            }
+            for sku in skus
+        ]
+        return items, skus
+
+    def _reserve_group(self, group, results):
+        ddb = runtime.client("dynamodb")
+        items, skus = self._items(group)
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                self.transactions += 1
+                ddb.transact_write_items(TransactItems=items)
+                for order_id, _ in group:
+                    results[order_id] = {"status": RESERVED}
+                return
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                full = e.response.get("CancellationReasons", []) if code == "TransactionCanceledException" else []
+                reasons = [r.get("Code") for r in full]
+                if code in RETRYABLE or any(c in RETRYABLE for c in reasons):
+                    self.conflicts += 1
+                    time.sleep(random.uniform(0, 0.025 * 2**attempt))  # backoff con jitter
+                    continue
+                if code != "TransactionCanceledException":
+                    for order_id, _ in group:
+                        results[order_id] = {"status": ERROR, "error": str(e)}
+                    return
+                if len(group) > 1:
+                    # una condición falló sobre totales del batch: se reserva orden por orden
+                    for one in group:
+                        self._reserve_group([one], results)
+                    return
+                order_id, lines = group[0]
+                if reasons and reasons[0] == "ConditionalCheckFailed":
+                    # ya existe el ledger: la reserva se hizo en una entrega anterior
+                    results[order_id] = {"status": DUPLICATE}
+                    return
+                short = []
+                for sku, reason in zip(skus, full[1:]):
+                    if reason.get("Code") == "ConditionalCheckFailed":
+                        available = reason.get("Item", {}).get("available", {}).get("N")
+                        # sin ALL_OLD (ej. emuladores) el disponible no se conoce
+                        short.append(
+                            {"sku": sku, "requested": lines[sku], "available": int(available) if available else None}
+                        )
+                self.insufficient += 1
+                results[order_id] = {"status": INSUFFICIENT, "short": short}
+                return
+        for order_id, _ in group:
+            results[order_id] = {"status": ERROR, "error": f"{MAX_ATTEMPTS} conflictos seguidos"}
+
+    # --- API por batch ---
+    def reserve(self, orders):
+        """[(orderId, {sku: q})] (q ya validada: utils.orders.Order.lines) -> {orderId: {"status": reserved|duplicate|insufficient|error, ...}}."""
+        results = {}
+        if not self.enabled:
+            return {order_id: {"status": RESERVED} for order_id, _ in orders}
+        group, size, seen = [], 0, set()
+        for order_id, lines in orders:
+            if order_id in seen:
+                # la misma orden dos veces en el batch: un item no puede repetirse en la transacción
+                results[order_id] = {"status": DUPLICATE}
+                continue
+            seen.add(order_id)
+            n = 1 + len(lines)
+            if group and size + n > TX_MAX_ITEMS:
+                self._reserve_group(group, results)
+                group, size = [], 0
+            group.append((order_id, lines))
+            size += n
+        if group:
+            self._reserve_group(group, results)
+        return results
+
+    def report(self):
+        if not self.enabled:
+            return
+        jlog(component=self.component, status="inventory", store=self.store, transactions=self.transactions,
+             conflicts=self.conflicts, insufficient=self.insufficient)
@@ -0,0 +1,130 @@
+import hashlib
+from utils.log import env
+from utils.s3_writer import executor
+
+# Layout de las keys de alto ritmo (trazas y artefactos de los workers).
+# "flat":   traces/{cid}/{step}.json, orders/{orderId}.json, ... (como siempre)
+# "hashed": traces/{shard}/{cid}/{step}.json, orders/{shard}/{orderId}.json, ...
+# S3 limita ~3.500 PUT/s por prefijo: con un shard corto (hash del id) las escrituras
+# se reparten entre KEY_SHARDS prefijos. Lo mismo lee el server (server/index.js).
+LAYOUT = env("KEY_LAYOUT", "flat").lower()
+SHARDS = int(env("KEY_SHARDS", "16"))
+_WIDTH = len(f"{max(SHARDS - 1, 1):x}")
+
+
+def shard_of(id_, shards=None):
+    """Shard estable de un id: md5 (no por seguridad, por reparto parejo) -> hex de ancho fijo."""
+    shards = shards or SHARDS
+    width = len(f"{max(shards - 1, 1):x}")
+    n = int(hashlib.md5(str(id_).encode("utf-8")).hexdigest()[:8], 16) % shards
+    return f"{n:0{width}x}"
+
+
+def all_shards(shards=None):
+    shards = shards or SHARDS
+    width = len(f"{max(shards - 1, 1):x}")
+    return [f"{n:0{width}x}" for n in range(shards)]
+
+
+def _is_shard(part):
+    return len(part) == _WIDTH and all(c in "0123456789abcdef" for c in part)
+
+
+def sharded(base, id_, layout=None):
+    """Prefijo del id bajo `base` (que termina en "/"): "orders/" -> "orders/{shard}/"."""
+    if (layout or LAYOUT) != "hashed":
+        return base
+    return f"{base}{shard_of(id_)}/"
+
+
+def prefixes(base, layout=None):
+    """Prefijos a recorrer para leer todo `base`: uno por shard en "hashed"."""
+    if (layout or LAYOUT) != "hashed":
+        return [base]
+    return [f"{base}{s}/" for s in all_shards()]
+
+
+# --- keys de los workers ---
+def trace_prefix(cid, layout=None):
+    return f"{sharded('traces/', cid, layout)}{cid}/"
+
+
+def trace_key(cid, step, layout=None):
+    return f"{trace_prefix(cid, layout)}{step}.json"
+
+
+def order_key(order_id, layout=None):
+    return f"{sharded('orders/', order_id, layout)}{order_id}.json"
+
+
+def analytics_key(event_type, order_id, layout=None):
+    return f"{sharded(f'analytics/{event_type}/', order_id, layout)}{order_id}.json"
+
+
+def shipping_key(order_id, cid, layout=None):
+    return f"{sharded('shipping/OrderShipped/', order_id, layout)}{order_id}-{cid}.json"
+
+
+def parse_trace_key(key):
+    """traces/{cid}/{step}.json o traces/{shard}/{cid}/{step}.json -> (cid, step); None si no es un paso."""
+    parts = key.split("/")
+    if len(parts) == 4 and _is_shard(parts[1]):
+        parts = [parts[0]] + parts[2:]
+    # traces/_segments, traces/_index, ... no son trazas sueltas
+    if len(parts) != 3 or parts[0] != "traces" or parts[1].startswith("_") or not parts[2].endswith(".json"):
+        return None
+    return parts[1], parts[2][: -len(".json")]
+
+
+# --- lectura ---
+def _list_one(s3, bucket, prefix, start_after=None, stop_at=None):
+    """Objetos de `prefix` en orden de key; `start_after`/`stop_at` acotan el tramo."""
+    out = []
+    kw = {"StartAfter": start_after} if start_after else {}
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix, **kw):
+        for o in page.get("Contents", []):
+            if stop_at and o["Key"] >= stop_at:
+                return out
+            out.append(o)
+    return out
+
+
+def list_objects(s3, bucket, base, layout=None):
+    """Objetos (dicts de ListObjectsV2) de todo `base`, listando los shards en paralelo."""
+    todo = prefixes(base, layout)
+    if len(todo) == 1:
+        return _list_one(s3, bucket, todo[0])
+    out = []
+    for objs in executor().map(lambda p: _list_one(s3, bucket, p), todo):
+        out.extend(objs)
+    return out
+
+
+def list_loose_traces(s3, bucket, layout=None):
+    """Objetos de las trazas sueltas, sin recorrer traces/_segments/ ni traces/_index/.
+
+    En "hashed" los shards ya los dejan afuera. En "flat" los "_*" son un tramo contiguo
+    del orden de S3 (después de los ULID en mayúsculas, antes de los cid en minúsculas):
+    se lista hasta "traces/_" y de nuevo desde "traces/`" (el carácter que sigue a "_").
+    """
+    if (layout or LAYOUT) == "hashed":
+        return list_objects(s3, bucket, "traces/", layout)
+    head = _list_one(s3, bucket, "traces/", stop_at="traces/_")
+    return head + _list_one(s3, bucket, "traces/", start_after="traces/`")
+
+
+def list_keys(s3, bucket, base, layout=None):
+    return [o["Key"] for o in list_objects(s3, bucket, base, layout)]
+
+
+def list_trace(s3, bucket, cid, layout=None):
+    """Keys de un cid: un solo List sobre su prefijo (el shard sale del cid, sin fan-out).
+
+    Si el layout cambió, se mira también el prefijo del otro layout (objetos previos).
+    """
+    layout = layout or LAYOUT
+    keys = [o["Key"] for o in _list_one(s3, bucket, trace_prefix(cid, layout))]
+    if not keys:
+        other = "flat" if layout == "hashed" else "hashed"
+        keys = [o["Key"] for o in _list_one(s3, bucket, trace_prefix(cid, other))]
+    return keys
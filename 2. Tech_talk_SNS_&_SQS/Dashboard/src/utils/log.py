@@ -1,8 +1,132 @@
-import json, time, os, sys
+import json, time, os, sys, random, functools, threading
+from contextlib import contextmanager
+
+try:  # opcional: ~5x más rápido que json para serializar
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
 
-def jlog(**k):
-    k.setdefault("ts", int(time.time()*1000))
-    print(json.dumps(k), flush=True)
 
 def env(name, default=None):
     return os.getenv(name, default)
+
+
+LEVELS = {"debug": 10, "info": 20, "warn": 30, "error": 40}
+LOG_LEVEL = LEVELS.get(env("LOG_LEVEL", "info").lower(), 20)
+# proporción de líneas por record (jrecord) que se escriben; el resumen por invocación siempre sale
+SAMPLE_RATE = float(env("LOG_SAMPLE_RATE", "1"))
+# strings más largos que esto (ej. bodies) se recortan
+MAX_FIELD = int(env("LOG_MAX_FIELD", "512"))
+JSON_ENCODER = env("LOG_JSON", "orjson" if orjson else "json").lower()
+
+_buf = None  # lista de entradas mientras hay una invocación abierta
+_dropped = 0
+_lock = threading.Lock()
+
+
+def truncate(v, n=None):
+    n = MAX_FIELD if n is None else n
+    if isinstance(v, (bytes, bytearray)):
+        v = v.decode("utf-8", "replace")
+    if isinstance(v, str) and n and len(v) > n:
+        return f"{v[:n]}…(+{len(v) - n})"
+    return v
+
+
+def _dumps(k):
+    if JSON_ENCODER == "orjson" and orjson is not None:
+        return orjson.dumps(k, default=str).decode("utf-8")
+    return json.dumps(k, default=str)
+
+
+def _write(entries):
+    if not entries:
+        return
+    # una sola escritura a stdout por flush, en vez de una por línea
+    sys.stdout.write("".join(_dumps(e) + "\n" for e in entries))
+    sys.stdout.flush()
+
+
+def _emit(level, k, sampled=False):
+    global _dropped
+    # el nivel se mira antes de tocar los campos: un jdebug apagado no cuesta nada
+    if LEVELS[level] < LOG_LEVEL:
+        return
+    if sampled and SAMPLE_RATE < 1 and random.random() >= SAMPLE_RATE:
+        with _lock:
+            _dropped += 1
+        return
+    k.setdefault("ts", int(time.time()*1000))
+    if level != "info":
+        k.setdefault("level", level)
+    for f, v in k.items():
+        if isinstance(v, (str, bytes, bytearray)):
+            k[f] = truncate(v)
+    buf = _buf
+    if buf is not None:
+        buf.append(k)  # list.append es atómico: sirve desde los threads del pool
+    else:
+        _write([k])
+
+
+def jlog(**k):
+    _emit("info", k)
+
+
+def jdebug(**k):
+    _emit("debug", k)
+
+
+def jerror(**k):
+    _emit("error", k)
+
+
+def jrecord(**k):
+    """Línea por record: muestreada con LOG_SAMPLE_RATE para que el volumen no crezca con el batch."""
+    _emit("info", k, sampled=True)
+
+
+def raw(k):
+    """Línea tal cual, sin nivel, muestreo ni recorte (ej. documentos EMF). Respeta el buffer."""
+    buf = _buf
+    if buf is not None:
+        buf.append(k)
+    else:
+        _write([k])
+
+
+def flush():
+    global _buf
+    with _lock:
+        entries, _buf = _buf, ([] if _buf is not None else None)
+    _write(entries or [])
+
+
+@contextmanager
+def invocation(component=None):
+    """Bufferea las líneas de la invocación y las escribe juntas al salir (también si hubo error)."""
+    global _buf, _dropped
+    with _lock:
+        _buf, _dropped = [], 0
+    try:
+        yield
+    finally:
+        with _lock:
+            entries, dropped, _buf, _dropped = _buf or [], _dropped, None, 0
+        if dropped:
+            entries.append(
+                {"ts": int(time.time()*1000), "component": component, "status": "log-sampled",
+                 "dropped": dropped, "rate": SAMPLE_RATE}
+            )
+        _write(entries)
+
+
+def logged(component=None):
+    """Decorador para handlers: `@logged("thr")` envuelve la invocación en `invocation()`."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            with invocation(component):
+                return fn(*a, **kw)
+        return wrapper
+    return deco
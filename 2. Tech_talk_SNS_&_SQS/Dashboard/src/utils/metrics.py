@@ -0,0 +1,165 @@
+import functools, threading, time
+from contextlib import contextmanager
+from utils.log import env, raw
+
+# CloudWatch Embedded Metric Format: un documento por invocación, CloudWatch saca las métricas del log
+NAMESPACE = env("METRICS_NAMESPACE", "TechTalks/Demo")
+ENABLED = env("METRICS_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+MAX_VALUES = 100  # EMF acepta hasta 100 valores por métrica
+
+_current = None
+
+
+def _quantiles(values, n=MAX_VALUES):
+    """Si hay más de n muestras, n cuantiles equiespaciados: mismo p50/p99, documento acotado."""
+    if len(values) <= n:
+        return values
+    s = sorted(values)
+    return [s[min(len(s) - 1, int((i + 0.5) * len(s) / n))] for i in range(n)]
+
+
+class Metrics:
+    """Métricas de una invocación: contadores (`add`) y distribuciones (`observe`).
+
+    Todo queda en memoria y sale en un único documento EMF en `flush()`; el costo
+    de registrar (lock + append) se mide y se publica como `metrics_overhead_ms`.
+    """
+
+    def __init__(self, component, namespace=None):
+        self.component = component
+        self.namespace = namespace or NAMESPACE
+        self._sums = {}
+        self._values = {}
+        self._units = {}
+        self._props = {}
+        self._lock = threading.Lock()
+        self._overhead = 0.0
+
+    def add(self, name, n=1, unit="Count"):
+        t0 = time.perf_counter()
+        with self._lock:
+            self._sums[name] = self._sums.get(name, 0) + n
+            self._units[name] = unit
+            self._overhead += time.perf_counter() - t0
+
+    def observe(self, name, value, unit="Milliseconds"):
+        t0 = time.perf_counter()
+        with self._lock:
+            self._values.setdefault(name, []).append(value)
+            self._units[name] = unit
+            self._overhead += time.perf_counter() - t0
+
+    def prop(self, key, value):
+        self._props[key] = value
+
+    @contextmanager
+    def timed(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - t0) * 1000)
+
+    def observe_future(self, name, fut, t0):
+        """Tiempo desde t0 (perf_counter) hasta que termina `fut` (o ahora, si no hay future)."""
+        if fut is None:
+            self.observe(name, (time.perf_counter() - t0) * 1000)
+            return
+        fut.add_done_callback(lambda f: self.observe(name, (time.perf_counter() - t0) * 1000))
+
+    def to_emf(self, now_ms=None):
+        t0 = time.perf_counter()
+        with self._lock:
+            doc = {"component": self.component, **self._props}
+            names = []
+            for name, v in self._sums.items():
+                doc[name] = v
+                names.append(name)
+            for name, vals in self._values.items():
+                doc[name] = [round(v, 3) if isinstance(v, float) else v for v in _quantiles(vals)]
+                doc[f"{name}_n"] = len(vals)
+                names.append(name)
+            overhead = self._overhead + (time.perf_counter() - t0)
+        doc["metrics_overhead_ms"] = round(overhead * 1000, 3)
+        metrics = [{"Name": n, "Unit": self._units[n]} for n in names]
+        metrics.append({"Name": "metrics_overhead_ms", "Unit": "Milliseconds"})
+        doc["_aws"] = {
+            "Timestamp": now_ms if now_ms is not None else int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {"Namespace": self.namespace, "Dimensions": [["component"]], "Metrics": metrics}
+            ],
+        }
+        return doc
+
+    def flush(self):
+        if ENABLED:
+            raw(self.to_emf())
+
+
+class _Noop(Metrics):
+    # fuera de una invocación medida: se puede llamar igual sin chequear None
+    def add(self, *a, **k):
+        pass
+
+    def observe(self, *a, **k):
+        pass
+
+
+_noop = _Noop("none")
+
+
+def current():
+    return _current or _noop
+
+
+def measured(component):
+    """Decorador para handlers: abre un Metrics para la invocación y lo emite al final.
+
+    Registra solo: tamaño de batch, distribución de ApproximateReceiveCount, duración
+    del handler y errores. Usar debajo de `@logged` para que el EMF entre en el mismo flush.
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(event, context):
+            global _current
+            m = _current = Metrics(component)
+            recs = event.get("Records") if isinstance(event, dict) else None
+            if recs is not None:
+                m.add("batch_size", len(recs))
+                for r in recs:
+                    rc = (r.get("attributes") or {}).get("ApproximateReceiveCount")
+                    if rc:
+                        m.observe("receive_count", int(rc), unit="Count")
+            t0 = time.perf_counter()
+            try:
+                return fn(event, context)
+            except Exception:
+                m.add("handler_errors")
+                raise
+            finally:
+                m.observe("handler_ms", (time.perf_counter() - t0) * 1000)
+                _current = None
+                m.flush()
+        return wrapper
+    return deco
+
+
+# --- latencia / errores / reintentos de las llamadas AWS (los hooks de botocore están en utils.runtime) ---
+def record_call(svc, ms, status, parsed):
+    m = _current
+    if m is None:
+        return
+    m.observe(f"{svc}_ms", ms)
+    meta = parsed.get("ResponseMetadata", {})
+    if meta.get("RetryAttempts"):
+        m.add(f"{svc}_retries", meta["RetryAttempts"])
+    # 404 no cuenta: un HEAD sin objeto es un "miss" esperado (ej. idempotencia)
+    if status >= 400 and status != 404:
+        m.add(f"{svc}_errors")
+
+
+def record_call_error(svc):
+    # sin respuesta HTTP (timeout, conexión): también es error
+    m = _current
+    if m is not None:
+        m.add(f"{svc}_errors")
@@ -0,0 +1,162 @@
+import json, math, time
+from utils.log import jlog
+
+# tope por línea: una cantidad absurda es un mensaje roto, no un pedido
+MAX_QUANTITY = 10_000
+
+
+class Poison(ValueError):
+    """Mensaje que no se puede procesar nunca (reintentarlo no cambia nada)."""
+
+
+class Order:
+    """Orden ya validada, igual para fulfillment, analytics y shipping.
+
+    `decode(record)` la arma en una sola pasada desde el record SQS (body crudo o
+    envuelto por SNS). `message` es el dict original sin copiar (para trazas), o None
+    con `keep_message=False`: así el batch decodificado no retiene un dict por record.
+    """
+
+    __slots__ = (
+        "message_id",
+        "correlation_id",
+        "order_id",
+        "event_type",
+        "priority",
+        "product",
+        "quantity",
+        "price",
+        "ts",
+        "_lines",
+        "force_fail",
+        "message",
+    )
+
+    def __init__(self, message_id, message, product, quantity, price, ts, lines, force_fail, keep_message=True):
+        self.message_id = message_id
+        self.message = message if keep_message else None
+        self.correlation_id = message.get("correlationId")
+        self.order_id = message.get("orderId")
+        self.event_type = message.get("eventType")
+        self.priority = message.get("priority")
+        self.product = product
+        self.quantity = quantity
+        self.price = price
+        self.ts = ts
+        self._lines = lines  # sólo con `items`: una orden de una línea no aloca otro dict
+        self.force_fail = force_fail  # frozenset de componentes ("all" = todos)
+
+    @property
+    def lines(self):
+        """{sku: cantidad} (multi-línea con `items`, si no product/quantity)."""
+        return self._lines if self._lines is not None else {self.product: self.quantity}
+
+    def fails(self, component):
+        """Igual que runtime.should_fail, pero ya resuelto al decodificar."""
+        return "all" in self.force_fail or component in self.force_fail
+
+    def __repr__(self):
+        return f"Order({self.order_id!r}, {self.product!r} x{self.quantity}, cid={self.correlation_id!r})"
+
+
+def _quantity(v, sku):
+    # bool es int: True no es una cantidad
+    if isinstance(v, bool):
+        raise Poison(f"cantidad inválida para {sku}: {v!r}")
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    elif isinstance(v, str) and v.strip().isdigit():
+        v = int(v)
+    if not isinstance(v, int) or not 0 < v <= MAX_QUANTITY:
+        raise Poison(f"cantidad inválida para {sku}: {v!r}")
+    return v
+
+
+def _price(v):
+    if isinstance(v, bool):
+        raise Poison(f"precio inválido: {v!r}")
+    try:
+        p = float(v)
+    except (TypeError, ValueError):
+        raise Poison(f"precio inválido: {v!r}") from None
+    if not math.isfinite(p) or p < 0:
+        raise Poison(f"precio inválido: {v!r}")
+    return p
+
+
+def _force_fail(ff):
+    if not ff:
+        return frozenset()
+    if ff is True:
+        return frozenset(("all",))
+    if isinstance(ff, str):
+        return frozenset((ff.lower(),))
+    if isinstance(ff, list):
+        return frozenset(str(s).lower() for s in ff)
+    return frozenset()
+
+
+def _sku(it):
+    return str(it.get("product") or it.get("productId") or "UNKNOWN")
+
+
+def parse_body(body):
+    """body SQS -> dict de la orden; desenvuelve la notificación SNS (sin raw delivery)."""
+    if isinstance(body, (bytes, bytearray)):
+        body = body.decode("utf-8")
+    try:
+        msg = json.loads(body) if isinstance(body, str) else body
+        if isinstance(msg, dict) and msg.get("Type") == "Notification" and isinstance(msg.get("Message"), str):
+            msg = json.loads(msg["Message"])
+    except ValueError as e:
+        raise Poison(f"body no es JSON: {e}") from None
+    if not isinstance(msg, dict):
+        raise Poison(f"body no es un objeto: {type(msg).__name__}")
+    return msg
+
+
+def decode(record, keep_message=True):
+    """record SQS (o SNS) -> Order; lanza Poison si el mensaje no sirve."""
+    mid = record.get("messageId") or record.get("messageID")
+    if "Sns" in record:
+        body = record["Sns"].get("Message")
+    else:
+        body = record.get("body")
+    msg = parse_body(body if body is not None else "{}")
+
+    items = msg.get("items")
+    if items is not None and (not isinstance(items, list) or not all(isinstance(i, dict) for i in items)):
+        raise Poison("items debe ser una lista de objetos")
+    lines = None
+    if items:
+        lines = {}
+        for it in items:
+            sku = _sku(it)
+            lines[sku] = lines.get(sku, 0) + _quantity(it.get("quantity", 1), sku)
+
+    product = _sku(msg)
+    quantity = _quantity(msg.get("quantity", 1), product)
+    price = _price(msg.get("price", 0))
+    ts = msg.get("sentAt") or msg.get("timestamp")
+    if isinstance(ts, str) and ts.isdigit():
+        ts = int(ts)
+    if ts is not None and (isinstance(ts, bool) or not isinstance(ts, (int, float))):
+        raise Poison(f"timestamp inválido: {ts!r}")
+    ts = int(ts) if ts else int(time.time() * 1000)
+    return Order(mid, msg, product, quantity, price, ts, lines, _force_fail(msg.get("forceFail")), keep_message)
+
+
+def decode_batch(records, component, keep_message=True):
+    """-> ([(record, Order)], [messageId de los poison]); los poison quedan logueados.
+
+    Va antes de cualquier I/O: un mensaje roto vuelve a la cola (→ DLQ) sin escrituras a S3.
+    """
+    ok, poison = [], []
+    for r in records:
+        try:
+            ok.append((r, decode(r, keep_message)))
+        except Poison as e:
+            mid = r.get("messageId") or r.get("messageID")
+            jlog(component=component, status="poison", id=mid, error=str(e))
+            poison.append(mid)
+    return ok, poison
@@ -0,0 +1,131 @@
+import json, random, time
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from utils.log import jlog, env
+from utils import runtime
+
+# "dynamodb": contadores con ADD (atómico, sin releer) | "off"
+# "s3": un objeto por bucket de tiempo con PUT condicional (ETag); necesita un botocore con
+# IfMatch/IfNoneMatch en PutObject (boto3 >= 1.35.68) y un S3 que los respete
+STORE = env("ROLLUP_STORE", "dynamodb").lower()
+TABLE = env("ROLLUP_TABLE", "demo-analytics-rollups")
+PREFIX = env("ROLLUP_PREFIX", "rollups/analytics/")
+BUCKET_S = int(env("ROLLUP_BUCKET_S", "3600"))
+MAX_ATTEMPTS = int(env("ROLLUP_MAX_ATTEMPTS", "8"))
+
+
+def bucket_of(ts_ms, bucket_s=None):
+    """Inicio del bucket de tiempo (UTC) como "YYYY-MM-DDTHH:MM"."""
+    bucket_s = bucket_s or BUCKET_S
+    start = int(ts_ms // 1000 // bucket_s * bucket_s)
+    return datetime.fromtimestamp(start, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M")
+
+
+def _zero():
+    return {"quantity": 0, "revenue": 0.0, "count": 0}
+
+
+def merge(doc, totals):
+    """Suma los totales del batch ({product: {quantity, revenue, count}}) al documento del bucket."""
+    products = doc.setdefault("products", {})
+    for product, t in totals.items():
+        cur = products.setdefault(product, _zero())
+        cur["quantity"] += t["quantity"]
+        cur["revenue"] = round(cur["revenue"] + t["revenue"], 2)
+        cur["count"] += t["count"]
+    return doc
+
+
+class Rollup:
+    """Pre-agregado por (bucket de tiempo, producto) para los workers de analytics.
+
+    Uso por batch: `add(...)` acumula en memoria cada record procesado OK y
+    `flush(writer)` mezcla un total por bucket con el store (en paralelo, un future
+    por bucket). Concurrencia: en S3 se relee y reintenta si el ETag cambió; en
+    DynamoDB el ADD es atómico. La entrega es al-menos-una-vez: el marcador de
+    idempotencia del record va después de su merge.
+    """
+
+    def __init__(self, component, store=None):
+        self.component = component
+        self.store = (store or STORE).lower()
+        self.enabled = self.store != "off"
+        self.totals = {}  # bucket -> {product -> totales}
+        self.writes = 0
+        self.conflicts = 0
+
+    def add(self, product, quantity, price, ts_ms):
+        bucket = bucket_of(ts_ms)
+        t = self.totals.setdefault(bucket, {}).setdefault(product, _zero())
+        t["quantity"] += quantity
+        t["revenue"] += quantity * price
+        t["count"] += 1
+        return bucket
+
+    # --- backing store ---
+    def _merge_s3(self, bucket, totals):
+        s3 = runtime.client("s3")
+        runtime.require_conditional_put(s3, "ROLLUP_STORE=s3")
+        key = f"{PREFIX}{bucket.replace(':', '')}.json"
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                obj = s3.get_object(Bucket=runtime.DATA_BUCKET, Key=key)
+                doc, cond = json.loads(obj["Body"].read()), {"IfMatch": obj["ETag"]}
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                    raise
+                doc, cond = {"bucket": bucket, "bucketS": BUCKET_S}, {"IfNoneMatch": "*"}
+            merge(doc, totals)
+            doc["updatedAt"] = int(time.time() * 1000)
+            try:
+                s3.put_object(
+                    Bucket=runtime.DATA_BUCKET,
+                    Key=key,
+                    Body=json.dumps(doc).encode("utf-8"),
+                    ContentType="application/json",
+                    **cond,
+                )
+                self.writes += 1
+                return bucket
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in runtime.CONFLICT_CODES:
+                    raise
+                self.conflicts += 1
+                time.sleep(random.uniform(0, 0.02 * 2**attempt))  # backoff con jitter
+        raise RuntimeError(f"rollup {key}: {MAX_ATTEMPTS} conflictos seguidos")
+
+    def _merge_dynamodb(self, bucket, totals):
+        ddb = runtime.client("dynamodb")
+        for product, t in totals.items():
+            ddb.update_item(
+                TableName=TABLE,
+                Key={"pk": {"S": bucket}, "sk": {"S": product}},
+                UpdateExpression="ADD quantity :q, revenue :r, #c :c",
+                ExpressionAttributeNames={"#c": "count"},
+                ExpressionAttributeValues={
+                    ":q": {"N": str(t["quantity"])},
+                    ":r": {"N": str(round(t["revenue"], 2))},
+                    ":c": {"N": str(t["count"])},
+                },
+            )
+            self.writes += 1
+        return bucket
+
+    # --- API por batch ---
+    def flush(self, writer):
+        """Un merge por bucket de tiempo en el pool del writer; devuelve {bucket: future}."""
+        if not self.enabled:
+            return {}
+        fn = self._merge_dynamodb if self.store == "dynamodb" else self._merge_s3
+        out = {
+            bucket: writer.call(f"rollup:{bucket}", lambda b=bucket, t=totals: fn(b, t))
+            for bucket, totals in self.totals.items()
+        }
+        self.totals = {}
+        return out
+
+    def report(self):
+        if not self.enabled:
+            return
+        jlog(component=self.component, status="rollup", store=self.store, writes=self.writes,
+             conflicts=self.conflicts)
@@ -0,0 +1,130 @@
+import json, os, threading, time
+import boto3
+from botocore.config import Config
+from utils.log import env
+from utils import backpressure, metrics
+
+AWS_ENDPOINT_URL = env("AWS_ENDPOINT_URL")
+DATA_BUCKET = env("DATA_BUCKET", "demo-data")
+
+
+def _flag(name, default):
+    return env(name, default).lower() in ("1", "true", "yes", "on")
+
+
+def client_config() -> Config:
+    # AWS_RETRY_MODE / AWS_MAX_ATTEMPTS son los mismos nombres que lee botocore
+    return Config(
+        max_pool_connections=int(env("AWS_MAX_POOL_CONNECTIONS", "16")),
+        tcp_keepalive=_flag("AWS_TCP_KEEPALIVE", "true"),
+        connect_timeout=float(env("AWS_CONNECT_TIMEOUT", "2")),
+        read_timeout=float(env("AWS_READ_TIMEOUT", "10")),
+        retries={
+            "mode": env("AWS_RETRY_MODE", "adaptive"),
+            "max_attempts": int(env("AWS_MAX_ATTEMPTS", "4")),
+        },
+    )
+
+
+# respuestas de S3 cuando el If-Match / If-None-Match no se cumple (otro escritor llegó antes)
+CONFLICT_CODES = ("PreconditionFailed", "ConditionalRequestConflict", "412", "409")
+
+
+def require_conditional_put(s3, what):
+    """Un botocore viejo rechaza IfMatch/IfNoneMatch con ParamValidationError: mejor un error que lo diga."""
+    if "IfMatch" not in s3.meta.service_model.operation_model("PutObject").input_shape.members:
+        raise RuntimeError(f"{what} necesita boto3 >= 1.35.68 (IfMatch en PutObject)")
+
+
+# --- hooks de botocore: una sola pasada por llamada, que alimenta utils.metrics y utils.backpressure ---
+def _service(event_name):
+    # "after-call.s3.PutObject" -> "s3"
+    return event_name.split(".")[1].lower().replace("-", "_")
+
+
+def _before_call(context=None, **kw):
+    if context is not None:
+        context["call_t0"] = time.perf_counter()
+
+
+def _after_call(http_response=None, parsed=None, context=None, event_name="", **kw):
+    t0 = (context or {}).get("call_t0")
+    if t0 is None:
+        return
+    svc, ms = _service(event_name), (time.perf_counter() - t0) * 1000
+    status = getattr(http_response, "status_code", 200)
+    metrics.record_call(svc, ms, status, parsed or {})
+    backpressure.record_call(svc, ms, status, parsed or {})
+
+
+def _after_call_error(context=None, event_name="", **kw):
+    t0 = (context or {}).get("call_t0")
+    svc = _service(event_name)
+    metrics.record_call_error(svc)
+    backpressure.record_call_error(svc, (time.perf_counter() - t0) * 1000 if t0 is not None else 0.0)
+
+
+def instrument(client):
+    ev = client.meta.events
+    ev.register("before-call", _before_call)
+    ev.register("after-call", _after_call)
+    ev.register("after-call-error", _after_call_error)
+    return client
+
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # un proceso forkeado (scripts/local_runtime.py) no comparte los sockets keep-alive del padre
+    global _lock
+    _clients.clear()
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def client(service, endpoint_url=None, region_name=None):
+    """Cliente boto3 cacheado por proceso y por (servicio, endpoint, región).
+
+    Se crea la primera vez que se pide; las invocaciones "warm" reusan el cliente
+    y su pool de conexiones (sin volver a pagar construcción ni handshake TLS).
+    Las llamadas quedan medidas en el Metrics de la invocación (utils.metrics) y
+    alimentan el breaker del servicio (utils.backpressure).
+    """
+    endpoint_url = endpoint_url or AWS_ENDPOINT_URL
+    key = (service, endpoint_url, region_name)
+    c = _clients.get(key)
+    if c is None:
+        # boto3.client() no es thread-safe al crear: un solo constructor a la vez
+        with _lock:
+            c = _clients.get(key)
+            if c is None:
+                kw = {"config": client_config()}
+                if endpoint_url:
+                    kw["endpoint_url"] = endpoint_url
+                if region_name:
+                    kw["region_name"] = region_name
+                c = _clients[key] = instrument(boto3.client(service, **kw))
+    return c
+
+
+def should_fail(service_name: str, msg: dict) -> bool:
+    ff = msg.get("forceFail")
+    if not ff:
+        return False
+    if ff is True or ff == "all":
+        return True
+    if isinstance(ff, str):
+        return ff.lower() == service_name.lower()
+    if isinstance(ff, list):
+        return any(str(s).lower() == service_name.lower() for s in ff)
+    return False
+
+
+def write_json(key, obj, bucket=None):
+    client("s3").put_object(
+        Bucket=bucket or DATA_BUCKET, Key=key, Body=json.dumps(obj).encode("utf-8")
+    )
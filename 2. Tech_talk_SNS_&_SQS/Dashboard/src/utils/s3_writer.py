@@ -0,0 +1,127 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils.log import jlog, env
+from utils import backpressure, codec
+
+# cantidad máxima de PutObject en vuelo por proceso (<= pool de conexiones de botocore, 10 por defecto)
+MAX_WORKERS = int(env("S3_WRITE_CONCURRENCY", "8"))
+
+_pool = None
+
+
+def executor():
+    # el pool se reutiliza entre invocaciones "warm" (y lo comparten los demás utils)
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="s3w")
+    return _pool
+
+
+def _pct(sorted_vals, p):
+    if not sorted_vals:
+        return 0
+    i = min(len(sorted_vals) - 1, int(round(p / 100.0 * (len(sorted_vals) - 1))))
+    return sorted_vals[i]
+
+
+class BatchWriter:
+    """Envía los PutObject de un batch en paralelo (pool acotado) y mide la latencia de cada uno.
+
+    `put_json(key, obj, after=fut)` no arranca hasta que `fut` termine OK: así la traza
+    `20-*-processed` nunca aterriza antes que su artefacto. Si `fut` falla, la escritura
+    dependiente no se hace y su future falla con el mismo error.
+    Cada llamada pasa por el breaker del servicio (utils.backpressure): espera lugar si el
+    límite en vuelo bajó y falla rápido con CircuitOpen si el circuito está abierto.
+    """
+
+    def __init__(self, s3, bucket, component=None, raise_errors=True, service="s3"):
+        self.s3 = s3
+        self.bucket = bucket
+        self.component = component
+        self.breaker = backpressure.breaker(service)
+        # False: el handler revisa los futures de cada record (partial batch response)
+        self.raise_errors = raise_errors
+        self.latencies = []  # [(key, ms)] en orden de finalización
+        self._pending = []
+        self._t0 = time.perf_counter()
+
+    def _timed(self, label, fn):
+        with self.breaker.slot():
+            t = time.perf_counter()
+            out = fn()
+        self.latencies.append((label, round((time.perf_counter() - t) * 1000, 2)))
+        return out
+
+    def put_json(self, key, obj, after=None, encoding=None) -> Future:
+        """JSON compacto, gzip o MessagePack según ARTIFACT_ENCODING (utils.codec), con sus headers."""
+        body, headers = codec.encode(obj, encoding)
+        return self.put_bytes(key, body, after=after, **headers)
+
+    def put_bytes(self, key, body, after=None, **put_kw) -> Future:
+        def _put():
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=body, **put_kw)
+            return key
+
+        return self.call(key, _put, after=after)
+
+    def call(self, label, fn, after=None) -> Future:
+        """Corre `fn()` en el pool (midiendo su latencia como `label`), opcionalmente después de `after`."""
+        if after is None:
+            fut = executor().submit(self._timed, label, fn)
+        else:
+            fut = Future()
+
+            def _chain(dep):
+                err = dep.exception()
+                if err is not None:
+                    fut.set_exception(err)
+                    return
+                inner = executor().submit(self._timed, label, fn)
+                inner.add_done_callback(
+                    lambda f: fut.set_exception(f.exception())
+                    if f.exception() is not None
+                    else fut.set_result(f.result())
+                )
+
+            after.add_done_callback(_chain)
+        self._pending.append(fut)
+        return fut
+
+    def wait(self):
+        """Espera todas las escrituras pendientes; devuelve la lista de errores."""
+        errors = []
+        # las dependientes se agregan a _pending al llamar put_json, así que alcanza con recorrerla
+        for fut in self._pending:
+            err = fut.exception()
+            if err is not None:
+                errors.append(err)
+        self._pending = []
+        self.report()
+        return errors
+
+    def report(self):
+        if not self.latencies:
+            return
+        ms = sorted(l for _, l in self.latencies)
+        slowest = max(self.latencies, key=lambda kl: kl[1])
+        jlog(
+            component=self.component,
+            status="s3-writes",
+            writes=len(ms),
+            p50_ms=_pct(ms, 50),
+            p99_ms=_pct(ms, 99),
+            max_ms=ms[-1],
+            sum_ms=round(sum(ms), 2),
+            wall_ms=round((time.perf_counter() - self._t0) * 1000, 2),
+            slowest=slowest[0],
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        errors = self.wait()
+        # si el handler ya está fallando, dejamos que su excepción siga
+        if exc is None and errors and self.raise_errors:
+            raise errors[0]
+        return False
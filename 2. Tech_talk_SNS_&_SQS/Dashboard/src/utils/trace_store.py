@@ -0,0 +1,246 @@
+import json, os, time
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from utils.log import env
+from utils import codec, ids, keys
+from utils.s3_writer import executor
+
+# "objects": un objeto S3 por paso (keys.trace_key: traces/[{shard}/]{cid}/{step}.json)
+# "segment": se juntan los pasos de la invocación en un NDJSON por batch + índice
+TRACE_SINK = env("TRACE_SINK", "objects").lower()
+# "inline": cada paso guarda su payload completo | "ref": lo que ya está en S3 va como {"$ref": key}
+TRACE_PAYLOADS = env("TRACE_PAYLOADS", "inline").lower()
+
+SEGMENTS_PREFIX = "traces/_segments/"
+INDEX_SUFFIX = ".idx.json"
+COUNTERS_KEY = "traces/_index/counters.json"
+# índice global cid -> segmentos (lo mantiene el compactador), un archivo por día del cid y hash:
+# traces/_index/cids/dt={día del ULID}/{shard}.json. Un día que pasó ya no crece.
+# Los índices de los segmentos de los workers esperan en PENDING_PREFIX hasta que los junta.
+CID_INDEX_PREFIX = "traces/_index/cids/"
+PENDING_PREFIX = "traces/_index/pending/"
+CID_INDEX_SHARDS = int(env("TRACE_INDEX_SHARDS", "16"))
+# un cid que no es ULID no tiene fecha
+NO_DAY = "none"
+# los índices pendientes no cambian (se escriben una vez y el compactador los borra): se cachean
+PENDING_CACHE_MAX = int(env("TRACE_PENDING_CACHE", "4096"))
+_pending_cache = {}
+
+# mismos contadores que arma `/metrics` (metricsByTrace) a partir de los nombres de paso
+STEP_COUNTERS = {
+    "00-published": "published",
+    "01-routes": "routed",
+    "10-fulfillment-received": "f_recv",
+    "20-fulfillment-processed": "f_done",
+    "11-analytics-received": "a_recv",
+    "21-analytics-processed": "a_done",
+    "12-shipping-received": "s_recv",
+    "22-shipping-processed": "s_done",
+}
+
+
+def segment_key(component, now_ms=None):
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    dt = datetime.fromtimestamp(now_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+    return f"{SEGMENTS_PREFIX}dt={dt}/{component}-{now_ms}-{os.urandom(4).hex()}.ndjson"
+
+
+def cid_day(cid):
+    """"YYYY-MM-DD" (UTC) del ULID del cid (acepta prefijo), o NO_DAY si no es un ULID."""
+    tail = cid[-26:].upper()
+    if len(tail) < 26 or any(c not in ids.ALPHABET for c in tail):
+        return NO_DAY
+    try:
+        return datetime.fromtimestamp(ids.timestamp_ms(tail) / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+    except (OverflowError, OSError, ValueError):
+        return NO_DAY
+
+
+def cid_index_key(cid, shards=None):
+    return f"{CID_INDEX_PREFIX}dt={cid_day(cid)}/{keys.shard_of(cid, shards or CID_INDEX_SHARDS)}.json"
+
+
+def is_flat_cid_index(key):
+    """traces/_index/cids/{shard}.json: el layout anterior, sin día (el compactador lo migra)."""
+    rest = key[len(CID_INDEX_PREFIX):]
+    return key.startswith(CID_INDEX_PREFIX) and "/" not in rest and rest.endswith(".json")
+
+
+def pending_index_key(segment):
+    """traces/_segments/dt=.../x.ndjson -> traces/_index/pending/dt=.../x.ndjson.idx.json"""
+    return f"{PENDING_PREFIX}{segment[len(SEGMENTS_PREFIX):]}{INDEX_SUFFIX}"
+
+
+def encode_segment(entries):
+    """entries: [(cid, step, data)] -> (bytes NDJSON, índice {cid: {offset, length, steps}}).
+
+    Las líneas de un mismo cid quedan contiguas, así que leer un cid es un único GET con Range.
+    """
+    by_cid = {}
+    for cid, step, data in entries:
+        by_cid.setdefault(cid, []).append((step, data))
+
+    chunks, index, offset = [], {}, 0
+    for cid, steps in by_cid.items():
+        start = offset
+        for step, data in steps:
+            line = (json.dumps({"cid": cid, "step": step, "data": data}) + "\n").encode("utf-8")
+            chunks.append(line)
+            offset += len(line)
+        index[cid] = {"offset": start, "length": offset - start, "steps": [s for s, _ in steps]}
+    return b"".join(chunks), index
+
+
+def decode_lines(body):
+    for line in body.splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+
+class TraceSink:
+    """Destino de las trazas de una invocación, sobre un BatchWriter.
+
+    En modo "objects" cada `put` es un PutObject (igual que antes). En modo "segment"
+    se bufferean y en `flush()` (o al salir del `with`) se escribe un solo NDJSON + su índice.
+    Un paso con `after=fut` sólo entra al segmento si `fut` terminó OK.
+    En los dos modos `put` devuelve un future que termina cuando el paso quedó escrito:
+    en "segment" recién después del flush, así que hay que hacer flush antes de revisarlos.
+    """
+
+    def __init__(self, writer, component, mode=None, payloads=None):
+        self.w = writer
+        self.component = component
+        self.mode = (mode or TRACE_SINK).lower()
+        self.by_ref = (payloads or TRACE_PAYLOADS).lower() == "ref"
+        self._buf = []  # [(cid, step, data, after, future del paso)]
+
+    def payload(self, value, key, path=None):
+        """`value` tal cual, o con TRACE_PAYLOADS=ref una referencia a donde ya está guardado."""
+        return codec.ref(key, path) if self.by_ref else value
+
+    def put(self, cid, step, data, after=None):
+        if self.mode != "segment":
+            return self.w.put_json(keys.trace_key(cid, step), data, after=after)
+        fut = Future()
+        self._buf.append((cid, step, data, after, fut))
+        return fut
+
+    def flush(self):
+        """Escribe el segmento con lo bufferado; devuelve el future del índice (o None)."""
+        buf, self._buf = self._buf, []
+        entries, waiting = [], []
+        for cid, step, data, after, fut in buf:
+            err = after.exception() if after is not None else None
+            if err is not None:
+                fut.set_exception(err)
+                continue
+            entries.append((cid, step, data))
+            waiting.append(fut)
+        if not entries:
+            return None
+        body, index = encode_segment(entries)
+        key = segment_key(self.component)
+        seg = self.w.put_bytes(key, body)
+        idx = {"segment": key, "component": self.component, "cids": index}
+        # el índice recién cuando el segmento existe; sin índice el paso no se encuentra
+        done = self.w.put_json(pending_index_key(key), idx, after=seg)
+        done.add_done_callback(lambda f: _settle(waiting, f))
+        return done
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+
+def _settle(futs, src):
+    err = src.exception()
+    for f in futs:
+        if err is not None:
+            f.set_exception(err)
+        else:
+            f.set_result(src.result())
+
+
+def _read(s3, bucket, key, byte_range=None):
+    kw = {"Bucket": bucket, "Key": key}
+    if byte_range:
+        kw["Range"] = "bytes=%d-%d" % byte_range
+    return s3.get_object(**kw)["Body"].read()
+
+
+def _list(s3, bucket, prefix, start_after=None):
+    kw = {"StartAfter": start_after} if start_after else {}
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix, **kw):
+        for o in page.get("Contents", []):
+            yield o["Key"]
+
+
+def load_pending(s3, bucket, since_day=None):
+    """[(key, índice)] de los segmentos de los workers que el compactador todavía no juntó.
+
+    Con `since_day` ("YYYY-MM-DD") el List arranca en los segmentos de ese día. Sólo se leen
+    los índices que no están en el cache del proceso.
+    """
+    start = f"{PENDING_PREFIX}dt={since_day}" if since_day else None
+    todo = [k for k in _list(s3, bucket, PENDING_PREFIX, start) if k.endswith(INDEX_SUFFIX)]
+    missing = [k for k in todo if (bucket, k) not in _pending_cache]
+    for k, idx in zip(missing, executor().map(lambda k: codec.read(s3, bucket, k, None), missing)):
+        # uno ya juntado y borrado entre el List y el GET ya está en el índice global
+        if idx:
+            _pending_cache[(bucket, k)] = idx
+    while len(_pending_cache) > PENDING_CACHE_MAX:
+        _pending_cache.pop(next(iter(_pending_cache)))
+    return [(k, _pending_cache[(bucket, k)]) for k in todo if (bucket, k) in _pending_cache]
+
+
+def segment_entries(s3, bucket, cid):
+    """[{segment, offset, length, steps}] del cid: los pendientes + su shard del índice global.
+
+    Los pendientes se leen antes que el shard: el compactador escribe el shard antes de
+    borrarlos, así que un segmento nunca queda afuera de las dos lecturas. Un segmento se
+    escribe después de creado el cid: se listan los pendientes desde el día anterior al del
+    ULID (margen para relojes corridos).
+    """
+    day = cid_day(cid)
+    since = None
+    if day != NO_DAY:
+        since = (datetime.strptime(day, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    out = [
+        {"segment": idx["segment"], **idx["cids"][cid]}
+        for _, idx in load_pending(s3, bucket, since)
+        if cid in idx["cids"]
+    ]
+    seen = {e["segment"] for e in out}
+    shard = codec.read(s3, bucket, cid_index_key(cid), {"cids": {}})
+    out += [e for e in shard["cids"].get(cid, []) if e["segment"] not in seen]
+    return out
+
+
+def read_trace(s3, bucket, cid, resolve=True):
+    """Vista cid -> pasos, igual a la de `/trace/:id`: [{key, data}] ordenado por key.
+
+    Junta los objetos sueltos del cid (un List sobre su prefijo, con o sin shard)
+    con lo que haya en segmentos; con `resolve` reemplaza los `$ref` por su contenido.
+    """
+    loose = keys.list_trace(s3, bucket, cid)
+    steps = dict(zip(loose, executor().map(lambda k: codec.read(s3, bucket, k), loose)))
+    for ent in segment_entries(s3, bucket, cid):
+        raw = _read(s3, bucket, ent["segment"], (ent["offset"], ent["offset"] + ent["length"] - 1))
+        for rec in decode_lines(raw):
+            steps[keys.trace_key(cid, rec["step"])] = rec["data"]
+    if resolve:
+        cache = {}
+
+        def load(key):
+            # un paso del mismo cid puede estar ya compactado: primero lo leído
+            if key in steps:
+                return steps[key]
+            if key not in cache:
+                cache[key] = codec.read(s3, bucket, key)
+            return cache[key]
+
+        steps = {k: codec.resolve(v, load) for k, v in steps.items()}
+    return [{"key": k, "data": steps[k]} for k in sorted(steps)]
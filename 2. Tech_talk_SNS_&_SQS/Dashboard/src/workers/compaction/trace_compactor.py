@@ -0,0 +1,250 @@
+# trace_compactor.py
+# Junta los árboles terminados traces/[{shard}/]{cid}/*.json en segmentos NDJSON particionados por hora,
+# con índice ordenado por cid y por paso, y mantiene el contador que arma `/metrics`.
+# También mantiene el índice global cid -> segmentos (traces/_index/cids/dt={día}/{shard}.json): suma los
+# segmentos que escribe y los de los workers (TRACE_SINK=segment) que esperan en traces/_index/pending/.
+import json, random, sys, time
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from utils.log import jlog, env
+from utils import codec, keys, runtime
+from utils.trace_store import (
+    SEGMENTS_PREFIX,
+    INDEX_SUFFIX,
+    COUNTERS_KEY,
+    CID_INDEX_PREFIX,
+    STEP_COUNTERS,
+    cid_index_key,
+    encode_segment,
+    is_flat_cid_index,
+    load_pending,
+)
+
+# un cid se considera terminado si no recibió pasos nuevos en este tiempo
+MIN_AGE_S = int(env("COMPACT_MIN_AGE_S", "300"))
+CHECKPOINT_KEY = env("COMPACT_CHECKPOINT_KEY", "traces/_index/compactor-checkpoint.json")
+# reintentos del PUT condicional de un shard del índice cuando otra corrida lo escribió antes
+FOLD_MAX_ATTEMPTS = int(env("COMPACT_FOLD_MAX_ATTEMPTS", "8"))
+# versión del índice global en el checkpoint: "by-day" = shards por día del cid
+CID_INDEX_LAYOUT = "by-day"
+
+s3 = runtime.client("s3")
+
+
+def _get_json(client, bucket, key, default):
+    try:
+        return json.loads(client.get_object(Bucket=bucket, Key=key)["Body"].read())
+    except client.exceptions.NoSuchKey:
+        return default
+
+
+def _put_json(client, bucket, key, obj):
+    client.put_object(Bucket=bucket, Key=key, Body=json.dumps(obj).encode("utf-8"))
+
+
+def _delete(client, bucket, keys):
+    for i in range(0, len(keys), 1000):
+        chunk = keys[i : i + 1000]
+        client.delete_objects(
+            Bucket=bucket, Delete={"Objects": [{"Key": k} for k in chunk], "Quiet": True}
+        )
+
+
+def _loose_trees(client, bucket):
+    """{cid: [(key, last_modified_ms)]} de los objetos sueltos (paginado, sin tope de 1000).
+
+    Con KEY_LAYOUT=hashed se listan los shards en paralelo; no se recorren los segmentos.
+    """
+    trees = {}
+    for o in keys.list_loose_traces(client, bucket):
+        parsed = keys.parse_trace_key(o["Key"])
+        if parsed is None:
+            continue
+        trees.setdefault(parsed[0], []).append((o["Key"], int(o["LastModified"].timestamp() * 1000)))
+    return trees
+
+
+def _legacy_indexes(client, bucket):
+    """Índices por segmento de antes del índice global (se juntan una sola vez)."""
+    return [
+        (k, codec.read(client, bucket, k))
+        for k in keys.list_keys(client, bucket, SEGMENTS_PREFIX, layout="flat")
+        if k.endswith(INDEX_SUFFIX)
+    ]
+
+
+def _flat_cid_indexes(client, bucket):
+    """Shards del índice global de antes de partirlo por día (traces/_index/cids/{shard}.json)."""
+    old = [k for k in keys.list_keys(client, bucket, CID_INDEX_PREFIX, layout="flat") if is_flat_cid_index(k)]
+    return [(k, codec.read(client, bucket, k, {"cids": {}})) for k in old]
+
+
+def _fold_shard(client, bucket, key, cids):
+    """GET + PUT condicional (If-Match con el ETag leído, If-None-Match si no existía).
+
+    Si otra corrida escribió el shard en el medio, se vuelve a leer y mergear. Devuelve los conflictos.
+    """
+    for attempt in range(FOLD_MAX_ATTEMPTS):
+        try:
+            obj = client.get_object(Bucket=bucket, Key=key)
+            doc, cond = json.loads(obj["Body"].read()), {"IfMatch": obj["ETag"]}
+        except client.exceptions.NoSuchKey:
+            doc, cond = {"cids": {}}, {"IfNoneMatch": "*"}
+        for cid, ents in cids.items():
+            cur = doc["cids"].setdefault(cid, [])
+            have = {e["segment"] for e in cur}
+            cur.extend(e for e in ents if e["segment"] not in have)
+        try:
+            client.put_object(Bucket=bucket, Key=key, Body=json.dumps(doc).encode("utf-8"), **cond)
+            return attempt
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in runtime.CONFLICT_CODES:
+                raise
+            time.sleep(random.uniform(0, 0.02 * 2**attempt))  # backoff con jitter
+    raise RuntimeError(f"índice {key}: {FOLD_MAX_ATTEMPTS} conflictos seguidos")
+
+
+def _fold_index(client, bucket, additions):
+    """Suma {cid: [entrada]} a los shards del índice global: un GET + PUT condicional por shard.
+
+    Idempotente: si la corrida se repite, las entradas del mismo segmento no se duplican.
+    Devuelve (shards tocados, conflictos).
+    """
+    runtime.require_conditional_put(client, "trace_compactor")
+    by_shard = {}
+    for cid, ents in additions.items():
+        by_shard.setdefault(cid_index_key(cid), {})[cid] = ents
+    conflicts = sum(_fold_shard(client, bucket, key, cids) for key, cids in sorted(by_shard.items()))
+    return len(by_shard), conflicts
+
+
+def _partition(ms):
+    d = datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+    return d.strftime("dt=%Y-%m-%d/hour=%H")
+
+
+def compact(client=None, bucket=None, now_ms=None, min_age_s=None):
+    client = client or s3
+    bucket = bucket or runtime.DATA_BUCKET
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    min_age_s = MIN_AGE_S if min_age_s is None else min_age_s
+
+    ckpt = _get_json(
+        client, bucket, CHECKPOINT_KEY, {"runs": 0, "counters": {}, "pending_delete": []}
+    )
+
+    # una corrida anterior que murió después de commitear: terminar sus borrados primero
+    if ckpt.get("pending_delete"):
+        _delete(client, bucket, ckpt["pending_delete"])
+        ckpt["pending_delete"] = []
+        _put_json(client, bucket, CHECKPOINT_KEY, ckpt)
+
+    cutoff = now_ms - min_age_s * 1000
+    trees = {
+        cid: objs
+        for cid, objs in _loose_trees(client, bucket).items()
+        if max(t for _, t in objs) <= cutoff
+    }
+    # segmentos de los workers que todavía no están en el índice global
+    pending = load_pending(client, bucket)
+    legacy = [] if ckpt.get("cid_index") else _legacy_indexes(client, bucket)
+    # shards sin día: se reparten una sola vez en los shards por día y se borran
+    flat = [] if ckpt.get("cid_index") == CID_INDEX_LAYOUT else _flat_cid_indexes(client, bucket)
+    if not trees and not pending and not legacy and not flat:
+        jlog(component="compactor", status="noop", runs=ckpt["runs"])
+        return {"cids": 0, "steps": 0, "segments": [], "indexed": 0}
+
+    # particiono por la hora del primer paso de cada cid
+    parts = {}
+    for cid in sorted(trees):
+        objs = sorted(trees[cid])
+        parts.setdefault(_partition(min(t for _, t in objs)), []).append((cid, objs))
+
+    run_id = f"{now_ms}-{ckpt['runs'] + 1:06d}"
+    counters = dict(ckpt.get("counters") or {})
+    segments, consumed, additions = [], [], {}
+    for part, cids in sorted(parts.items()):
+        entries, stages = [], {}
+        for cid, objs in cids:
+            for key, _ in objs:
+                step = keys.parse_trace_key(key)[1]
+                data = codec.read(client, bucket, key)
+                entries.append((cid, step, data))
+                stages.setdefault(step, []).append(cid)
+                if step in STEP_COUNTERS:
+                    counters[STEP_COUNTERS[step]] = counters.get(STEP_COUNTERS[step], 0) + 1
+                consumed.append(key)
+
+        body, index = encode_segment(entries)
+        seg_key = f"{SEGMENTS_PREFIX}{part}/compacted-{run_id}.ndjson"
+        client.put_object(Bucket=bucket, Key=seg_key, Body=body)
+        _put_json(
+            client,
+            bucket,
+            seg_key + INDEX_SUFFIX,
+            {
+                "segment": seg_key,
+                "component": "compactor",
+                "compacted": True,
+                "cids": {c: index[c] for c in sorted(index)},
+                "stages": {st: sorted(set(c)) for st, c in sorted(stages.items())},
+            },
+        )
+        segments.append(seg_key)
+        for cid, ent in index.items():
+            additions.setdefault(cid, []).append({"segment": seg_key, **ent})
+
+    # los pasos de los segmentos de los workers pasan al contador al entrar al índice
+    for _, idx in pending + legacy:
+        for cid, ent in idx["cids"].items():
+            additions.setdefault(cid, []).append({"segment": idx["segment"], **ent})
+            if idx.get("compacted"):
+                continue
+            for step in ent["steps"]:
+                if step in STEP_COUNTERS:
+                    counters[STEP_COUNTERS[step]] = counters.get(STEP_COUNTERS[step], 0) + 1
+    # lo migrado ya estaba contado
+    for _, doc in flat:
+        for cid, ents in doc["cids"].items():
+            additions.setdefault(cid, []).extend(ents)
+    # el índice antes que los borrados: un lector nunca se queda sin dónde buscar un cid
+    shards, conflicts = _fold_index(client, bucket, additions)
+
+    # commit: checkpoint con contadores + borrados pendientes, después el contador "público"
+    ckpt.update(
+        runs=ckpt["runs"] + 1,
+        counters=counters,
+        last_run=run_id,
+        cid_index=CID_INDEX_LAYOUT,
+        pending_delete=consumed + [k for k, _ in pending] + [k for k, _ in flat],
+    )
+    _put_json(client, bucket, CHECKPOINT_KEY, ckpt)
+    _put_json(client, bucket, COUNTERS_KEY, {"updatedAt": now_ms, "metricsByTrace": counters})
+
+    _delete(client, bucket, ckpt["pending_delete"])
+    ckpt["pending_delete"] = []
+    _put_json(client, bucket, CHECKPOINT_KEY, ckpt)
+
+    jlog(
+        component="compactor",
+        status="done",
+        run=run_id,
+        cids=len(trees),
+        steps=len(consumed),
+        segments=len(segments),
+        indexed=len(additions),
+        pending=len(pending),
+        index_shards=shards,
+        index_conflicts=conflicts,
+        migrated_shards=len(flat),
+    )
+    return {"cids": len(trees), "steps": len(consumed), "segments": segments, "indexed": len(additions)}
+
+
+def handler(event, context):
+    # programable con EventBridge (rate(5 minutes)) o a mano
+    return compact(min_age_s=(event or {}).get("minAgeS"))
+
+
+if __name__ == "__main__":
+    print(json.dumps(compact(min_age_s=int(sys.argv[1]) if len(sys.argv) > 1 else None)))
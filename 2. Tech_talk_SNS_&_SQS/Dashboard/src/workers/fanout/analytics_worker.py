@@ -1,79 +1,141 @@
-import json, os, boto3, time
-from utils.log import jlog, env
+import time
+from utils.log import jlog, jrecord, logged
+from utils import backpressure, metrics
+from utils.idempotency import Idempotency
+from utils.keys import analytics_key
+from utils.orders import decode_batch
+from utils.rollups import Rollup
+from utils.runtime import DATA_BUCKET, client
+from utils.s3_writer import BatchWriter
+from utils.trace_store import TraceSink
 
-AWS_ENDPOINT_URL = env("AWS_ENDPOINT_URL")
-DATA_BUCKET = env("DATA_BUCKET", "demo-data")
-s3 = (
-    boto3.client("s3", endpoint_url=AWS_ENDPOINT_URL)
-    if AWS_ENDPOINT_URL
-    else boto3.client("s3")
-)
+s3 = client("s3")
 
 
-def _write_json(key, obj):
-    s3.put_object(Bucket=DATA_BUCKET, Key=key, Body=json.dumps(obj).encode("utf-8"))
-    # helper común
-
+@logged("analytics")
+@metrics.measured("analytics")
+def handler(event, context):
+    recs = event.get("Records", [])
+    jlog(component="analytics", status="invoked", records=len(recs))
+    m = metrics.current()
+    # una pasada de validación: los mensajes rotos vuelven a la cola sin ninguna escritura a S3
+    decoded, poison = decode_batch(recs, "analytics", keep_message=False)
+    m.add("poison", len(poison))
+    failed_ids = list(poison)  # 👈 sólo estos vuelven a la cola (partial batch response)
+    deferred = []  # no intentados: S3 con el circuito abierto (utils.backpressure)
+    bp = backpressure.breaker("s3")
+    # ya procesados (redelivery): se acusan sin tocar S3
+    idem = Idempotency("analytics")
+    if bp.allow():
+        try:
+            idem.prefetch([r for r, _ in decoded], orders=[o for _, o in decoded])
+        except Exception as e:
+            # ni los HEAD de idempotencia responden: el batch vuelve a la cola sin intentar escrituras
+            jlog(component="analytics", status="prefetch-failed", error=str(e))
+            deferred, decoded = bp.defer("analytics", [o.message_id for _, o in decoded]), []
+    # totales por producto y hora: el dashboard lee O(buckets) objetos en vez de O(órdenes)
+    rollup = Rollup("analytics")
+    inflight = []  # (record, orderId, futures del record, (product, quantity, price, ts))
+    # los PutObject del batch salen en paralelo; el with espera a que terminen todos
+    # con TRACE_SINK=segment las trazas del batch salen en un único NDJSON al cerrar el sink
+    with BatchWriter(s3, DATA_BUCKET, component="analytics", raise_errors=False) as w, TraceSink(
+        w, "analytics"
+    ) as traces:
+        for i, (r, order) in enumerate(decoded):
+            if not bp.allow():
+                # S3 saturado: el resto del batch vuelve a la cola en vez de gastar llamadas condenadas
+                deferred = bp.defer("analytics", [o.message_id for _, o in decoded[i:]])
+                break
+            mid = order.message_id
+            t0 = time.perf_counter()
+            if idem.seen(r):
+                m.add("duplicates")
+                jrecord(component="analytics", status="duplicate", id=mid)
+                continue
+            try:
+                corr = order.correlation_id
+                order_id = order.order_id
 
-def should_fail(service_name: str, msg: dict) -> bool:
-    ff = msg.get("forceFail")
-    if not ff:
-        return False
-    if ff is True or ff == "all":
-        return True
-    if isinstance(ff, str):
-        return ff.lower() == service_name.lower()
-    if isinstance(ff, list):
-        return any(str(s).lower() == service_name.lower() for s in ff)
-    return False
+                # 👇 si queremos forzar DLQ en Analytics
+                if order.fails("analytics"):
+                    # opcional: escribir que fue recibido antes de fallar
+                    traces.put(corr, "11-analytics-received", {"forced": True})
+                    raise Exception("Forced fail (demo): analytics")
 
+                # 11: recibido
+                recv = traces.put(
+                    corr,
+                    "11-analytics-received",
+                    {
+                        "timestamp": int(time.time() * 1000),
+                        "receiveCount": 1,
+                        "orderId": order_id,
+                        "eventType": order.event_type,
+                    },
+                )
 
-def handler(event, context):
-    jlog(component="analytics", status="invoked", records=len(event.get("Records", [])))
-    for r in event["Records"]:
-        msg = json.loads(r["body"])
-        corr = msg.get("correlationId")
+                # generar registro de analytics
+                key = analytics_key(order.event_type or "Event", order_id)
+                art = w.put_json(
+                    key,
+                    {
+                        "orderId": order_id,
+                        "productId": order.product,
+                        "quantity": order.quantity,
+                        "price": order.price,
+                        "correlationId": corr,
+                    },
+                )
 
-        # 👇 si queremos forzar DLQ en Fulfillment
-        if should_fail("fulfillment", msg):
-            # opcional: escribir que fue recibido antes de fallar
-            _write_json(f"traces/{corr}/10-fulfillment-received.json", {"forced": True})
-            raise Exception("Forced fail (demo): fulfillment")
+                # 21: procesado (recién cuando el artefacto está en S3)
+                done = traces.put(
+                    corr,
+                    "21-analytics-processed",
+                    {"timestamp": int(time.time() * 1000), "s3key": key},
+                    after=art,
+                )
 
-        product = msg.get("product") or msg.get("productId") or "UNKNOWN"
-        quantity = int(msg.get("quantity", 1))
-        price = float(msg.get("price", 0))
-        order_id = msg.get("orderId")
+                m.observe_future("record_ms", done or art, t0)
+                inflight.append(
+                    (r, order_id, [f for f in (recv, art, done) if f is not None], (order.product, order.quantity, order.price, order.ts))
+                )
+            except Exception as e:
+                # el lote sigue; este id será reintentado
+                jlog(component="analytics", status="failed", id=mid, error=str(e))
+                failed_ids.append(mid)
 
-        # 11: recibido
-        _write_json(
-            f"traces/{corr}/11-analytics-received.json",
-            {
-                "timestamp": int(time.time() * 1000),
-                "receiveCount": 1,
-                "orderId": order_id,
-                "eventType": msg.get("eventType"),
-            },
-        )
+        # con TRACE_SINK=segment los pasos recién se escriben acá: antes no hay nada que revisar
+        traces.flush()
 
-        # generar registro de analytics
-        key = f"analytics/{msg.get('eventType','Event')}/{order_id}.json"
-        _write_json(
-            key,
-            {
-                "orderId": order_id,
-                "productId": product,
-                "quantity": quantity,
-                "price": price,
-                "correlationId": corr,
-            },
-        )
+        # errores de S3 que llegan async; sólo los records OK entran al rollup
+        ok = []
+        for r, order_id, futs, row in inflight:
+            mid = r.get("messageId") or r.get("messageID")
+            e = next((f.exception() for f in futs if f.exception() is not None), None)
+            if e is not None:
+                jlog(component="analytics", status="failed", id=mid, error=str(e))
+                failed_ids.append(mid)
+            else:
+                ok.append((r, order_id, futs[-1], rollup.add(*row)))
 
-        # 21: procesado
-        _write_json(
-            f"traces/{corr}/21-analytics-processed.json",
-            {"timestamp": int(time.time() * 1000), "s3key": key},
-        )
+        # un merge por bucket; el marcador de idempotencia va después, así un reintento vuelve a sumar
+        merged = rollup.flush(w)
+        for r, order_id, done, bucket in ok:
+            mid = r.get("messageId") or r.get("messageID")
+            fut = merged.get(bucket, done)
+            if fut.exception() is not None:
+                jlog(component="analytics", status="failed", id=mid, error=str(fut.exception()))
+                failed_ids.append(mid)
+                continue
+            idem.mark(w, r, after=fut)
+            m.add("records_ok")
+            jrecord(component="analytics", status="done", order=order_id)
 
-        jlog(component="analytics", status="done", order=order_id)
-    return {"ok": True}
+    m.add("records_failed", len(failed_ids))
+    m.add("records_deferred", len(deferred))
+    m.add("rollup_writes", rollup.writes)
+    m.add("rollup_conflicts", rollup.conflicts)
+    rollup.report()
+    idem.report()
+    bp.report("analytics")
+    return {"batchItemFailures": [{"itemIdentifier": i} for i in failed_ids + deferred]}
@@ -1,57 +1,131 @@
-import json, os, boto3, time
-from utils.log import jlog, env
-
-AWS_ENDPOINT_URL = env("AWS_ENDPOINT_URL")
-DATA_BUCKET = env("DATA_BUCKET", "demo-data")
-
-s3 = boto3.client("s3", endpoint_url=AWS_ENDPOINT_URL) if AWS_ENDPOINT_URL else boto3.client("s3")
-
-def _write_json(key, obj):
-    s3.put_object(Bucket=DATA_BUCKET, Key=key, Body=json.dumps(obj).encode("utf-8"))
-    
-    # helper común
-def should_fail(service_name: str, msg: dict) -> bool:
-    ff = msg.get("forceFail")
-    if not ff:
-        return False
-    if ff is True or ff == "all":
-        return True
-    if isinstance(ff, str):
-        return ff.lower() == service_name.lower()
-    if isinstance(ff, list):
-        return any(str(s).lower() == service_name.lower() for s in ff)
-    return False
+import time
+from utils.log import jlog, jrecord, logged
+from utils import backpressure, metrics
+from utils.idempotency import Idempotency
+from utils.ids import new_id
+from utils.inventory import Inventory
+from utils.keys import order_key
+from utils.orders import decode_batch
+from utils.runtime import DATA_BUCKET, client
+from utils.s3_writer import BatchWriter
+from utils.trace_store import TraceSink
 
+s3 = client("s3")
+
+
+@logged("fulfillment")
+@metrics.measured("fulfillment")
 def handler(event, context):
-    jlog(component="fulfillment", status="invoked", records=len(event.get("Records", [])))
-    for r in event["Records"]:
-        body = r["body"]
-        msg = json.loads(body)
-        
-        cid = msg.get("correlationId") or f"c-{int(time.time()*1000)}"
-
-        # 👇 si queremos forzar DLQ en Fulfillment
-        if should_fail("fulfillment", msg):
-            # opcional: escribir que fue recibido antes de fallar
-            _write_json(f"traces/{cid}/10-fulfillment-received.json", {"forced": True})
-            raise Exception("Forced fail (demo): fulfillment")
-
-        corr = msg.get("correlationId") or f"c-{int(time.time()*1000)}"
-        product = msg.get("product") or msg.get("productId") or "UNKNOWN"
-        quantity = int(msg.get("quantity", 1))
-        price = float(msg.get("price", 0))
-
-        # 10: recibido
-        _write_json(f"traces/{corr}/10-fulfillment-received.json",
-                    {"timestamp": int(time.time()*1000), "receiveCount": 1, "orderId": msg.get("orderId"), "eventType": msg.get("eventType")})
-
-        # simular procesamiento y “reserva de stock”
-        order_key = f"orders/{msg.get('orderId','no-id')}.json"
-        _write_json(order_key, {"orderId": msg.get("orderId"), "product": product, "quantity": quantity, "price": price, "correlationId": corr})
-
-        # 20: procesado
-        _write_json(f"traces/{corr}/20-fulfillment-processed.json",
-                    {"timestamp": int(time.time()*1000), "s3key": order_key})
-
-        jlog(component="fulfillment", status="done", order=msg.get("orderId"))
-    return {"ok": True}
+    recs = event.get("Records", [])
+    jlog(component="fulfillment", status="invoked", records=len(recs))
+    m = metrics.current()
+    # una pasada de validación: los mensajes rotos vuelven a la cola sin ninguna escritura a S3
+    decoded, poison = decode_batch(recs, "fulfillment", keep_message=False)
+    m.add("poison", len(poison))
+    failed_ids = list(poison)  # 👈 sólo estos vuelven a la cola (partial batch response)
+    deferred = []  # no intentados: S3 con el circuito abierto (utils.backpressure)
+    bp = backpressure.breaker("s3")
+    # ya procesados (redelivery): se acusan sin tocar S3
+    idem = Idempotency("fulfillment")
+    if bp.allow():
+        try:
+            idem.prefetch([r for r, _ in decoded], orders=[o for _, o in decoded])
+        except Exception as e:
+            # ni los HEAD de idempotencia responden: el batch vuelve a la cola sin intentar escrituras
+            jlog(component="fulfillment", status="prefetch-failed", error=str(e))
+            deferred, decoded = bp.defer("fulfillment", [o.message_id for _, o in decoded]), []
+    inventory = Inventory("fulfillment")
+    orders = []  # (record, Order, correlationId, orderId, future de "recibido", t0)
+    inflight = []  # (record, messageId, orderId, futures del record)
+    # los PutObject del batch salen en paralelo; el with espera a que terminen todos
+    # con TRACE_SINK=segment las trazas del batch salen en un único NDJSON al cerrar el sink
+    with BatchWriter(s3, DATA_BUCKET, component="fulfillment", raise_errors=False) as w, TraceSink(
+        w, "fulfillment"
+    ) as traces:
+        for i, (r, order) in enumerate(decoded):
+            if not bp.allow():
+                # S3 saturado: el resto del batch vuelve a la cola en vez de gastar llamadas condenadas
+                deferred = bp.defer("fulfillment", [o.message_id for _, o in decoded[i:]])
+                break
+            mid = order.message_id
+            t0 = time.perf_counter()
+            if idem.seen(r):
+                m.add("duplicates")
+                jrecord(component="fulfillment", status="duplicate", id=mid)
+                continue
+            corr = order.correlation_id or new_id("c-")
+
+            # 👇 si queremos forzar DLQ en Fulfillment
+            if order.fails("fulfillment"):
+                # opcional: escribir que fue recibido antes de fallar
+                traces.put(corr, "10-fulfillment-received", {"forced": True})
+                jlog(component="fulfillment", status="failed", id=mid, error="Forced fail (demo): fulfillment")
+                failed_ids.append(mid)
+                continue
+
+            # sin orderId, el messageId (estable entre redeliveries) identifica la reserva
+            order_id = order.order_id or mid
+
+            # 10: recibido
+            recv = traces.put(corr, "10-fulfillment-received",
+                              {"timestamp": int(time.time()*1000), "receiveCount": 1, "orderId": order.order_id, "eventType": order.event_type})
+            orders.append((r, order, corr, order_id, recv, t0))
+
+        # reserva de stock de todo el batch (una TransactWriteItems si alcanza el stock)
+        reservations = inventory.reserve([(o[3], o[1].lines) for o in orders])
+
+        for j, (r, order, corr, order_id, recv, t0) in enumerate(orders):
+            if not bp.allow():
+                # la reserva ya quedó hecha: en el redelivery el put condicional del ledger order#{id}
+                # no vuelve a descontar stock (sale "duplicate") y sólo se escriben los artefactos
+                deferred += bp.defer("fulfillment", [o[1].message_id for o in orders[j:]])
+                break
+            mid = order.message_id
+            res = reservations.get(order_id) or {"status": "error", "error": "sin resultado de reserva"}
+            if res["status"] == "error":
+                jlog(component="fulfillment", status="failed", id=mid, error=res["error"])
+                failed_ids.append(mid)
+                continue
+            if res["status"] == "insufficient":
+                # no se reintenta: la orden queda registrada como pendiente de stock
+                m.add("insufficient_stock")
+                jlog(component="fulfillment", status="insufficient-stock", order=order_id, short=res["short"])
+
+            s3key = order_key(order.order_id or "no-id")
+            art = w.put_json(s3key, {
+                "orderId": order.order_id, "product": order.product, "quantity": order.quantity, "price": order.price,
+                "correlationId": corr, "lines": order.lines,
+                "status": "backordered" if res["status"] == "insufficient" else "reserved",
+                **({"short": res["short"]} if res["status"] == "insufficient" else {}),
+            })
+
+            # 20: procesado (recién cuando el artefacto está en S3)
+            done = traces.put(corr, "20-fulfillment-processed",
+                              {"timestamp": int(time.time()*1000), "s3key": s3key, "reservation": res["status"]},
+                              after=art)
+
+            m.observe_future("record_ms", done or art, t0)
+            inflight.append((r, mid, order.order_id, [f for f in (recv, art, done) if f is not None]))
+
+        # con TRACE_SINK=segment los pasos recién se escriben acá: antes no hay nada que revisar
+        traces.flush()
+
+        # errores de S3 que llegan async; el marcador sólo si llegaron todas las escrituras del record
+        for r, mid, order_id, futs in inflight:
+            e = next((f.exception() for f in futs if f.exception() is not None), None)
+            if e is not None:
+                jlog(component="fulfillment", status="failed", id=mid, error=str(e))
+                failed_ids.append(mid)
+            else:
+                idem.mark(w, r)
+                m.add("records_ok")
+                jrecord(component="fulfillment", status="done", order=order_id)
+
+    m.add("records_failed", len(failed_ids))
+    m.add("records_deferred", len(deferred))
+    m.add("inventory_transactions", inventory.transactions)
+    m.add("inventory_conflicts", inventory.conflicts)
+    inventory.report()
+    idem.report()
+    bp.report("fulfillment")
+    return {"batchItemFailures": [{"itemIdentifier": i} for i in failed_ids + deferred]}
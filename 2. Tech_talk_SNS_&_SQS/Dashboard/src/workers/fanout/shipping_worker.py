@@ -1,95 +1,139 @@
 # shipping_worker.py
-import json, os, time
-import boto3
+import os, time
+from utils import backpressure, metrics
+from utils.idempotency import Idempotency
+from utils.ids import new_id
+from utils.keys import shipping_key
+from utils.log import jlog, jrecord, logged
+from utils.orders import decode_batch
+from utils.runtime import DATA_BUCKET, client
+from utils.s3_writer import BatchWriter
+from utils.trace_store import TraceSink
 
 APP = os.getenv("APP_NAME", "fanout")
-DATA_BUCKET = os.getenv("DATA_BUCKET", "demo-data")
-AWS_ENDPOINT_URL = os.getenv("AWS_ENDPOINT_URL")
 
-s3 = (
-    boto3.client("s3", endpoint_url=AWS_ENDPOINT_URL)
-    if AWS_ENDPOINT_URL
-    else boto3.client("s3")
-)
+s3 = client("s3")
 
 
-def _write_json(key: str, obj: dict):
-    s3.put_object(Bucket=DATA_BUCKET, Key=key, Body=json.dumps(obj).encode("utf-8"))
-
-
-def put_trace(correlation_id: str, step: str, payload: dict):
-    _write_json(
-        f"traces/{correlation_id}/{step}.json",
-        {"t": int(time.time() * 1000), **payload},
+def put_trace(traces: TraceSink, correlation_id: str, step: str, payload: dict, after=None):
+    return traces.put(
+        correlation_id, step, {"t": int(time.time() * 1000), **payload}, after=after
     )
 
 
-def should_fail(service_name: str, msg: dict) -> bool:
-    ff = msg.get("forceFail")
-    if not ff:
-        return False
-    if ff is True or ff == "all":
-        return True
-    if isinstance(ff, str):
-        return ff.lower() == service_name.lower()
-    if isinstance(ff, list):
-        return any(str(s).lower() == service_name.lower() for s in ff)
-    return False
-
-
+@logged("shipping")
+@metrics.measured("shipping")
 def handler(event, context):
+    recs = event.get("Records", [])
+    m = metrics.current()
     ok = 0
-    for rec in event.get("Records", []):
-        body = rec.get("body") or "{}"
-        try:
-            msg = json.loads(body) if isinstance(body, str) else body
-        except Exception:
-            msg = {"raw": body}
-
-        cid = msg.get("correlationId") or f"no-cid-{int(time.time()*1000)}"
-        order_id = msg.get("orderId", "unknown")
-
+    # una pasada de validación: los mensajes rotos vuelven a la cola sin ninguna escritura a S3
+    decoded, poison = decode_batch(recs, "shipping")
+    m.add("poison", len(poison))
+    failed_ids = list(poison)  # 👈 sólo estos vuelven a la cola (partial batch response)
+    deferred = []  # no intentados: S3 con el circuito abierto (utils.backpressure)
+    bp = backpressure.breaker("s3")
+    inflight = []  # (record, messageId, cid, body, futures del record)
+    # ya procesados (redelivery): se acusan sin tocar S3
+    idem = Idempotency("shipping")
+    if bp.allow():
         try:
-            # Forzar DLQ si vino pedido
-            if should_fail("shipping", msg):
-                put_trace(cid, "12-shipping-received", {"forced": True, "message": msg})
-                print(f"[shipping] forced fail for cid={cid}")
-                raise Exception("Forced fail (demo): shipping")
-
-            # Recibido
-            put_trace(
-                cid,
-                "12-shipping-received",
-                {
-                    "receiveCount": int(
-                        rec.get("attributes", {}).get("ApproximateReceiveCount", "1")
-                    ),
-                    "message": msg,
-                },
-            )
-
-            # “Procesamiento”
-            artifact = {
-                "orderId": order_id,
-                "correlationId": cid,
-                "carrier": "Acme Logistics",
-                "tracking": f"TRK-{int(time.time()*1000)}",
-                "status": "READY_TO_SHIP",
-            }
-            s3key = f"shipping/OrderShipped/{order_id}-{cid}.json"
-            _write_json(s3key, artifact)
-
-            # Done
-            put_trace(
-                cid, "22-shipping-processed", {"s3key": s3key, "artifact": artifact}
-            )
-            ok += 1
-
+            idem.prefetch([r for r, _ in decoded], orders=[o for _, o in decoded])
         except Exception as e:
-            # Dejá evidencia de error y rethrow para que SQS reintente → DLQ si corresponde
-            err = {"error": str(e), "body": body}
-            put_trace(cid, "98-shipping-error", err)
-            print(f"[shipping] ERROR cid={cid}: {e}")
-            raise
+            # ni los HEAD de idempotencia responden: el batch vuelve a la cola sin intentar escrituras
+            jlog(component="shipping", status="prefetch-failed", error=str(e))
+            deferred, decoded = bp.defer("shipping", [o.message_id for _, o in decoded]), []
+    # los PutObject del batch salen en paralelo; el with espera a que terminen todos
+    # con TRACE_SINK=segment las trazas del batch salen en un único NDJSON al cerrar el sink
+    with BatchWriter(s3, DATA_BUCKET, component="shipping", raise_errors=False) as w, TraceSink(
+        w, "shipping"
+    ) as traces:
+        for i, (rec, order) in enumerate(decoded):
+            if not bp.allow():
+                # S3 saturado: el resto del batch vuelve a la cola en vez de gastar llamadas condenadas
+                deferred = bp.defer("shipping", [o.message_id for _, o in decoded[i:]])
+                break
+            mid = order.message_id
+            t0 = time.perf_counter()
+            if idem.seen(rec):
+                m.add("duplicates")
+                jrecord(component="shipping", status="duplicate", id=mid)
+                continue
+            body = rec.get("body") or "{}"
+            msg = order.message
+
+            cid = order.correlation_id or new_id("no-cid-")
+            order_id = order.order_id or "unknown"
+
+            try:
+                # Forzar DLQ si vino pedido
+                if order.fails("shipping"):
+                    put_trace(traces, cid, "12-shipping-received", {"forced": True, "message": msg})
+                    raise Exception("Forced fail (demo): shipping")
+
+                # Recibido
+                recv = put_trace(
+                    traces,
+                    cid,
+                    "12-shipping-received",
+                    {
+                        "receiveCount": int(
+                            rec.get("attributes", {}).get("ApproximateReceiveCount", "1")
+                        ),
+                        "message": msg,
+                    },
+                )
+
+                # “Procesamiento”
+                artifact = {
+                    "orderId": order_id,
+                    "correlationId": cid,
+                    "carrier": "Acme Logistics",
+                    "tracking": new_id("TRK-"),
+                    "status": "READY_TO_SHIP",
+                }
+                s3key = shipping_key(order_id, cid)
+                art = w.put_json(s3key, artifact)
+
+                # Done (recién cuando el artefacto está en S3; con TRACE_PAYLOADS=ref no se repite)
+                done = put_trace(
+                    traces,
+                    cid,
+                    "22-shipping-processed",
+                    {"s3key": s3key, "artifact": traces.payload(artifact, s3key)},
+                    after=art,
+                )
+                m.observe_future("record_ms", done or art, t0)
+                inflight.append((rec, mid, cid, body, [f for f in (recv, art, done) if f is not None]))
+
+            except Exception as e:
+                # Dejá evidencia de error; sólo este record vuelve a la cola → DLQ si corresponde.
+                # El body va inline aun con TRACE_PAYLOADS=ref: el 12-shipping-received puede no existir
+                put_trace(traces, cid, "98-shipping-error", {"error": str(e), "body": body})
+                jlog(component="shipping", status="failed", id=mid, cid=cid, error=str(e))
+                failed_ids.append(mid)
+
+        # con TRACE_SINK=segment los pasos recién se escriben acá: antes no hay nada que revisar
+        traces.flush()
+
+        # errores de S3 que llegan async: misma evidencia, mismo tratamiento por record
+        # (las trazas 98 de acá salen en otro segmento, al cerrar el sink)
+        for rec, mid, cid, body, futs in inflight:
+            e = next((f.exception() for f in futs if f.exception() is not None), None)
+            if e is not None:
+                put_trace(traces, cid, "98-shipping-error", {"error": str(e), "body": body})
+                jlog(component="shipping", status="failed", id=mid, cid=cid, error=str(e))
+                failed_ids.append(mid)
+                continue
+            # el marcador sólo si llegaron todas las escrituras del record
+            idem.mark(w, rec)
+            jrecord(component="shipping", status="done", cid=cid)
+            ok += 1
 
-    return {"ok": ok, "count": len(event.get("Records", []))}
+    m.add("records_ok", ok)
+    m.add("records_failed", len(failed_ids))
+    m.add("records_deferred", len(deferred))
+    idem.report()
+    bp.report("shipping")
+    jlog(component="shipping", status="summary", ok=ok, failed=len(failed_ids), deferred=len(deferred), records=len(recs))
+    return {"batchItemFailures": [{"itemIdentifier": i} for i in failed_ids + deferred]}
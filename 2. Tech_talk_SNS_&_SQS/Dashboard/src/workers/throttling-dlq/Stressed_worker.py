@@ -1,9 +1,23 @@
 import json, os, random, time
-from utils.log import jlog, env  # tus helpers
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from utils import metrics
+from utils.log import jlog, jrecord, logged, env  # tus helpers
 
 FAIL = float(env("FAIL_RATIO", "0"))         # ej 0.30 => 30%
 SLEEP = int(env("SLEEP_MS", "0")) / 1000.0   # ej 2000 => 2s
 JITTER = int(env("JITTER_MS", "300")) / 1000.0  # jitter opcional
+CONCURRENCY = max(1, int(env("CONCURRENCY", "1")))  # records en paralelo por invocación
+DEADLINE_MARGIN = int(env("DEADLINE_MARGIN_MS", "500")) / 1000.0  # colchón antes del timeout
+
+_pool = None
+
+
+def _executor():
+    # se reutiliza entre invocaciones "warm"
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix="thr")
+    return _pool
 
 def _sleep():
     if SLEEP <= 0 and JITTER <= 0:
@@ -12,29 +26,70 @@ def _sleep():
     jit = random.random() * JITTER if JITTER > 0 else 0
     time.sleep(base + jit)
 
+def _can_start(context):
+    # sólo arrancamos un record si (en el peor caso) termina antes del timeout
+    remaining = getattr(context, "get_remaining_time_in_millis", None)
+    if remaining is None:
+        return True
+    return remaining() / 1000.0 > DEADLINE_MARGIN + SLEEP + JITTER
+
+def _process(r):
+    t0 = time.perf_counter()
+    _sleep()
+    body = r.get("body")
+    mid = r.get("messageId") or r.get("messageID")  # localstack sometimes
+    will_fail = random.random() < FAIL
+
+    if will_fail:
+        # lo “rechazamos”: el lote sigue, pero este id será reintentado
+        jrecord(component="thr", msg="FAIL", id=mid, body=body)
+        metrics.current().observe("record_ms", (time.perf_counter() - t0) * 1000)
+        return mid, False
+    # lo aceptamos
+    jrecord(component="thr", msg="OK", id=mid, body=body)
+    metrics.current().observe("record_ms", (time.perf_counter() - t0) * 1000)
+    return mid, True
+
+@logged("thr")
+@metrics.measured("thr")
 def handler(event, context):
     recs = event.get("Records", [])
-    jlog(component="thr", status="batch", size=len(recs), fail_ratio=FAIL)
+    jlog(component="thr", status="batch", size=len(recs), fail_ratio=FAIL, concurrency=CONCURRENCY)
 
     failed_ids = []   # 👈 acá listamos SOLO los que queremos reintentar
     ok = 0
+    deferred = 0
 
-    for r in recs:
-        _sleep()
-        body = r.get("body")
-        mid = r.get("messageId") or r.get("messageID")  # localstack sometimes
-        will_fail = random.random() < FAIL
+    # hasta CONCURRENCY records en vuelo; antes de arrancar cada uno miramos el deadline
+    pending = iter(recs)
+    inflight = set()
+    for r in pending:
+        if not _can_start(context):
+            # no llega: vuelve a la cola como batchItemFailure en vez de perderse en un timeout
+            rest = [r, *pending]
+            failed_ids.extend(x.get("messageId") or x.get("messageID") for x in rest)
+            deferred = len(rest)
+            break
+        inflight.add(_executor().submit(_process, r))
+        if len(inflight) >= CONCURRENCY:
+            done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+            for f in done:
+                mid, accepted = f.result()
+                ok += accepted
+                if not accepted:
+                    failed_ids.append(mid)
 
-        if will_fail:
-            # lo “rechazamos”: el lote sigue, pero este id será reintentado
+    for f in wait(inflight).done:
+        mid, accepted = f.result()
+        ok += accepted
+        if not accepted:
             failed_ids.append(mid)
-            jlog(component="thr", msg="FAIL", id=mid, body=body)
-        else:
-            # lo aceptamos
-            ok += 1
-            jlog(component="thr", msg="OK", id=mid, body=body)
 
     # Formato de retorno para Partial Batch Response
     resp = {"batchItemFailures": [{"itemIdentifier": i} for i in failed_ids]}
-    jlog(component="thr", status="done", ok=ok, failed=len(failed_ids))
+    m = metrics.current()
+    m.add("records_ok", ok)
+    m.add("records_failed", len(failed_ids) - deferred)
+    m.add("records_deferred", deferred)
+    jlog(component="thr", status="done", ok=ok, failed=len(failed_ids), deferred=deferred)
     return resp
@@ -0,0 +1,344 @@
+# bench.py
+# Benchmark in-process de todos los handlers contra S3/SQS/SNS/DynamoDB mockeados con moto.
+# Por handler y tamaño de batch mide records/seg, p50/p99 por invocación, pico de memoria y
+# llamadas AWS por record; compara contra benchmarks/baselines.json y sale con 1 si hay regresión.
+#
+#   python3 benchmarks/bench.py                     # corre y compara
+#   python3 benchmarks/bench.py --update            # corre y reescribe los baselines
+#   python3 benchmarks/bench.py --only fulfillment --sizes 10,100
+#
+# Cada handler corre en un proceso propio: el pico de memoria (y los tiempos) no dependen de qué
+# handlers corrieron antes en el mismo intérprete, así una corrida completa y una con --only miden igual.
+import argparse, contextlib, importlib.util, json, os, subprocess, sys, tempfile, time, tracemalloc, uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DASHBOARD_SRC = os.path.join(ROOT, "2. Tech_talk_SNS_&_SQS", "Dashboard", "src")
+SCENARIOS = os.path.join(ROOT, "1. Tech_talk_Lambdas", "Lambda-Demo", "scenarios")
+# lambda_common: en Lambda viene en el layer CommonLayer
+LAMBDA_LAYER = os.path.join(ROOT, "1. Tech_talk_Lambdas", "Lambda-Demo", "layers", "common")
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# entorno de los handlers: credenciales falsas, sin sleeps ni fallos forzados
+os.environ.update(
+    AWS_ACCESS_KEY_ID="bench",
+    AWS_SECRET_ACCESS_KEY="bench",
+    AWS_DEFAULT_REGION="us-east-1",
+    # botocore nuevo manda checksums "aws-chunked" que moto 4 no entiende
+    AWS_REQUEST_CHECKSUM_CALCULATION="when_required",
+    DATA_BUCKET="bench-data",
+    BUCKET_NAME="bench-events",
+    TABLE_NAME="bench-table",
+    INVENTORY_STORE="dynamodb",
+    INVENTORY_TABLE="bench-inventory",
+    ROLLUP_TABLE="bench-rollups",
+    region="us-east-1",
+    FAIL_RATIO="0",
+    SLEEP_MS="0",
+    JITTER_MS="0",
+    CONCURRENCY="5",
+)
+os.environ.pop("AWS_ENDPOINT_URL", None)
+
+from moto import mock_dynamodb, mock_s3, mock_sns, mock_sqs  # noqa: E402  (antes de crear clientes)
+import boto3  # noqa: E402
+import botocore.client  # noqa: E402
+
+sys.path.insert(0, DASHBOARD_SRC)
+sys.path.insert(0, LAMBDA_LAYER)
+
+# --- contador de llamadas AWS (todas pasan por BaseClient._make_api_call) ---
+_calls = {"n": 0}
+_orig_call = botocore.client.BaseClient._make_api_call
+
+
+def _counting_call(self, operation_name, api_params):
+    _calls["n"] += 1
+    return _orig_call(self, operation_name, api_params)
+
+
+botocore.client.BaseClient._make_api_call = _counting_call
+
+_devnull = open(os.devnull, "w")
+
+
+def _load(name, path, env=None):
+    """Importa un function.py / worker por ruta con nombre único (todos se llaman `function`)."""
+    old = {k: os.environ.get(k) for k in (env or {})}
+    os.environ.update(env or {})
+    try:
+        spec = importlib.util.spec_from_file_location(name, path)
+        mod = importlib.util.module_from_spec(spec)
+        with contextlib.redirect_stdout(_devnull):
+            spec.loader.exec_module(mod)
+        return mod
+    finally:
+        for k, v in old.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+# --- eventos sintéticos ---
+def _order(i, run):
+    return {
+        "orderId": f"o-{run}-{i}",
+        "correlationId": f"c-{run}-{i}",
+        "eventType": "OrderPlaced",
+        "priority": "high",
+        "product": "StartUp book",
+        "quantity": 1 + i % 3,
+        "price": 10,
+    }
+
+
+def sqs_event(n, run):
+    return {
+        "Records": [
+            {
+                "messageId": f"m-{run}-{i}",
+                "body": json.dumps(_order(i, run)),
+                "attributes": {"ApproximateReceiveCount": "1"},
+            }
+            for i in range(n)
+        ]
+    }
+
+
+def sns_via_sqs_event(n, run):
+    return {
+        "Records": [
+            {
+                "messageId": f"m-{run}-{i}",
+                "body": json.dumps(
+                    {"Subject": "bench", "Message": json.dumps({"content": f"mensaje {run}-{i}"})}
+                ),
+                "attributes": {"ApproximateReceiveCount": "1"},
+            }
+            for i in range(n)
+        ]
+    }
+
+
+def http_array_event(n, run):
+    return {"body": json.dumps([{"subject": "bench", "content": f"{run}-{i}", "n": i} for i in range(n)])}
+
+
+def http_payload_event(n, run):
+    # api_to_s3: un request con n items (~100 bytes c/u)
+    return {"body": json.dumps({"run": run, "items": [{"i": i, "pad": "x" * 80} for i in range(n)]})}
+
+
+# --- handlers: nombre -> (loader, evento) ---
+def _worker(rel):
+    return lambda: _load(
+        "bench_" + os.path.basename(rel)[:-3], os.path.join(DASHBOARD_SRC, "workers", rel)
+    ).handler
+
+
+def _lambda(scenario, fn, env=None):
+    return lambda: _load(
+        "_".join(["bench", fn, *sorted(v.lower() for v in (env or {}).values())]),
+        os.path.join(SCENARIOS, scenario, "functions", fn, "function.py"),
+        env,
+    ).lambda_handler
+
+
+HANDLERS = {
+    "fulfillment": (_worker("fanout/fulfillment_worker.py"), sqs_event),
+    "analytics": (_worker("fanout/analytics_worker.py"), sqs_event),
+    "shipping": (_worker("fanout/shipping_worker.py"), sqs_event),
+    "thr": (_worker("throttling-dlq/Stressed_worker.py"), sqs_event),
+    "lambda_to_dynamo": (_lambda("1-api-to-db", "lambda_to_dynamo"), http_array_event),
+    "api_to_s3": (_lambda("2-event-to-s3", "api_to_s3"), http_payload_event),
+    "api_to_s3_passthrough": (
+        _lambda("2-event-to-s3", "api_to_s3", {"UPLOAD_MODE": "passthrough", "VALIDATION": "light"}),
+        http_payload_event,
+    ),
+    "internal_publisher": (_lambda("3-internal-messaging-sns-sqs", "internal_publisher"), http_array_event),
+    "internal_subscriber": (_lambda("3-internal-messaging-sns-sqs", "internal_subscriber"), sns_via_sqs_event),
+}
+
+
+def _resources():
+    boto3.client("s3").create_bucket(Bucket=os.environ["DATA_BUCKET"])
+    boto3.client("s3").create_bucket(Bucket=os.environ["BUCKET_NAME"])
+    boto3.client("dynamodb").create_table(
+        TableName=os.environ["TABLE_NAME"],
+        KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    # stock de sobra: el bench mide el camino feliz de la reserva (una transacción por batch)
+    boto3.client("dynamodb").create_table(
+        TableName=os.environ["INVENTORY_TABLE"],
+        KeySchema=[{"AttributeName": "sku", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "sku", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    boto3.client("dynamodb").put_item(
+        TableName=os.environ["INVENTORY_TABLE"],
+        Item={"sku": {"S": "StartUp book"}, "available": {"N": str(10**9)}, "reserved": {"N": "0"}},
+    )
+    boto3.client("dynamodb").create_table(
+        TableName=os.environ["ROLLUP_TABLE"],
+        KeySchema=[{"AttributeName": "pk", "KeyType": "HASH"}, {"AttributeName": "sk", "KeyType": "RANGE"}],
+        AttributeDefinitions=[
+            {"AttributeName": "pk", "AttributeType": "S"},
+            {"AttributeName": "sk", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    os.environ["topicArn"] = boto3.client("sns").create_topic(Name="bench-topic")["TopicArn"]
+
+
+def _pct(vals, p):
+    s = sorted(vals)
+    return s[min(len(s) - 1, int(p / 100 * len(s)))]
+
+
+def measure(handler, make_event, size, iterations):
+    ctx = type("Context", (), {"function_name": "bench", "get_remaining_time_in_millis": lambda self: 60000})()
+    with contextlib.redirect_stdout(_devnull):
+        handler(make_event(size, "warm"), ctx)  # warm-up: clientes, pools, imports perezosos
+
+        lat, calls = [], 0
+        for _ in range(iterations):
+            event = make_event(size, uuid.uuid4().hex[:8])  # ids nuevos: la idempotencia no corta
+            before = _calls["n"]
+            t0 = time.perf_counter()
+            handler(event, ctx)
+            lat.append((time.perf_counter() - t0) * 1000)
+            calls += _calls["n"] - before
+
+        # memoria en una corrida aparte: tracemalloc distorsiona los tiempos
+        tracemalloc.start()
+        handler(make_event(size, uuid.uuid4().hex[:8]), ctx)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    total_s = sum(lat) / 1000
+    return {
+        "records_per_s": round(size * iterations / total_s, 1),
+        "p50_ms": round(_pct(lat, 50), 3),
+        "p99_ms": round(_pct(lat, 99), 3),
+        "peak_kb": round(peak / 1024, 1),
+        "aws_calls_per_record": round(calls / (size * iterations), 3),
+    }
+
+
+def compare(results, baselines, tol):
+    """Regresiones respecto del baseline. Las llamadas por record son deterministas: tolerancia 0.
+
+    En tiempos se exige superar la tolerancia relativa y además `min_delta_ms` absolutos,
+    para que el ruido de las invocaciones de 1-2 ms no dispare falsos positivos.
+    """
+    out = []
+    for name, sizes in results.items():
+        for size, cur in sizes.items():
+            base = baselines.get(name, {}).get(size)
+            if not base:
+                continue
+
+            def slower(cur_ms, base_ms):
+                return cur_ms > base_ms * (1 + tol["time"]) and cur_ms - base_ms > tol["min_delta_ms"]
+
+            # records/seg -> ms medios por invocación, para aplicar el mismo criterio
+            per_inv = lambda r: int(size) * 1000 / r["records_per_s"]
+            checks = [
+                ("records_per_s", slower(per_inv(cur), per_inv(base))),
+                ("p99_ms", slower(cur["p99_ms"], base["p99_ms"])),
+                ("peak_kb", cur["peak_kb"] > base["peak_kb"] * (1 + tol["memory"])),
+                ("aws_calls_per_record", cur["aws_calls_per_record"] > base["aws_calls_per_record"] + 1e-9),
+            ]
+            for metric, bad in checks:
+                if bad:
+                    out.append(f"{name}[{size}] {metric}: {base[metric]} -> {cur[metric]}")
+    return out
+
+
+def run_isolated(name, args):
+    """Corre un handler en un intérprete nuevo (--in-process) y devuelve sus resultados."""
+    fd, out = tempfile.mkstemp(prefix=f"bench-{name}-", suffix=".json")
+    os.close(fd)
+    try:
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--in-process", "--only", name, "--sizes", args.sizes,
+             "--iterations", str(args.iterations), "--output", out],
+            check=True,
+        )
+        with open(out) as f:
+            return json.load(f)[name]
+    finally:
+        os.remove(out)
+
+
+def run_in_process(names, sizes, iterations):
+    results = {}
+    with mock_s3(), mock_sqs(), mock_sns(), mock_dynamodb():
+        _resources()
+        for name in names:
+            loader, make_event = HANDLERS[name]
+            handler = loader()
+            results[name] = {}
+            for size in sizes:
+                r = measure(handler, make_event, size, iterations)
+                results[name][str(size)] = r
+                print(f"{name:24s} n={size:<5d} {r['records_per_s']:>10.1f} rec/s  p50={r['p50_ms']:.2f}ms  "
+                      f"p99={r['p99_ms']:.2f}ms  peak={r['peak_kb']:.0f}KB  calls/rec={r['aws_calls_per_record']}",
+                      flush=True)
+    return results
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark de handlers con moto")
+    p.add_argument("--only", help="handlers separados por coma")
+    p.add_argument("--sizes", default="1,10,100")
+    p.add_argument("--iterations", type=int, default=5)
+    p.add_argument("--update", action="store_true", help="reescribe baselines.json con esta corrida")
+    p.add_argument("--baselines", default=BASELINES)
+    p.add_argument("--time-tolerance", type=float, default=float(os.getenv("BENCH_TIME_TOLERANCE", "0.5")))
+    p.add_argument("--memory-tolerance", type=float, default=float(os.getenv("BENCH_MEMORY_TOLERANCE", "0.25")))
+    p.add_argument("--min-delta-ms", type=float, default=float(os.getenv("BENCH_MIN_DELTA_MS", "5")))
+    p.add_argument("--output", help="además, escribir los resultados en este JSON")
+    p.add_argument("--in-process", action="store_true",
+                   help="todos los handlers en este proceso, sin comparar (lo usa cada proceso hijo)")
+    args = p.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(HANDLERS)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    if args.in_process:
+        results = run_in_process(names, sizes, args.iterations)
+    else:
+        results = {name: run_isolated(name, args) for name in names}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.in_process:
+        return 0
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+
+    if args.update:
+        for name, sizes_ in results.items():
+            baselines.setdefault(name, {}).update(sizes_)
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baselines actualizados: {args.baselines}")
+        return 0
+
+    regressions = compare(results, baselines, {"time": args.time_tolerance, "memory": args.memory_tolerance, "min_delta_ms": args.min_delta_ms})
+    for r in regressions:
+        print(f"REGRESIÓN {r}")
+    if not regressions:
+        print("sin regresiones")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())